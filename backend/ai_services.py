@@ -1,34 +1,99 @@
+import asyncio
 import os
-from typing import Dict, Optional, List
-import openai
-import google.generativeai as genai
-import requests
+import time
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, List
 import logging
-from google.oauth2.credentials import Credentials
+from .fanout import fan_out
+from .feedback_store import FeedbackStore
+from .metrics import MetricsRegistry
+from .provider_io import get_http_client
+from .sessions import CHAT_SESSION_TTL, CHAT_SESSIONS_MAX
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 logger = logging.getLogger(__name__)
 
-class AIServices:
+class GeminiChat:
+    """One user's live Gemini chat and how much of their history it holds.
+
+    The chat has been given the first `synced` history entries, the last of
+    which had id `last_id`, and then sent `sent` turns of its own that the
+    caller's history is expected to hold next.
+    """
+
+    __slots__ = ("chat", "synced", "last_id", "sent", "lock", "last_used")
+
     def __init__(self):
+        self.chat: Any = None
+        self.synced = 0
+        self.last_id: Optional[int] = None
+        self.sent = 0
+        # One message at a time goes through a chat
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+class GeminiChats:
+    """Live Gemini chats per user, evicted by LRU and idle TTL"""
+
+    def __init__(self, max_chats: int = CHAT_SESSIONS_MAX, ttl: float = CHAT_SESSION_TTL):
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self._chats: "OrderedDict[Optional[str], GeminiChat]" = OrderedDict()
+
+    def get(self, user_id: Optional[str]) -> GeminiChat:
+        """The user's chat entry, created empty if they have none"""
+        now = time.monotonic()
+        while self._chats:
+            key, chat = next(iter(self._chats.items()))
+            if now - chat.last_used < self.ttl:
+                break
+            del self._chats[key]
+        chat = self._chats.get(user_id)
+        if chat is None:
+            chat = self._chats[user_id] = GeminiChat()
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(user_id)
+        chat.last_used = now
+        return chat
+
+    def clear(self):
+        self._chats.clear()
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+class AIServices:
+    def __init__(self, metrics: Optional[MetricsRegistry] = None, feedback_store: Optional[FeedbackStore] = None):
+        self.metrics = metrics  # Provider call metrics, when shared with the app
+        self.feedback_store = feedback_store  # Persistent feedback; in memory when unset
         self.openai_client = None
         self.gemini_model = None
-        self.gemini_chat = None
+        self.gemini_chats = GeminiChats()
         self.grok_api_key = None
         self.feedback_db = {}  # Simple in-memory storage for feedback
+        self.feedback_counts = Counter()  # Running feedback tallies by value
         self.cost_tracker = {}  # Track API costs
+        self.total_calls = 0
+        self.total_cost = 0.0
         self.ab_testing = True  # Enable A/B testing
 
     def setup_openai(self, api_key: str):
         """Setup OpenAI client with API key"""
-        openai.api_key = api_key
+        # Provider SDKs are imported on first use to keep them off worker start-up
+        import openai
+        self.openai_client = openai.AsyncOpenAI(api_key=api_key)
 
-    def setup_gemini_with_credentials(self, credentials: Credentials):
+    def setup_gemini_with_credentials(self, credentials: "Credentials"):
         """Setup Gemini with OAuth credentials"""
         try:
+            import google.generativeai as genai
             genai.configure(credentials=credentials)
             self.gemini_model = genai.GenerativeModel('gemini-pro')
-            # Initialize a new chat
-            self.gemini_chat = self.gemini_model.start_chat(history=[])
+            # Chats started with the previous credentials are not reused
+            self.gemini_chats.clear()
             return True
         except Exception as e:
             logger.error(f"Error setting up Gemini: {e}")
@@ -42,7 +107,8 @@ class AIServices:
         """Format conversation history for Gemini"""
         formatted_history = []
         for entry in history:
-            role = "user" if entry["type"] == "user" else "assistant"
+            # Gemini names the assistant's side of the chat "model"
+            role = "user" if entry["type"] == "user" else "model"
             formatted_history.append({
                 "role": role,
                 "parts": [entry["message"]]
@@ -52,7 +118,9 @@ class AIServices:
     async def get_chatgpt_response(self, message: str) -> str:
         """Get response from ChatGPT"""
         try:
-            response = await openai.ChatCompletion.acreate(
+            if not self.openai_client:
+                return "OpenAI is not configured. Please set an API key first."
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": message}]
             )
@@ -60,18 +128,48 @@ class AIServices:
         except Exception as e:
             return f"Error with ChatGPT: {str(e)}"
 
-    async def get_gemini_response(self, message: str, history: Optional[List[Dict]] = None) -> str:
+    def _follows(self, entry: GeminiChat, history: List[Dict]) -> bool:
+        """Whether history extends what the live chat holds, judged by length and the last id it saw"""
+        if entry.chat is None or len(history) < entry.synced + entry.sent:
+            return False
+        return entry.synced == 0 or history[entry.synced - 1].get("id") == entry.last_id
+
+    async def get_gemini_response(self, message: str, history: Optional[List[Dict]] = None, user_id: Optional[str] = None) -> str:
         """Get response from Gemini with conversation history"""
         try:
             if not self.gemini_model:
                 return "Gemini is not configured. Please authenticate first."
 
-            # Create a new chat for each request with the provided history
-            formatted_history = self.format_history_for_gemini(history) if history else []
-            chat = self.gemini_model.start_chat(history=formatted_history)
-            
-            # Send the message and get response
-            response = await chat.send_message_async(message)
+            history = history or []
+            if user_id is None:
+                # Nothing to tell callers apart by, so no chat is kept
+                chat = self.gemini_model.start_chat(history=self.format_history_for_gemini(history))
+                response = await chat.send_message_async(message)
+                return response.text
+
+            # Keep the user's live chat while the history extends what it
+            # holds, so only the new entries and message go through it;
+            # otherwise start afresh
+            entry = self.gemini_chats.get(user_id)
+            async with entry.lock:
+                if self._follows(entry, history):
+                    new = history[entry.synced + entry.sent:]
+                    if new:
+                        from google.generativeai.types import content_types
+                        entry.chat.history.extend(content_types.to_contents(self.format_history_for_gemini(new)))
+                else:
+                    entry.chat = self.gemini_model.start_chat(history=self.format_history_for_gemini(history))
+                entry.synced = len(history)
+                entry.last_id = history[-1].get("id") if history else None
+                entry.sent = 0
+                try:
+                    response = await entry.chat.send_message_async(message)
+                except Exception:
+                    # The chat may hold the message without a reply
+                    entry.chat = None
+                    raise
+                # The message and its reply
+                entry.sent = 2
             return response.text
         except Exception as e:
             logger.error(f"Error getting Gemini response: {e}")
@@ -83,7 +181,7 @@ class AIServices:
             if not self.grok_api_key:
                 return "Grok API key not set"
             # Note: Replace with actual Grok API endpoint when available
-            response = requests.post(
+            response = await get_http_client().post(
                 "https://api.grok.ai/v1/chat",
                 headers={"Authorization": f"Bearer {self.grok_api_key}"},
                 json={"message": message}
@@ -92,16 +190,17 @@ class AIServices:
         except Exception as e:
             return f"Error with Grok: {str(e)}"
 
-    async def get_all_responses(self, message: str) -> Dict[str, str]:
+    async def get_all_responses(self, message: str, timeouts: Optional[Dict[str, float]] = None, user_id: Optional[str] = None) -> Dict[str, Dict]:
         """Get responses from all AI services"""
-        responses = {}
-        
-        # Get responses in parallel
-        responses["chatgpt"] = await self.get_chatgpt_response(message)
-        responses["gemini"] = await self.get_gemini_response(message)
-        responses["grok"] = await self.get_grok_response(message)
-        
-        return responses
+        # Get responses in parallel, each service under its own deadline
+        return await fan_out(
+            {
+                "chatgpt": lambda: self.get_chatgpt_response(message),
+                "gemini": lambda: self.get_gemini_response(message, user_id=user_id),
+                "grok": lambda: self.get_grok_response(message)
+            },
+            timeouts=timeouts
+        )
 
     async def get_response(self, message: str, service: str) -> str:
         # Track API call
@@ -116,7 +215,7 @@ class AIServices:
             
         return response
     
-    def _track_api_call(self, service: str):
+    def _track_api_call(self, service: str, cost: float = 0.0):
         """Track API calls and costs"""
         if service not in self.cost_tracker:
             self.cost_tracker[service] = {
@@ -124,7 +223,9 @@ class AIServices:
                 'total_cost': 0.0
             }
         self.cost_tracker[service]['calls'] += 1
-        # Add actual cost calculation based on service pricing
+        self.cost_tracker[service]['total_cost'] += cost
+        self.total_calls += 1
+        self.total_cost += cost
         
     def _apply_ab_testing(self, response: str) -> str:
         """Apply A/B testing variations to response"""
@@ -133,22 +234,38 @@ class AIServices:
             return response.upper()  # Variation A
         return response.lower()  # Variation B
         
-    def record_feedback(self, message_id: str, service: str, feedback: str):
+    def record_feedback(self, message_id: str, service: str, feedback: str, model: Optional[str] = None):
         """Record user feedback for a response"""
+        if self.feedback_store is not None:
+            self.feedback_store.record(message_id, service, feedback, model)
+            return
         if message_id not in self.feedback_db:
             self.feedback_db[message_id] = {}
+        previous = self.feedback_db[message_id].get(service)
+        if previous is not None:
+            self.feedback_counts[previous] -= 1
         self.feedback_db[message_id][service] = feedback
+        self.feedback_counts[feedback] += 1
         
-    def get_performance_metrics(self) -> dict:
-        """Get performance metrics for all services"""
+    def get_performance_metrics(self, provider_metrics: Optional[MetricsRegistry] = None) -> dict:
+        """Get performance metrics for all services from running totals.
+
+        provider_metrics overrides the registry given at construction, e.g.
+        with the merged metrics of every worker process.
+        """
+        provider_metrics = provider_metrics or self.metrics
+        total_calls = self.total_calls
+        total_cost = self.total_cost
+        if provider_metrics is not None:
+            total_calls += provider_metrics.total_requests
+            total_cost += provider_metrics.total_cost
+        feedback_counts = self.feedback_store.summary() if self.feedback_store is not None else self.feedback_counts
         metrics = {
-            'total_calls': sum(service['calls'] for service in self.cost_tracker.values()),
-            'total_cost': sum(service['total_cost'] for service in self.cost_tracker.values()),
+            'total_calls': total_calls,
+            'total_cost': round(total_cost, 6),
             'feedback_summary': {
-                'positive': sum(1 for feedbacks in self.feedback_db.values() 
-                              for feedback in feedbacks.values() if feedback == 'positive'),
-                'negative': sum(1 for feedbacks in self.feedback_db.values() 
-                              for feedback in feedbacks.values() if feedback == 'negative')
+                'positive': feedback_counts.get('positive', 0),
+                'negative': feedback_counts.get('negative', 0)
             }
         }
         return metrics 
\ No newline at end of file
@@ -1,11 +1,9 @@
 from fastapi import HTTPException, status
-import os
 import logging
 from dotenv import load_dotenv
-import json
-from pathlib import Path
 from pydantic import BaseModel
 from typing import Optional, Dict
+from .shared_state import SharedState, WriteBehind
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -21,33 +19,37 @@ class ServiceCredentials(BaseModel):
     api_key: str
     is_valid: bool = False
 
-# Data storage
+# Data storage; credentials live in the shared state database so every worker
+# process sees the same keys. The JSON file is only read once, to import it
 SERVICE_CREDENTIALS_FILE = "data/service_credentials.json"
+CREDENTIALS_NAMESPACE = "service_credentials"
 
-def load_data(file_path: str) -> dict:
-    """Load data from JSON file"""
-    logger.debug(f"Loading data from {file_path}")
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            data = json.load(f)
-            logger.debug(f"Data loaded successfully from {file_path}")
-            return data
-    logger.debug(f"No existing data found at {file_path}, returning empty dict")
-    return {}
+class Auth:
+    """Service credentials served from memory.
 
-def save_data(file_path: str, data: dict):
-    """Save data to JSON file"""
-    logger.debug(f"Saving data to {file_path}")
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "w") as f:
-        json.dump(data, f)
-    logger.debug(f"Data saved successfully to {file_path}")
+    The cache is reloaded only when another connection has committed to the
+    shared state (a cheap PRAGMA check), and saves are written behind, so
+    lookups on the request path neither read nor rewrite stored credentials.
+    """
 
-class Auth:
-    def __init__(self):
+    def __init__(self, state: Optional[SharedState] = None):
         logger.info("Initializing Auth service")
-        self.service_credentials = load_data(SERVICE_CREDENTIALS_FILE)
-        logger.debug(f"Loaded credentials for {len(self.service_credentials)} services")
+        self.state = state or SharedState()
+        self.state.import_json(CREDENTIALS_NAMESPACE, SERVICE_CREDENTIALS_FILE)
+        self._writes = WriteBehind(self.state, CREDENTIALS_NAMESPACE)
+        self._cache: Dict = {}
+        self._version: Optional[int] = None
+        logger.debug(f"Loaded credentials for {len(self.get_all_credentials())} services")
+
+    def _credentials(self) -> Dict:
+        """Cached credentials, reloaded if another worker has changed the shared state"""
+        version = self.state.version()
+        if version != self._version:
+            self._cache = self.state.items(CREDENTIALS_NAMESPACE)
+            # Our own unflushed saves are newer than what is on disk
+            self._cache.update(self._writes.pending())
+            self._version = version
+        return self._cache
 
     def save_service_credentials(self, service: str, api_key: str):
         """Save API key for a service"""
@@ -59,18 +61,23 @@ class Auth:
                 detail=f"Invalid service: {service}"
             )
 
-        self.service_credentials[service] = {
+        credentials = {
             "api_key": api_key,
             "is_valid": False  # Will be validated when used
         }
-        save_data(SERVICE_CREDENTIALS_FILE, self.service_credentials)
+        self._credentials()[service] = credentials
+        self._writes.set(service, credentials)
         logger.debug(f"{service} API key saved successfully")
 
     def get_service_credentials(self, service: str) -> Optional[Dict]:
         """Get API key for a service"""
         logger.debug(f"Retrieving {service} API key")
-        return self.service_credentials.get(service)
+        return self._credentials().get(service)
 
     def get_all_credentials(self) -> Dict:
         """Get all service credentials"""
-        return self.service_credentials 
\ No newline at end of file
+        return dict(self._credentials())
+
+    async def close(self):
+        """Write any buffered saves"""
+        await self._writes.close()
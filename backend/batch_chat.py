@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Dict, List, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ["gemini", "openai", "grok"]
+DEFAULT_MODELS = {"gemini": "gemini-pro", "openai": "gpt-3.5-turbo", "grok": "grok-1"}
+# Prompts sent per /api/chat/batch request; an interruption loses at most one chunk in flight
+CHUNK_SIZE = 200
+# Result statuses that need no retry: answered, or skipped for want of a key
+DONE_STATUSES = ("ok", "skipped")
+
+def load_prompts(path: str) -> List[Dict]:
+    """Read prompts from JSONL; a prompt without an "id" is numbered by its line"""
+    prompts = []
+    with open(path, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            prompt = json.loads(line)
+            prompt["id"] = str(prompt.get("id", number))
+            prompts.append(prompt)
+    return prompts
+
+def completed(output_path: str) -> Set[Tuple[str, str]]:
+    """(prompt id, provider) pairs already answered, or skipped, in an earlier run's output"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted run
+                continue
+            if result.get("status") in DONE_STATUSES:
+                done.add((result["id"], result["provider"]))
+    return done
+
+def remaining(prompts: List[Dict], providers: List[str], done: Set[Tuple[str, str]]) -> List[Dict]:
+    """The prompts still to run, each limited to the providers it still needs"""
+    pending = []
+    for prompt in prompts:
+        wanted = [p for p in prompt.get("providers") or providers if (prompt["id"], p) not in done]
+        if wanted:
+            pending.append(dict(prompt, providers=wanted))
+    return pending
+
+async def run(
+    client: httpx.AsyncClient,
+    prompts: List[Dict],
+    output_path: str,
+    service_keys: Dict,
+    providers: List[str] = PROVIDERS,
+    chunk_size: int = CHUNK_SIZE,
+    concurrency: int = None
+) -> Dict:
+    """Send the prompts not yet answered in output_path and append their results to it"""
+    pending = remaining(prompts, providers, completed(output_path))
+    counts = {"prompts": len(prompts), "pending": len(pending), "ok": 0, "skipped": 0, "failed": 0}
+    with open(output_path, "a") as out:
+        for start in range(0, len(pending), chunk_size):
+            body = {"service_keys": service_keys, "prompts": pending[start:start + chunk_size]}
+            if concurrency:
+                body["concurrency"] = concurrency
+            async with client.stream("POST", "/api/chat/batch", json=body, timeout=None) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    # Every line is flushed, so the output doubles as the checkpoint
+                    out.write(line + "\n")
+                    out.flush()
+                    status = json.loads(line)["status"]
+                    counts[status if status in DONE_STATUSES else "failed"] += 1
+    return counts
+
+def service_keys_from(args) -> Dict:
+    keys = {"user_id": "batch", "models": dict(DEFAULT_MODELS)}
+    if args.keys:
+        with open(args.keys, "r") as f:
+            keys.update(json.load(f))
+    for provider in PROVIDERS:
+        keys.setdefault(provider, os.getenv(f"{provider.upper()}_API_KEY"))
+    for spec in args.model:
+        provider, _, model = spec.partition("=")
+        keys["models"][provider] = model
+    return keys
+
+def main():
+    """Run a JSONL file of prompts through /api/chat/batch, resuming from earlier output"""
+    parser = argparse.ArgumentParser(description="Send a JSONL file of prompts to every provider")
+    parser.add_argument("prompts", help='JSONL file, one {"message", optional "id", "history", "providers"} per line')
+    parser.add_argument("--output", required=True, help="JSONL results; re-running skips prompts already answered")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--keys", help='JSON file with "gemini", "openai", "grok" keys (default: *_API_KEY env vars)')
+    parser.add_argument("--model", action="append", default=[], metavar="PROVIDER=MODEL")
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=PROVIDERS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--concurrency", type=int, help="Concurrent calls per provider")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    prompts = load_prompts(args.prompts)
+
+    async def go():
+        async with httpx.AsyncClient(base_url=args.url) as client:
+            return await run(client, prompts, args.output, service_keys_from(args), args.providers, args.chunk_size, args.concurrency)
+
+    counts = asyncio.run(go())
+    print(f"{counts['pending']} of {counts['prompts']} prompts run: {counts['ok']} answers, {counts['skipped']} skipped without a key, {counts['failed']} failures", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
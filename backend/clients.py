@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+import httpx
+
+from .provider_io import get_http_client
+
+logger = logging.getLogger(__name__)
+
+# Registry bounds: how many clients to keep and how long an unused one lives
+MAX_CLIENTS = int(os.getenv("PROVIDER_CLIENT_CACHE_SIZE", "256"))
+CLIENT_IDLE_TIMEOUT = float(os.getenv("PROVIDER_CLIENT_IDLE_TIMEOUT", "900"))
+
+ClientKey = Tuple[str, str, str]
+
+class _Entry:
+    __slots__ = ("client", "loop", "last_used")
+
+    def __init__(self, client: Any, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.loop = loop
+        self.last_used = time.monotonic()
+
+class ClientRegistry:
+    """Cache of provider clients keyed by (provider, api_key, model).
+
+    Clients are reused across requests so their connection pools stay warm,
+    and each one carries its own key so concurrent users never share
+    configuration. The least recently used client is evicted once the
+    registry is full, and clients idle for longer than the timeout are
+    dropped on the next lookup.
+    """
+
+    def __init__(self, max_size: int = MAX_CLIENTS, idle_timeout: float = CLIENT_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._entries: "OrderedDict[ClientKey, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, provider: str, api_key: str, model: str, factory: Callable[[str, str], Any]) -> Any:
+        """Get the cached client for a key, building it with factory(api_key, model) on a miss"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        key = (provider, api_key, model)
+        entry = self._entries.get(key)
+        # Clients hold connections bound to the loop they were created on
+        if entry is not None and entry.loop is loop:
+            self.hits += 1
+            entry.last_used = now
+            self._entries.move_to_end(key)
+            return entry.client
+
+        self.misses += 1
+        if entry is not None:
+            self._discard(key)
+        logger.debug(f"Creating {provider} client for model {model}")
+        entry = _Entry(factory(api_key, model), loop)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_size:
+            self._discard(next(iter(self._entries)))
+        return entry.client
+
+    def _evict_idle(self, now: float):
+        """Drop clients idle past the timeout; entries are kept in last-used order"""
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_timeout:
+                break
+            self._discard(key)
+
+    def _discard(self, key: ClientKey):
+        entry = self._entries.pop(key)
+        self.evictions += 1
+        close = getattr(entry.client, "close", None)
+        if close is not None and asyncio.iscoroutinefunction(close) and not entry.loop.is_closed():
+            entry.loop.create_task(close())
+
+    async def aclose(self):
+        """Close and forget every cached client"""
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            close = getattr(entry.client, "close", None)
+            if close is not None and asyncio.iscoroutinefunction(close) and not entry.loop.is_closed():
+                await close()
+
+    def stats(self) -> Dict:
+        """Get cache size and hit/miss/eviction counters"""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+async def _iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield the data payloads of a Server-Sent Events response"""
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            yield line[5:].strip()
+
+class GeminiClient:
+    """Gemini REST client bound to a single API key and model.
+
+    Talks to the generateContent endpoint over the shared connection pool
+    instead of the SDK, whose genai.configure() mutates process-wide state.
+    """
+
+    def __init__(self, api_key: str, model: str, base_url: str):
+        self.model = model
+        self.url = f"{base_url}/models/{model}:generateContent"
+        self.stream_url = f"{base_url}/models/{model}:streamGenerateContent"
+        self.headers = {"x-goog-api-key": api_key, "Content-Type": "application/json"}
+
+    @staticmethod
+    def _payload(prompt: str) -> Dict:
+        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+
+    @staticmethod
+    def _text(data: Dict) -> str:
+        candidates = data.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    async def generate(self, prompt: str) -> str:
+        response = await get_http_client().post(self.url, headers=self.headers, json=self._payload(prompt))
+        response.raise_for_status()
+        return self._text(response.json())
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield response text chunks as Gemini produces them"""
+        async with get_http_client().stream(
+            "POST",
+            self.stream_url,
+            params={"alt": "sse"},
+            headers=self.headers,
+            json=self._payload(prompt)
+        ) as response:
+            response.raise_for_status()
+            async for data in _iter_sse_data(response):
+                text = self._text(json.loads(data))
+                if text:
+                    yield text
+
+class GrokClient:
+    """OpenAI-compatible Grok client bound to a single API key and model"""
+
+    def __init__(self, api_key: str, model: str, base_url: str):
+        self.model = model
+        self.url = f"{base_url}/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+    async def complete(self, messages: List[Dict]) -> str:
+        response = await get_http_client().post(
+            self.url,
+            headers=self.headers,
+            json={"messages": messages, "model": self.model}
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        """Yield response text chunks as Grok produces them"""
+        async with get_http_client().stream(
+            "POST",
+            self.url,
+            headers=self.headers,
+            json={"messages": messages, "model": self.model, "stream": True}
+        ) as response:
+            response.raise_for_status()
+            async for data in _iter_sse_data(response):
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                text = choices[0].get("delta", {}).get("content")
+                if text:
+                    yield text
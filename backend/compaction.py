@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .context_builder import count_tokens
+from .history_store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+# A user is compacted once more than COMPACT_THRESHOLD entries follow their
+# summary; the newest COMPACT_KEEP_RECENT entries always stay raw
+COMPACT_THRESHOLD = int(os.getenv("COMPACT_THRESHOLD", "40"))
+COMPACT_KEEP_RECENT = int(os.getenv("COMPACT_KEEP_RECENT", "20"))
+# Most entries folded into a summary per pass, so long backlogs are worked off gradually
+COMPACT_BATCH = int(os.getenv("COMPACT_BATCH", "100"))
+# Seconds between compaction passes
+COMPACT_INTERVAL = float(os.getenv("COMPACT_INTERVAL", "60"))
+# Token ceiling of a rolling summary
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "512"))
+
+# summarize(previous summary or None, turns) -> new summary
+Summarizer = Callable[[Optional[str], List[Dict]], Awaitable[str]]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def _speaker(entry: Dict) -> str:
+    return "User" if entry["type"] == "user" else "Assistant"
+
+def _first_sentence(text: str, max_words: int = 30) -> str:
+    words = _SENTENCE_END.split(text.strip(), 1)[0].split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+def extractive_summary(previous: Optional[str], turns: List[Dict], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Local stand-in for a summarization model.
+
+    Appends the opening sentence of every turn to the previous summary and
+    drops the oldest lines once it is over max_tokens, so the summary stays
+    bounded and favours recent context.
+    """
+    lines = previous.splitlines() if previous else []
+    lines.extend(f"{_speaker(turn)}: {_first_sentence(turn['message'])}" for turn in turns)
+    costs = [count_tokens(line) + 1 for line in lines]
+    total = sum(costs)
+    start = 0
+    while total > max_tokens and start < len(lines) - 1:
+        total -= costs[start]
+        start += 1
+    return "\n".join(lines[start:])
+
+def summary_prompt(previous: Optional[str], turns: List[Dict], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Prompt asking a model to fold new turns into the running summary"""
+    lines = [
+        "Update the running summary of a conversation between a user and an assistant.",
+        "Keep facts, names, preferences, decisions and open questions the assistant may need later.",
+        f"Reply with the summary only, in at most {max_tokens * 3 // 4} words.",
+        "",
+        "Current summary:",
+        previous or "(none)",
+        "",
+        "New turns:"
+    ]
+    lines.extend(f"{_speaker(turn)}: {turn['message']}" for turn in turns)
+    return "\n".join(lines)
+
+class HistoryCompactor:
+    """Background compaction of long histories into a rolling summary per user.
+
+    Users are marked as entries are appended. Each pass takes the marked
+    users whose unsummarized entries exceed the threshold and folds all but
+    the newest keep_recent of them into the summary, stored alongside the
+    history with the id of the newest entry it covers. Raw entries are kept
+    for the history view; only the context sent to providers shrinks.
+    """
+
+    def __init__(
+        self,
+        store: HistoryStore,
+        summarize: Summarizer,
+        threshold: int = COMPACT_THRESHOLD,
+        keep_recent: int = COMPACT_KEEP_RECENT,
+        batch: int = COMPACT_BATCH,
+        interval: float = COMPACT_INTERVAL,
+        on_compact: Optional[Callable[[str], None]] = None
+    ):
+        self.store = store
+        self.summarize = summarize
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self.batch = batch
+        self.interval = interval
+        # Called with the user id after each compaction, e.g. to drop cached copies
+        self.on_compact = on_compact
+        self._marked: Set[str] = set()
+        self.passes = 0
+        self.compactions = 0
+        self.entries_compacted = 0
+        self.errors = 0
+
+    def mark(self, user_id: str):
+        """Note that a user's history has grown"""
+        self._marked.add(user_id)
+
+    async def compact(self, user_id: str) -> bool:
+        """Fold a user's older entries into their summary; returns whether anything changed"""
+        current = await asyncio.to_thread(self.store.get_summary, user_id)
+        through = current["through_id"] if current else 0
+        pending = await asyncio.to_thread(self.store.page, user_id, None, through, self.threshold + 1)
+        if len(pending) <= self.threshold:
+            return False
+
+        recent = await asyncio.to_thread(self.store.page, user_id, None, None, self.keep_recent) if self.keep_recent else []
+        older = await asyncio.to_thread(self.store.page, user_id, None, through, self.batch)
+        if recent:
+            older = [entry for entry in older if entry["id"] < recent[0]["id"]]
+        if not older:
+            return False
+
+        previous = current["summary"] if current else None
+        # Logged provider responses are not conversation turns
+        turns = [entry for entry in older if entry["type"] != "response"]
+        summary = await self.summarize(previous, turns) if turns else previous or ""
+        await asyncio.to_thread(self.store.set_summary, user_id, summary, older[-1]["id"])
+        self.compactions += 1
+        self.entries_compacted += len(older)
+        if self.on_compact is not None:
+            self.on_compact(user_id)
+        logger.debug(f"Compacted {len(older)} history entries for user {user_id}")
+        return True
+
+    async def run_pass(self):
+        """Compact every marked user"""
+        users, self._marked = self._marked, set()
+        for user_id in users:
+            try:
+                if await self.compact(user_id):
+                    # More backlog may remain; look again next pass
+                    self._marked.add(user_id)
+            except Exception as e:
+                self.errors += 1
+                self._marked.add(user_id)
+                logger.error(f"Error compacting history for user {user_id}: {e}")
+        self.passes += 1
+
+    async def run(self):
+        """Run compaction passes every interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_pass()
+
+    def stats(self) -> Dict:
+        return {
+            "marked_users": len(self._marked),
+            "passes": self.passes,
+            "compactions": self.compactions,
+            "entries_compacted": self.entries_compacted,
+            "errors": self.errors
+        }
@@ -0,0 +1,83 @@
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List
+
+# Fallback limits for models missing from MODEL_CONFIGS
+DEFAULT_MODEL_LIMITS = {"context_window": 4096, "reserved_output": 1024}
+
+# Upper bound on history tokens sent per turn, whatever the model allows
+MAX_CONTEXT_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "8192"))
+
+# Tokens spent on role labels and separators around each message
+MESSAGE_OVERHEAD = 4
+# Tokens spent on the fixed prompt scaffolding around the conversation
+PROMPT_OVERHEAD = 16
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+@lru_cache(maxsize=int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "65536")))
+def count_tokens(text: str) -> int:
+    """Estimate the token count of a text without a model-specific tokenizer.
+
+    Words are charged roughly one token per four characters and punctuation
+    one token each, which tracks BPE tokenizers closely enough for budgeting.
+    Results are memoized, so history messages are only counted once.
+    """
+    return sum(
+        math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _TOKEN_PATTERN.findall(text)
+    )
+
+def context_budget(message: str, limits: Dict) -> int:
+    """Tokens available for history once the new message and the reply are reserved"""
+    available = (
+        limits["context_window"]
+        - limits["reserved_output"]
+        - count_tokens(message)
+        - MESSAGE_OVERHEAD
+        - PROMPT_OVERHEAD
+    )
+    return max(0, min(available, MAX_CONTEXT_TOKENS))
+
+def build_context(history: List[Dict], message: str, limits: Dict) -> List[Dict]:
+    """Pick the most recent conversation turns that fit the model's token budget.
+
+    Walks the history from newest to oldest and stops at the first turn that
+    no longer fits, so the result is always a contiguous, chronological tail
+    of the conversation. Logged provider responses are not conversation
+    turns and are skipped. A leading "summary" entry (the compacted older
+    conversation) is budgeted first and kept at the front.
+    """
+    budget = context_budget(message, limits)
+    summary = None
+    if history and history[0]["type"] == "summary":
+        cost = count_tokens(history[0]["message"]) + MESSAGE_OVERHEAD
+        if cost <= budget:
+            summary = history[0]
+            budget -= cost
+        history = history[1:]
+
+    selected = []
+    for entry in reversed(history):
+        if entry["type"] == "response":
+            continue
+        cost = count_tokens(entry["message"]) + MESSAGE_OVERHEAD
+        if cost > budget:
+            break
+        budget -= cost
+        selected.append(entry)
+    if summary is not None:
+        selected.append(summary)
+    selected.reverse()
+    return selected
+
+def prompt_tokens(message: str, context: List[Dict]) -> int:
+    """Estimated input tokens for a message sent with its context"""
+    return (
+        sum(count_tokens(entry["message"]) + MESSAGE_OVERHEAD for entry in context)
+        + count_tokens(message)
+        + MESSAGE_OVERHEAD
+        + PROMPT_OVERHEAD
+    )
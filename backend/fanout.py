@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .provider_io import call_deadline
+from .rate_limiter import RateLimitExceeded
+from .resilience import CircuitOpenError, HedgeBudget
+
+logger = logging.getLogger(__name__)
+
+# Result statuses reported for each provider
+STATUS_OK = "ok"
+STATUS_TIMED_OUT = "timed_out"
+STATUS_ERROR = "error"
+STATUS_RATE_LIMITED = "rate_limited"
+STATUS_CIRCUIT_OPEN = "circuit_open"
+STATUS_CANCELLED = "cancelled"
+STATUS_SKIPPED = "skipped"
+
+DEFAULT_TIMEOUT = 30.0
+
+# Times a batch item is tried when it is shed by a rate limiter or open circuit
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "5"))
+
+ProviderCall = Callable[[], Awaitable[str]]
+ProviderStream = Callable[[], AsyncIterator[str]]
+
+async def _run_with_deadline(provider: str, call: ProviderCall, timeout: float) -> Dict:
+    """Run a single provider call, converting a missed deadline into a partial result"""
+    start = time.perf_counter()
+    result = {}
+    try:
+        async with asyncio.timeout(timeout) as deadline:
+            call_deadline.set(deadline.when())
+            response = await call()
+        status = STATUS_OK
+    except TimeoutError:
+        logger.warning(f"{provider} missed its {timeout:g}s deadline")
+        status = STATUS_TIMED_OUT
+        response = f"{provider.capitalize()} did not respond within {timeout:g} seconds."
+    except RateLimitExceeded as e:
+        logger.warning(str(e))
+        status = STATUS_RATE_LIMITED
+        response = "Rate limit reached. Please try again later or use your own API key."
+        result["retry_after"] = round(e.retry_after, 1)
+    except CircuitOpenError as e:
+        logger.warning(str(e))
+        status = STATUS_CIRCUIT_OPEN
+        response = f"{provider.capitalize()} is temporarily unavailable. Please try again later."
+        result["retry_after"] = round(e.retry_after, 1)
+    except Exception as e:
+        logger.error(f"Error with {provider}: {e}")
+        status = STATUS_ERROR
+        response = f"Error with {provider.capitalize()}: {e}"
+
+    result.update({
+        "status": status,
+        "response": response,
+        "latency": round(time.perf_counter() - start, 3)
+    })
+    return result
+
+async def fan_out(
+    calls: Dict[str, ProviderCall],
+    timeouts: Optional[Dict[str, float]] = None,
+    default_timeout: float = DEFAULT_TIMEOUT
+) -> Dict[str, Dict]:
+    """Run all provider calls concurrently, each under its own deadline.
+
+    The total wait is bounded by the slowest provider's deadline rather than the
+    sum of all provider latencies. Every provider gets a result entry, so one
+    slow or failing backend never hides the others.
+    """
+    timeouts = timeouts or {}
+    async with asyncio.TaskGroup() as group:
+        tasks = {
+            provider: group.create_task(
+                _run_with_deadline(provider, call, timeouts.get(provider, default_timeout))
+            )
+            for provider, call in calls.items()
+        }
+    return {provider: task.result() for provider, task in tasks.items()}
+
+async def race(
+    calls: Dict[str, ProviderCall],
+    timeouts: Optional[Dict[str, float]] = None,
+    default_timeout: float = DEFAULT_TIMEOUT,
+    hedge_delays: Optional[Dict[str, float]] = None,
+    budget: Optional[HedgeBudget] = None
+) -> Dict:
+    """Return the first successful call and cancel the others.
+
+    Without hedge_delays every call starts at once. With them, calls start
+    one at a time in order: the next is launched when the latest has not
+    answered within its delay (a hedge, paid for from the budget) or right
+    away when it fails. Returns {"winner", "hedged", "results"}, where
+    results holds an entry for every call that was started; the losers
+    still in flight are reported as cancelled.
+    """
+    timeouts = timeouts or {}
+    loop = asyncio.get_running_loop()
+    waiting = list(calls)
+    tasks: Dict[asyncio.Task, str] = {}
+    started: Dict[str, float] = {}
+    results: Dict[str, Dict] = {}
+    winner = None
+    hedged = False
+    can_hedge = hedge_delays is not None
+
+    def launch() -> str:
+        name = waiting.pop(0)
+        started[name] = loop.time()
+        task = asyncio.create_task(_run_with_deadline(name, calls[name], timeouts.get(name, default_timeout)))
+        tasks[task] = name
+        return name
+
+    if hedge_delays is None:
+        while waiting:
+            launch()
+    else:
+        if budget is not None:
+            budget.deposit()
+        latest = launch()
+
+    try:
+        while tasks and winner is None:
+            hedge_in = None
+            if can_hedge and waiting:
+                hedge_in = max(0.0, started[latest] + hedge_delays.get(latest, default_timeout) - loop.time())
+            done, _ = await asyncio.wait(tasks, timeout=hedge_in, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if budget is None or budget.try_spend():
+                    logger.info(f"{latest} is slower than {hedge_delays.get(latest, default_timeout):g}s; hedging with {waiting[0]}")
+                    latest = launch()
+                    hedged = True
+                else:
+                    can_hedge = False
+                continue
+            for task in done:
+                name = tasks.pop(task)
+                results[name] = task.result()
+                if results[name]["status"] == STATUS_OK and winner is None:
+                    winner = name
+            # Fail over straight away instead of waiting out the hedge delay
+            if winner is None and hedge_delays is not None and latest in results and waiting:
+                latest = launch()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        now = loop.time()
+        for task, name in tasks.items():
+            if task.cancelled():
+                results[name] = {"status": STATUS_CANCELLED, "response": None, "latency": round(now - started[name], 3)}
+            else:
+                results[name] = task.result()
+
+    return {"winner": winner, "hedged": hedged, "results": results}
+
+async def run_batch(
+    work: Dict[str, List[Tuple[str, ProviderCall]]],
+    concurrency: Dict[str, int],
+    timeouts: Optional[Dict[str, float]] = None,
+    default_timeout: float = DEFAULT_TIMEOUT,
+    max_attempts: int = BATCH_MAX_ATTEMPTS
+) -> AsyncIterator[Dict]:
+    """Work through many calls per provider with a fixed number of workers each.
+
+    work maps each provider to its (item id, call) pairs. Every provider gets
+    its own pool of concurrency[provider] workers, so a slow provider never
+    holds back the others. Items shed by a rate limiter or open circuit are
+    retried after the hinted delay. Yields each result as it finishes, with
+    its "id", "provider" and the "attempts" made.
+    """
+    timeouts = timeouts or {}
+    # Bounded, so workers pause while the consumer is behind
+    results: asyncio.Queue = asyncio.Queue(maxsize=2 * max(1, sum(concurrency.values())))
+
+    async def worker(provider: str, items: deque):
+        timeout = timeouts.get(provider, default_timeout)
+        while items:
+            item_id, call = items.popleft()
+            for attempt in range(1, max_attempts + 1):
+                result = await _run_with_deadline(provider, call, timeout)
+                if result["status"] not in (STATUS_RATE_LIMITED, STATUS_CIRCUIT_OPEN) or attempt == max_attempts:
+                    break
+                await asyncio.sleep(result["retry_after"])
+            result.update({"id": item_id, "provider": provider, "attempts": attempt})
+            await results.put(result)
+
+    tasks = []
+    for provider, calls in work.items():
+        items = deque(calls)
+        tasks.extend(asyncio.create_task(worker(provider, items)) for _ in range(max(1, concurrency.get(provider, 1))))
+    remaining = sum(len(calls) for calls in work.values())
+    try:
+        while remaining:
+            yield await results.get()
+            remaining -= 1
+    finally:
+        # Stop upstream work if the consumer goes away early
+        for task in tasks:
+            task.cancel()
+
+async def _pump_stream(provider: str, stream: ProviderStream, timeout: float, queue: asyncio.Queue):
+    """Forward one provider's chunks to the queue, finishing with a "done" event"""
+    start = time.perf_counter()
+    chunks = []
+    try:
+        async with asyncio.timeout(timeout) as deadline:
+            call_deadline.set(deadline.when())
+            async for text in stream():
+                chunks.append(text)
+                await queue.put({"provider": provider, "event": "chunk", "text": text})
+        status = STATUS_OK
+        response = "".join(chunks)
+    except TimeoutError:
+        logger.warning(f"{provider} stream missed its {timeout:g}s deadline")
+        status = STATUS_TIMED_OUT
+        # Keep whatever arrived before the deadline as a partial result
+        response = "".join(chunks) or f"{provider.capitalize()} did not respond within {timeout:g} seconds."
+    except RateLimitExceeded as e:
+        logger.warning(str(e))
+        status = STATUS_RATE_LIMITED
+        response = "Rate limit reached. Please try again later or use your own API key."
+    except CircuitOpenError as e:
+        logger.warning(str(e))
+        status = STATUS_CIRCUIT_OPEN
+        response = f"{provider.capitalize()} is temporarily unavailable. Please try again later."
+    except Exception as e:
+        logger.error(f"Error streaming from {provider}: {e}")
+        status = STATUS_ERROR
+        response = f"Error with {provider.capitalize()}: {e}"
+
+    await queue.put({
+        "provider": provider,
+        "event": "done",
+        "status": status,
+        "response": response,
+        "latency": round(time.perf_counter() - start, 3)
+    })
+
+async def fan_out_stream(
+    streams: Dict[str, ProviderStream],
+    timeouts: Optional[Dict[str, float]] = None,
+    default_timeout: float = DEFAULT_TIMEOUT
+) -> AsyncIterator[Dict]:
+    """Stream all providers concurrently, yielding events as chunks arrive.
+
+    Yields {"provider", "event": "chunk", "text"} for every chunk and one
+    {"provider", "event": "done", "status", "response", "latency"} per
+    provider once its stream ends or misses its deadline.
+    """
+    timeouts = timeouts or {}
+    queue: asyncio.Queue = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(
+            _pump_stream(provider, stream, timeouts.get(provider, default_timeout), queue)
+        )
+        for provider, stream in streams.items()
+    ]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            event = await queue.get()
+            if event["event"] == "done":
+                remaining -= 1
+            yield event
+    finally:
+        # Stop upstream work if the consumer goes away early
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .shared_state import connect
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_DB = os.getenv("FEEDBACK_DB", "data/feedback.db")
+
+# Width in seconds of the rollup buckets behind windowed queries
+ROLLUP_BUCKET = 60
+
+class FeedbackStore:
+    """Feedback on provider responses in an embedded SQLite database.
+
+    Each (message_id, service) pair holds its latest feedback. Running tallies
+    per service and model, plus per-minute rollups, are updated in the same
+    transaction as the feedback itself, so totals and windowed queries read
+    a handful of aggregate rows instead of scanning every vote.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS feedback (
+            message_id TEXT NOT NULL,
+            service TEXT NOT NULL,
+            model TEXT NOT NULL,
+            feedback TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (message_id, service)
+        );
+        CREATE INDEX IF NOT EXISTS idx_feedback_service ON feedback (service, model, created_at);
+        CREATE INDEX IF NOT EXISTS idx_feedback_time ON feedback (created_at);
+        CREATE TABLE IF NOT EXISTS feedback_tallies (
+            service TEXT NOT NULL,
+            model TEXT NOT NULL,
+            feedback TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (service, model, feedback)
+        );
+        CREATE TABLE IF NOT EXISTS feedback_rollup (
+            bucket INTEGER NOT NULL,
+            service TEXT NOT NULL,
+            model TEXT NOT NULL,
+            feedback TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket, service, model, feedback)
+        );
+    """
+
+    def __init__(self, path: str = FEEDBACK_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(self.SCHEMA)
+        logger.info(f"Feedback store opened at {path}")
+
+    def record(self, message_id: str, service: str, feedback: str, model: Optional[str] = None):
+        """Record feedback on one response, replacing any earlier feedback on it"""
+        self.append_many([(message_id, {"service": service, "model": model, "feedback": feedback})])
+
+    def append_many(self, entries: List[Tuple[str, Dict]]):
+        """Record a batch of (message_id, {"service", "model", "feedback"}) pairs in one transaction.
+
+        Matches the store interface of HistoryWriter, so inserts from the
+        feedback endpoint can be batched by the same single-writer task.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for message_id, entry in entries:
+                    self._record(message_id, entry["service"], entry.get("model") or "", entry["feedback"], now)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _record(self, message_id: str, service: str, model: str, feedback: str, now: float):
+        previous = self._conn.execute(
+            "SELECT model, feedback, created_at FROM feedback WHERE message_id = ? AND service = ?",
+            (message_id, service)
+        ).fetchone()
+        if previous is not None:
+            self._tally(service, previous[0], previous[1], previous[2], -1)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO feedback (message_id, service, model, feedback, created_at) VALUES (?, ?, ?, ?, ?)",
+            (message_id, service, model, feedback, now)
+        )
+        self._tally(service, model, feedback, now, 1)
+
+    def _tally(self, service: str, model: str, feedback: str, at: float, delta: int):
+        self._conn.execute(
+            "INSERT INTO feedback_tallies (service, model, feedback, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (service, model, feedback) DO UPDATE SET count = count + excluded.count",
+            (service, model, feedback, delta)
+        )
+        self._conn.execute(
+            "INSERT INTO feedback_rollup (bucket, service, model, feedback, count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (bucket, service, model, feedback) DO UPDATE SET count = count + excluded.count",
+            (int(at // ROLLUP_BUCKET), service, model, feedback, delta)
+        )
+
+    def get(self, message_id: str) -> Dict[str, str]:
+        """Get the feedback recorded on a message, by service"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT service, feedback FROM feedback WHERE message_id = ?", (message_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def summary(self) -> Dict[str, int]:
+        """Get all-time feedback counts by value"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT feedback, SUM(count) FROM feedback_tallies GROUP BY feedback"
+            ).fetchall()
+        return {feedback: count for feedback, count in rows}
+
+    def tallies(self) -> Dict[str, Dict[str, int]]:
+        """Get all-time feedback counts per service/model"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT service, model, feedback, count FROM feedback_tallies WHERE count != 0"
+            ).fetchall()
+        tallies: Dict[str, Dict[str, int]] = {}
+        for service, model, feedback, count in rows:
+            tallies.setdefault(f"{service}/{model}" if model else service, {})[feedback] = count
+        return tallies
+
+    def window(self, seconds: float, service: Optional[str] = None, model: Optional[str] = None) -> Dict:
+        """Feedback counts and negative rate over the last `seconds`, at minute resolution"""
+        query = "SELECT feedback, SUM(count) FROM feedback_rollup WHERE bucket >= ?"
+        params: list = [int((time.time() - seconds) // ROLLUP_BUCKET)]
+        if service is not None:
+            query += " AND service = ?"
+            params.append(service)
+        if model is not None:
+            query += " AND model = ?"
+            params.append(model)
+        with self._lock:
+            rows = self._conn.execute(query + " GROUP BY feedback", params).fetchall()
+
+        counts = {feedback: count for feedback, count in rows if count}
+        total = sum(counts.values())
+        return {
+            "window": seconds,
+            "counts": counts,
+            "total": total,
+            "negative_rate": round(counts.get("negative", 0) / total, 4) if total else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
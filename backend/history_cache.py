@@ -0,0 +1,211 @@
+import logging
+import os
+import sys
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from .history_store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+# Most users whose recent conversation is kept in memory by each worker
+HISTORY_CACHE_USERS = int(os.getenv("HISTORY_CACHE_USERS", "10000"))
+# Memory budget in bytes for cached conversations, estimated from the objects held
+HISTORY_CACHE_BYTES = int(os.getenv("HISTORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Most entries kept per conversation after its summary
+HISTORY_CACHE_ENTRIES = 200
+
+class CachedEntry:
+    """One history entry without a per-entry dict.
+
+    Roles and sources are interned, so every entry refers to the same few
+    strings instead of holding its own copies.
+    """
+
+    __slots__ = ("id", "type", "message", "source")
+
+    def __init__(self, id: Optional[int], type: str, message: str, source: Optional[str] = None):
+        self.id = id
+        self.type = sys.intern(type)
+        self.message = message
+        self.source = sys.intern(source) if source is not None else None
+
+    def to_dict(self) -> Dict:
+        entry = {"type": self.type, "message": self.message}
+        if self.source is not None:
+            entry["source"] = self.source
+        if self.id is not None:
+            entry["id"] = self.id
+        return entry
+
+    def size(self) -> int:
+        # The interned role and source strings are shared, so only the message counts
+        return _ENTRY_SIZE + sys.getsizeof(self.message)
+
+# The record plus its slot in the conversation's list
+_ENTRY_SIZE = sys.getsizeof(CachedEntry(0, "user", "")) + 8
+
+class _Conversation:
+    """A user's rolling summary and the entries after it, as providers see them"""
+
+    __slots__ = ("summary", "through_id", "entries", "last_id", "version", "size")
+
+    def __init__(self, summary: Optional[str], through_id: int, version: Optional[int]):
+        self.summary = summary
+        self.through_id = through_id
+        self.entries: List[CachedEntry] = []
+        # Id of the newest entry held; None once an entry without an id was added
+        self.last_id: Optional[int] = through_id
+        self.version = version
+        self.size = sys.getsizeof(self) + (sys.getsizeof(summary) if summary else 0)
+
+    def add(self, entry: CachedEntry, max_entries: int):
+        self.entries.append(entry)
+        self.size += entry.size()
+        self.last_id = entry.id if entry.id is not None and self.last_id is not None else None
+        while len(self.entries) > max_entries:
+            self.size -= self.entries.pop(0).size()
+
+    def history(self) -> List[Dict]:
+        history = [entry.to_dict() for entry in self.entries]
+        if self.summary:
+            history.insert(0, {"type": "summary", "message": self.summary})
+        return history
+
+class HistoryCache:
+    """LRU cache of active users' conversations in front of the history store.
+
+    Holds what providers are sent for each user: the rolling summary and
+    the newest entries after it. Appends are written to the store first and
+    then applied to the cached conversation. A conversation is only filled
+    from the store while none of its user's appends are in flight, so none
+    is counted twice or missed. When another process has written to the
+    store, only the entries newer than those held are read back. The least
+    recently used conversations are evicted to stay within both the user
+    and the memory limits.
+    """
+
+    def __init__(
+        self,
+        store: HistoryStore,
+        max_entries: int = HISTORY_CACHE_ENTRIES,
+        max_users: int = HISTORY_CACHE_USERS,
+        max_bytes: int = HISTORY_CACHE_BYTES
+    ):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._writing: Dict[str, int] = defaultdict(int)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def load(self, user_id: str) -> List[Dict]:
+        """Load the conversation providers see: the rolling summary, then the entries after it"""
+        version = self.store.version()
+        conversation = self._conversations.get(user_id)
+        if conversation is not None and conversation.version != version:
+            conversation = self._refresh(user_id, conversation, version)
+        if conversation is not None:
+            self.hits += 1
+            self._conversations.move_to_end(user_id)
+            return conversation.history()
+
+        self.misses += 1
+        conversation = self._read(user_id, version)
+        if not self._writing.get(user_id):
+            self._conversations[user_id] = conversation
+            self.size += conversation.size
+            self._evict()
+        return conversation.history()
+
+    def _read(self, user_id: str, version: Optional[int]) -> _Conversation:
+        summary = self.store.get_summary(user_id)
+        through = summary["through_id"] if summary else 0
+        conversation = _Conversation(summary["summary"] if summary else None, through, version)
+        for entry in self.store.page(user_id, limit=self.max_entries):
+            if entry["id"] > through:
+                conversation.add(CachedEntry(entry["id"], entry["type"], entry["message"], entry.get("source")), self.max_entries)
+        return conversation
+
+    def _refresh(self, user_id: str, conversation: _Conversation, version: Optional[int]) -> Optional[_Conversation]:
+        """Catch up with entries another process appended; None if the conversation must be read again"""
+        summary = self.store.get_summary(user_id)
+        if conversation.last_id is None or (summary["through_id"] if summary else 0) != conversation.through_id:
+            self._discard(user_id)
+            return None
+        newer = self.store.page(user_id, after=conversation.last_id, limit=self.max_entries)
+        if len(newer) == self.max_entries:
+            # Too far behind to catch up
+            self._discard(user_id)
+            return None
+        self.size -= conversation.size
+        for entry in newer:
+            conversation.add(CachedEntry(entry["id"], entry["type"], entry["message"], entry.get("source")), self.max_entries)
+        conversation.version = version
+        self.size += conversation.size
+        self.refreshes += 1
+        self._evict()
+        return self._conversations.get(user_id)
+
+    @contextmanager
+    def writing(self, user_id: str) -> Iterator[None]:
+        """Mark an append to a user's history as in flight"""
+        self._writing[user_id] += 1
+        try:
+            yield
+        finally:
+            self._writing[user_id] -= 1
+            if not self._writing[user_id]:
+                del self._writing[user_id]
+
+    def append(self, user_id: str, entry: Dict, entry_id: Optional[int] = None):
+        """Apply an entry already written to the store to the user's cached conversation"""
+        conversation = self._conversations.get(user_id)
+        if conversation is None:
+            return
+        if entry_id is not None and conversation.last_id is not None and entry_id <= conversation.last_id:
+            # Already read back from the store
+            return
+        self.size -= conversation.size
+        conversation.add(CachedEntry(entry_id, entry["type"], entry["message"], entry.get("source")), self.max_entries)
+        self.size += conversation.size
+        self._conversations.move_to_end(user_id)
+        self._evict()
+
+    def invalidate(self, user_id: str):
+        """Drop a user's conversation, e.g. after their history was compacted"""
+        self._discard(user_id)
+
+    def _discard(self, user_id: str):
+        conversation = self._conversations.pop(user_id, None)
+        if conversation is not None:
+            self.size -= conversation.size
+
+    def _evict(self):
+        while self._conversations and (len(self._conversations) > self.max_users or self.size > self.max_bytes):
+            user_id, conversation = self._conversations.popitem(last=False)
+            self.size -= conversation.size
+            self.evictions += 1
+            logger.debug(f"Evicted cached history for user {user_id}")
+
+    def stats(self) -> Dict:
+        """Get cache size, memory and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._conversations),
+            "entries": sum(len(conversation.entries) for conversation in self._conversations.values()),
+            "bytes": self.size,
+            "max_users": self.max_users,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,560 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .shared_state import connect
+
+logger = logging.getLogger(__name__)
+
+# Backend selection; see create_history_store
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_PATHS = {
+    "sqlite": "data/conversation_history.db",
+    "jsonl": "data/history"
+}
+
+_SEARCH_TERM = re.compile(r"\w+")
+
+def search_terms(query: str) -> List[str]:
+    """Lower-cased words of a search query; punctuation and search operators are ignored"""
+    return [term.lower() for term in _SEARCH_TERM.findall(query)]
+
+class HistoryStore:
+    """Interface for conversation history backends.
+
+    Entries are dicts with "type", "message" and optionally "source", and are
+    only ever appended. Loading returns a single user's entries in the order
+    they were appended.
+    """
+
+    def load(self, user_id: str) -> List[Dict]:
+        """Load conversation history for a user"""
+        raise NotImplementedError
+
+    def append(self, user_id: str, entry: Dict):
+        """Append one entry to a user's conversation history"""
+        raise NotImplementedError
+
+    def append_many(self, entries: List[Tuple[str, Dict]]) -> Optional[List[int]]:
+        """Append a batch of (user_id, entry) pairs, preserving their order.
+
+        Returns the ids given to the new entries by backends that assign
+        them as they write, otherwise None.
+        """
+        for user_id, entry in entries:
+            self.append(user_id, entry)
+        return None
+
+    def has_history(self, user_id: str) -> bool:
+        """Check whether a user has any stored entries"""
+        return bool(self.load(user_id))
+
+    def page(self, user_id: str, before: Optional[int] = None, after: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        """Load one page of a user's entries, each with its "id", oldest first.
+
+        With after, returns the oldest `limit` entries newer than that id;
+        otherwise the newest `limit` entries older than before (or overall).
+        Ids only increase, so they work as cursors in both directions. This
+        fallback numbers entries by position; indexed backends override it.
+        """
+        entries = [dict(entry, id=i) for i, entry in enumerate(self.load(user_id), 1)]
+        if before is not None:
+            entries = entries[:max(0, before - 1)]
+        if after is not None:
+            return entries[after:after + limit]
+        return entries[-limit:] if limit else []
+
+    def last_id(self, user_id: str) -> int:
+        """Id of a user's newest entry, or 0 if there is none"""
+        return len(self.load(user_id))
+
+    def search(
+        self,
+        user_id: str,
+        query: str,
+        source: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict]:
+        """Find a user's entries containing every word of query, best matches first.
+
+        source keeps only responses from that provider, and start/end (Unix
+        times) bound when entries were written. This fallback scans the
+        whole history and ranks by how often the words occur; indexed
+        backends override it.
+        """
+        if start is not None or end is not None:
+            raise ValueError("This history backend does not record when entries were written")
+        terms = search_terms(query)
+        if not terms:
+            return []
+        hits = []
+        for id, entry in enumerate(self.load(user_id), 1):
+            entry = dict(entry, id=id)
+            if source is not None and entry.get("source") != source:
+                continue
+            words = search_terms(entry["message"])
+            if all(term in words for term in terms):
+                hits.append((sum(words.count(term) for term in terms), entry))
+        # Most occurrences first, newest first among equals
+        hits.sort(key=lambda hit: (-hit[0], -hit[1]["id"]))
+        return [entry for _, entry in hits[offset:offset + limit]]
+
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        """Get a user's rolling summary as {"summary", "through_id"}, or None.
+
+        through_id is the id of the newest entry the summary covers.
+        """
+        raise NotImplementedError
+
+    def set_summary(self, user_id: str, summary: str, through_id: int):
+        """Store a user's rolling summary unless a newer one is already stored"""
+        raise NotImplementedError
+
+    def version(self) -> Optional[int]:
+        """Changes whenever another process has written to the store; None if that cannot be detected"""
+        return None
+
+    def close(self):
+        """Release any resources held by the store"""
+
+def _to_entry(type: str, message: str, source: str = None) -> Dict:
+    entry = {"type": type, "message": message}
+    if source is not None:
+        entry["source"] = source
+    return entry
+
+def _to_page_entry(id: int, type: str, message: str, source: str = None) -> Dict:
+    entry = _to_entry(type, message, source)
+    entry["id"] = id
+    return entry
+
+def _user_key(user_id: str) -> str:
+    """A user's token in the full-text index.
+
+    User ids are arbitrary strings that the tokenizer would split and fold,
+    so each is hashed into one run of digits, which it keeps whole and
+    never stems.
+    """
+    return str(int(hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16], 16))
+
+class SQLiteHistoryStore(HistoryStore):
+    """History in an embedded SQLite database in WAL mode, indexed by user"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            type TEXT NOT NULL,
+            message TEXT NOT NULL,
+            source TEXT,
+            created_at REAL NOT NULL,
+            user_key TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, id);
+        CREATE TABLE IF NOT EXISTS summaries (
+            user_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            through_id INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message, user_key, content='messages', content_rowid='id', tokenize='porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message, user_key) VALUES (new.id, new.message, new.user_key);
+        END;
+    """
+
+    def __init__(self, path: str = HISTORY_PATHS["sqlite"]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._upgrade()
+        logger.info(f"SQLite history store opened at {path}")
+
+    def _columns(self, table: str) -> List[str]:
+        return [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+
+    def _upgrade(self):
+        """Create the schema, bringing databases from before search or per-user search up to date"""
+        # Workers starting together queue here, and each reads the schema only
+        # once it holds the write lock, so just the first one migrates it
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            message_columns = self._columns("messages")
+            fts_columns = self._columns("messages_fts")
+            if message_columns and "user_key" not in message_columns:
+                self._conn.execute("ALTER TABLE messages ADD COLUMN user_key TEXT")
+                users = [row[0] for row in self._conn.execute("SELECT DISTINCT user_id FROM messages")]
+                self._conn.executemany(
+                    "UPDATE messages SET user_key = ? WHERE user_id = ?",
+                    [(_user_key(user_id), user_id) for user_id in users]
+                )
+            if fts_columns and "user_key" not in fts_columns:
+                # Built before the index held users; recreated below
+                self._conn.execute("DROP TRIGGER IF EXISTS messages_fts_insert")
+                self._conn.execute("DROP TABLE messages_fts")
+            # executescript would commit first, so the statements run one by one
+            statement = ""
+            for line in self.SCHEMA.splitlines(keepends=True):
+                statement += line
+                if sqlite3.complete_statement(statement):
+                    self._conn.execute(statement)
+                    statement = ""
+            if "user_key" not in fts_columns:
+                # Index the entries already stored; from then on the trigger
+                # indexes every append in its own transaction
+                self._conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def load(self, user_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT type, message, source FROM messages WHERE user_id = ? ORDER BY id",
+                (user_id,)
+            ).fetchall()
+        return [_to_entry(*row) for row in rows]
+
+    def append(self, user_id: str, entry: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (user_id, type, message, source, created_at, user_key) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, entry["type"], entry["message"], entry.get("source"), time.time(), _user_key(user_id))
+            )
+
+    def append_many(self, entries: List[Tuple[str, Dict]]) -> List[int]:
+        now = time.time()
+        rows = [
+            (user_id, entry["type"], entry["message"], entry.get("source"), now, _user_key(user_id))
+            for user_id, entry in entries
+        ]
+        # One transaction for the whole batch instead of one commit per entry
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO messages (user_id, type, message, source, created_at, user_key) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                last = self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        # No other writer can run inside the transaction, so the ids are consecutive
+        return list(range(last - len(rows) + 1, last + 1))
+
+    def has_history(self, user_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM messages WHERE user_id = ? LIMIT 1", (user_id,)
+            ).fetchone()
+        return row is not None
+
+    def page(self, user_id: str, before: Optional[int] = None, after: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        # Range scans on the (user_id, id) index; nothing outside the page is read
+        query = "SELECT id, type, message, source FROM messages WHERE user_id = ?"
+        params: list = [user_id]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        if after is not None:
+            query += " AND id > ? ORDER BY id LIMIT ?"
+            params.extend([after, limit])
+        else:
+            query += " ORDER BY id DESC LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        if after is None:
+            rows.reverse()
+        return [_to_page_entry(*row) for row in rows]
+
+    def last_id(self, user_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM messages WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] or 0
+
+    def search(
+        self,
+        user_id: str,
+        query: str,
+        source: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        # Every word quoted, so user input is never read as FTS5 query syntax.
+        # The user's key is matched in the index too, so only their entries
+        # are read and scored rather than every user's matches.
+        match = f'user_key : "{_user_key(user_id)}" AND ' + " AND ".join(f'message : "{term}"' for term in terms)
+        sql = (
+            "SELECT m.id, m.type, m.message, m.source, m.created_at, "
+            "snippet(messages_fts, 0, '[', ']', '...', 16) "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ? AND m.user_id = ?"
+        )
+        params: list = [match, user_id]
+        if source is not None:
+            sql += " AND m.source = ?"
+            params.append(source)
+        if start is not None:
+            sql += " AND m.created_at >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND m.created_at < ?"
+            params.append(end)
+        # bm25 scores are lower for better matches; the user column is not weighed
+        sql += " ORDER BY bm25(messages_fts, 1.0, 0.0), m.id DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        hits = []
+        for id, type, message, source, created_at, snippet in rows:
+            hit = _to_page_entry(id, type, message, source)
+            hit["created_at"] = created_at
+            hit["snippet"] = snippet
+            hits.append(hit)
+        return hits
+
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, through_id FROM summaries WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return {"summary": row[0], "through_id": row[1]} if row else None
+
+    def set_summary(self, user_id: str, summary: str, through_id: int):
+        # Another worker may have compacted further already; never move backwards
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO summaries (user_id, summary, through_id, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET summary = excluded.summary, "
+                "through_id = excluded.through_id, updated_at = excluded.updated_at "
+                "WHERE excluded.through_id > summaries.through_id",
+                (user_id, summary, through_id, time.time())
+            )
+
+    def version(self) -> int:
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Byte offset at which a line of a JSONL history log ends
+_LINE_END = struct.Struct("<Q")
+
+class JSONLHistoryStore(HistoryStore):
+    """History as one append-only JSON-lines log per user.
+
+    Each log has an index file beside it holding the byte offset at which
+    every line ends, so an entry's id is its line number and a page is read
+    by seeking straight to its lines. The index trails the log: lines
+    written without index entries (older logs, an interrupted append) are
+    indexed the next time the log is read.
+    """
+
+    def __init__(self, directory: str = HISTORY_PATHS["jsonl"]):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        logger.info(f"JSONL history store opened at {directory}")
+
+    def _path(self, user_id: str) -> str:
+        # User ids are arbitrary strings, so hash them into safe file names
+        digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.jsonl")
+
+    def _summary_path(self, user_id: str) -> str:
+        return self._path(user_id)[:-len(".jsonl")] + ".summary.json"
+
+    def _index_path(self, user_id: str) -> str:
+        return self._path(user_id)[:-len(".jsonl")] + ".idx"
+
+    def _sync_index(self, user_id: str) -> Tuple[int, int]:
+        """Index any lines missing from the user's line index; (lines indexed, end of the last one)"""
+        try:
+            size = os.path.getsize(self._path(user_id))
+        except FileNotFoundError:
+            return 0, 0
+        index_path = self._index_path(user_id)
+        try:
+            count = os.path.getsize(index_path) // _LINE_END.size
+        except FileNotFoundError:
+            count = 0
+        end = self._line_end(user_id, count)
+        if end > size:
+            # The log was replaced or cut short; index it again from the start
+            count, end = 0, 0
+        if end == size and os.path.exists(index_path):
+            return count, end
+
+        ends = []
+        with open(self._path(user_id), "rb") as f:
+            f.seek(end)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A torn final line; appends terminate it before writing
+                    break
+                end += len(line)
+                ends.append(end)
+        with open(index_path, "r+b" if os.path.exists(index_path) else "wb") as f:
+            # Also drops a torn index entry
+            f.truncate(count * _LINE_END.size)
+            f.seek(count * _LINE_END.size)
+            f.write(b"".join(_LINE_END.pack(offset) for offset in ends))
+        return count + len(ends), end
+
+    def _line_end(self, user_id: str, line: int) -> int:
+        """Byte offset at which a line (numbered from 1) ends; 0 for line 0"""
+        if line <= 0:
+            return 0
+        with open(self._index_path(user_id), "rb") as f:
+            f.seek((line - 1) * _LINE_END.size)
+            return _LINE_END.unpack(f.read(_LINE_END.size))[0]
+
+    def load(self, user_id: str) -> List[Dict]:
+        try:
+            with open(self._path(user_id), "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        history = []
+        for line in lines:
+            try:
+                history.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted write; skip it
+                logger.warning(f"Skipping corrupt history line for user {user_id}")
+        return history
+
+    def append(self, user_id: str, entry: Dict):
+        self.append_many([(user_id, entry)])
+
+    def append_many(self, entries: List[Tuple[str, Dict]]) -> List[int]:
+        # Group by user so each log file is opened and written once per batch
+        lines = defaultdict(list)
+        for user_id, entry in entries:
+            lines[user_id].append(json.dumps(_to_entry(entry["type"], entry["message"], entry.get("source"))).encode("utf-8") + b"\n")
+        first_ids = {}
+        for user_id, user_lines in lines.items():
+            count, end = self._sync_index(user_id)
+            with open(self._path(user_id), "ab") as f:
+                position = f.tell()
+                if position > end:
+                    # End a torn final line so it does not swallow the first new entry
+                    user_lines.insert(0, b"\n")
+                    count += 1
+                f.write(b"".join(user_lines))
+            first_ids[user_id] = count + 1
+            ends = []
+            for line in user_lines:
+                position += len(line)
+                ends.append(position)
+            with open(self._index_path(user_id), "ab") as f:
+                f.write(b"".join(_LINE_END.pack(offset) for offset in ends))
+
+        # Ids are line numbers, given out in order within each user's log
+        ids = []
+        for user_id, _ in entries:
+            ids.append(first_ids[user_id])
+            first_ids[user_id] += 1
+        return ids
+
+    def has_history(self, user_id: str) -> bool:
+        return os.path.exists(self._path(user_id))
+
+    def page(self, user_id: str, before: Optional[int] = None, after: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        count, _ = self._sync_index(user_id)
+        last = min(count, before - 1) if before is not None else count
+        if after is not None:
+            first, last = after + 1, min(last, after + limit)
+        else:
+            first = max(1, last - limit + 1)
+        if not limit or first > last:
+            return []
+        start = self._line_end(user_id, first - 1)
+        with open(self._path(user_id), "rb") as f:
+            f.seek(start)
+            data = f.read(self._line_end(user_id, last) - start)
+
+        entries = []
+        for id, line in enumerate(data.splitlines(), first):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping corrupt history line for user {user_id}")
+                continue
+            entries.append(_to_page_entry(id, entry["type"], entry["message"], entry.get("source")))
+        return entries
+
+    def last_id(self, user_id: str) -> int:
+        return self._sync_index(user_id)[0]
+
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        try:
+            with open(self._summary_path(user_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def set_summary(self, user_id: str, summary: str, through_id: int):
+        current = self.get_summary(user_id)
+        if current is not None and current["through_id"] >= through_id:
+            return
+        path = self._summary_path(user_id)
+        # Write a sibling file and rename it over the old one, so readers never see half a summary
+        with open(path + ".tmp", "w") as f:
+            json.dump({"summary": summary, "through_id": through_id}, f)
+        os.replace(path + ".tmp", path)
+
+HISTORY_BACKENDS = {
+    "sqlite": SQLiteHistoryStore,
+    "jsonl": JSONLHistoryStore
+}
+
+def create_history_store(backend: str = HISTORY_BACKEND, path: str = None) -> HistoryStore:
+    """Create the configured history backend"""
+    if backend not in HISTORY_BACKENDS:
+        raise ValueError(f"Unknown history backend: {backend}")
+    path = path or os.getenv("HISTORY_PATH") or HISTORY_PATHS[backend]
+    return HISTORY_BACKENDS[backend](path)
+
+def migrate_json_history(json_path: str, store: HistoryStore) -> Tuple[int, int]:
+    """Copy histories from the legacy single-file JSON store into a history store.
+
+    Users that already have entries in the target store are skipped, so the
+    migration can be re-run safely. Returns (users migrated, entries migrated).
+    """
+    with open(json_path, "r") as f:
+        histories = json.load(f)
+
+    users = entries = 0
+    for user_id, history in histories.items():
+        if store.has_history(user_id):
+            logger.info(f"Skipping user {user_id}: history already migrated")
+            continue
+        store.append_many([(user_id, entry) for entry in history])
+        users += 1
+        entries += len(history)
+    logger.info(f"Migrated {entries} entries for {users} users from {json_path}")
+    return users, entries
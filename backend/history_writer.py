@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+from .history_store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+# Most appends written in a single flush
+MAX_BATCH = int(os.getenv("HISTORY_WRITE_BATCH", "500"))
+
+class HistoryWriter:
+    """Single writer task that serializes and batches history appends.
+
+    Handlers enqueue appends and wait for them to be flushed. The writer
+    drains everything pending into one store transaction, so concurrent
+    requests neither interleave partial writes nor pay for a commit each.
+    Entries are flushed in the order they were enqueued, which keeps every
+    user's history in order.
+    """
+
+    def __init__(self, store: HistoryStore, max_batch: int = MAX_BATCH):
+        self.store = store
+        self.max_batch = max_batch
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.appends = 0
+        self.flushes = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def append(self, user_id: str, entry: Dict) -> Optional[int]:
+        """Append an entry and wait until it has been written; returns its id if the store assigns one"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((user_id, entry, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                # Keep the blocking store write off the event loop
+                ids = await asyncio.to_thread(self.store.append_many, [(user_id, entry) for user_id, entry, _ in batch])
+            except Exception as e:
+                logger.error(f"Error flushing {len(batch)} history entries: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for i, (_, _, future) in enumerate(batch):
+                    if not future.done():
+                        future.set_result(ids[i] if ids else None)
+                self.appends += len(batch)
+                self.flushes += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    async def close(self):
+        """Flush pending appends and stop the writer task"""
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        self._task = None
+
+    def stats(self) -> Dict:
+        """Get append and flush counters"""
+        return {
+            "appends": self.appends,
+            "flushes": self.flushes,
+            "pending": self._queue.qsize() if self._queue is not None else 0
+        }
@@ -1,15 +1,42 @@
-from fastapi import FastAPI, HTTPException, status, Request, Depends
+from fastapi import FastAPI, HTTPException, status, Request, Depends, Query, Response
 import logging
 from dotenv import load_dotenv
-from typing import Dict, Optional, List
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, Literal, Optional, List
 from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import os
+import asyncio
+import datetime
+import hashlib
 import json
-import google.generativeai as genai
-import openai
-import requests
+import math
+import socket
+from contextlib import asynccontextmanager
+import importlib
+from functools import partial
+from .ai_services import AIServices
+from .clients import ClientRegistry, GeminiClient, GrokClient
+from .compaction import HistoryCompactor, extractive_summary, summary_prompt
+from .context_builder import DEFAULT_MODEL_LIMITS, build_context, prompt_tokens
+from .fanout import STATUS_OK, STATUS_RATE_LIMITED, STATUS_SKIPPED, fan_out, fan_out_stream, race, run_batch
+from .feedback_store import FeedbackStore
+from .history_cache import HistoryCache
+from .history_store import create_history_store, search_terms
+from .history_writer import HistoryWriter
+from .metrics import MetricsRegistry
+from .rate_limiter import DEFAULT_CONCURRENCY, RateLimitExceeded, RateLimiterRegistry, key_fingerprint
+from .resilience import CircuitBreakerRegistry, CircuitOpenError, HedgeBudget, retry_async
+from .response_cache import CACHE_DB, ResponseCache
+from .router import AUTO_MODEL, ROUTER_FEEDBACK_WINDOW, ROUTER_LOG_SIZE, ModelRouter
+from .provider_io import close_http_client
+from .sessions import ChatSessionManager
+from .shared_state import SharedState
+from .single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    import openai
 
 # Configure logging
 logging.basicConfig(
@@ -22,6 +49,41 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 logger.info("Environment variables loaded")
 
+# Worker processes serving the app; uvicorn --workers and gunicorn -w both
+# read WEB_CONCURRENCY. With more than one, cross-process state goes through
+# SQLite (history, feedback, credentials, response cache and metrics)
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+# How often each worker publishes its provider metrics for the others
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+# Workers that have not published for this long drop out of the totals
+METRICS_RETENTION = float(os.getenv("METRICS_RETENTION", "86400"))
+# On-disk response cache shared by workers when RESPONSE_CACHE_DB is unset
+SHARED_CACHE_DB = "data/response_cache.db"
+# Default and largest page sizes for GET /api/history
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "1000"))
+# Default and largest page sizes for GET /api/history/search
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+# Hedged chat waits this latency percentile of a model before trying the next;
+# until a model has HEDGE_MIN_SAMPLES successes HEDGE_DEFAULT_DELAY is used
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+# Most recent history entries loaded as provider context, after the rolling summary
+HISTORY_CONTEXT_ENTRIES = int(os.getenv("HISTORY_CONTEXT_ENTRIES", "200"))
+# "provider/model" that writes the rolling history summaries, e.g. "gemini/gemini-pro";
+# unset (or without a key) the local extractive summarizer is used
+COMPACTION_MODEL = os.getenv("COMPACTION_MODEL", "")
+COMPACTION_API_KEY = os.getenv("COMPACTION_API_KEY")
+# Concurrent calls per provider for /api/chat/batch, capped by each model's max_concurrency
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Providers whose SDK and default client are set up in the background at
+# start-up, comma separated; "configured" means those with a default key.
+# Anything not pre-warmed is imported on its first request
+PREWARM_PROVIDERS = os.getenv("PREWARM_PROVIDERS", "configured")
+
 # Default API keys for testing (replace with your test keys)
 DEFAULT_KEYS = {
     "gemini": os.getenv("GEMINI_API_KEY"),  # Free tier Gemini key
@@ -29,24 +91,169 @@ DEFAULT_KEYS = {
     "grok": None    # No default key for paid service
 }
 
-# Model configurations
+# Model configurations; "limits" give each model's context window and the
+# tokens reserved for its reply, used to budget conversation history, plus
+# the request rate and concurrency allowed per API key. "prices" are list
+# prices in USD per 1K input/output tokens, used for cost accounting
 MODEL_CONFIGS = {
     "gemini": {
         "free": "gemini-pro",  # Actually free with quota
-        "paid": None  # No paid tier needed for demo
+        "paid": None,  # No paid tier needed for demo
+        "timeout": float(os.getenv("GEMINI_TIMEOUT", "30")),  # Seconds before the response is given up on
+        "limits": {
+            "gemini-pro": {"context_window": 32760, "reserved_output": 2048, "rpm": 60, "max_concurrency": 8}
+        },
+        "prices": {
+            "gemini-pro": {"input": 0.000125, "output": 0.000375}
+        }
     },
     "openai": {
         "free": "gpt-3.5-turbo",  # Not actually free
-        "paid": "gpt-4"
+        "paid": "gpt-4",
+        "timeout": float(os.getenv("OPENAI_TIMEOUT", "30")),
+        "limits": {
+            "gpt-3.5-turbo": {"context_window": 16385, "reserved_output": 1024, "rpm": 3500, "max_concurrency": 32},
+            "gpt-4": {"context_window": 8192, "reserved_output": 1024, "rpm": 500, "max_concurrency": 16}
+        },
+        "prices": {
+            "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015},
+            "gpt-4": {"input": 0.03, "output": 0.06}
+        }
     },
     "grok": {
         "free": "grok-1",  # Requires X Premium
-        "paid": "grok-2"
+        "paid": "grok-2",
+        "timeout": float(os.getenv("GROK_TIMEOUT", "30")),
+        "limits": {
+            "grok-1": {"context_window": 8192, "reserved_output": 1024, "rpm": 60, "max_concurrency": 8},
+            "grok-2": {"context_window": 131072, "reserved_output": 4096, "rpm": 60, "max_concurrency": 8}
+        },
+        "prices": {
+            "grok-1": {"input": 0.005, "output": 0.015},
+            "grok-2": {"input": 0.002, "output": 0.01}
+        }
     }
 }
 
+# Provider endpoints, overridable to point at proxies or local mock servers
+PROVIDER_ENDPOINTS = {
+    "gemini": os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"),
+    "openai": os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    "grok": os.getenv("GROK_BASE_URL", "https://api.grok.x.com/v1")
+}
+
+# Provider clients reused across requests, one per (provider, api_key, model)
+provider_clients = ClientRegistry()
+
+# Each user's context window per provider and model, carried between turns
+chat_sessions = ChatSessionManager()
+
+# Cache of provider responses for repeated prompts (see RESPONSE_CACHE_* settings);
+# with several workers the on-disk tier lets them share cached answers
+response_cache = ResponseCache(disk_path=CACHE_DB or (SHARED_CACHE_DB if WORKERS > 1 else None))
+
+# Per (provider, api_key, model) request queues that keep us under quota
+rate_limiters = RateLimiterRegistry(MODEL_CONFIGS, workers=WORKERS)
+
+# Identical provider calls in flight at once share one upstream request
+provider_calls = SingleFlight()
+
+# Per (provider, api_key) breakers that skip providers that keep failing
+circuit_breakers = CircuitBreakerRegistry()
+
+# Latency, token, error and cost metrics per (provider, model), for this process
+provider_metrics = MetricsRegistry(MODEL_CONFIGS)
+
+# Extra calls hedged chat requests may make (see HEDGE_BUDGET)
+hedge_budget = HedgeBudget()
+
+# State shared by every worker process (see STATE_DB)
+shared_state = SharedState()
+
+def publish_metrics():
+    """Publish this worker's provider metrics for the other workers to read"""
+    shared_state.set("metrics", f"{socket.gethostname()}:{os.getpid()}", provider_metrics.state())
+
+async def _publish_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+        try:
+            await asyncio.to_thread(publish_metrics)
+        except Exception as e:
+            logger.error(f"Error publishing metrics: {e}")
+
+def cluster_metrics() -> MetricsRegistry:
+    """Provider metrics of every worker process, or of this one when it runs alone"""
+    if WORKERS == 1:
+        return provider_metrics
+    publish_metrics()
+    states = shared_state.items("metrics", max_age=METRICS_RETENTION)
+    return MetricsRegistry.merged(MODEL_CONFIGS, list(states.values()))
+
+# Errors raised before a provider is called; reported with a retry hint by fan-out
+SHED_ERRORS = (RateLimitExceeded, CircuitOpenError)
+
+def _make_gemini_client(api_key: str, model: str) -> GeminiClient:
+    return GeminiClient(api_key, model, PROVIDER_ENDPOINTS["gemini"])
+
+def _make_openai_client(api_key: str, model: str) -> "openai.AsyncOpenAI":
+    # Imported on first use; the SDK takes longer to load than the rest of the app
+    import openai
+    # Retries are handled by our own resilience layer
+    return openai.AsyncOpenAI(api_key=api_key, base_url=PROVIDER_ENDPOINTS["openai"], max_retries=0)
+
+def _make_grok_client(api_key: str, model: str) -> GrokClient:
+    return GrokClient(api_key, model, PROVIDER_ENDPOINTS["grok"])
+
+CLIENT_FACTORIES = {"gemini": _make_gemini_client, "openai": _make_openai_client, "grok": _make_grok_client}
+# SDK modules behind each provider's client; Gemini and Grok use the shared HTTP client
+PROVIDER_SDKS = {"openai": "openai"}
+
+def prewarm_targets() -> List[str]:
+    """Providers named by PREWARM_PROVIDERS"""
+    if PREWARM_PROVIDERS.strip() == "configured":
+        return [provider for provider in MODEL_CONFIGS if DEFAULT_KEYS.get(provider)]
+    return [provider for provider in (p.strip() for p in PREWARM_PROVIDERS.split(",")) if provider in MODEL_CONFIGS]
+
+async def prewarm_providers(providers: List[str]):
+    """Import the providers' SDKs and build their default clients before the first chat needs them"""
+    for provider in providers:
+        try:
+            sdk = PROVIDER_SDKS.get(provider)
+            if sdk is not None:
+                # Off the event loop so requests are served while it loads
+                await asyncio.to_thread(importlib.import_module, sdk)
+            api_key = DEFAULT_KEYS.get(provider)
+            if api_key:
+                provider_clients.get(provider, api_key, MODEL_CONFIGS[provider]["free"], CLIENT_FACTORIES[provider])
+            logger.info(f"Pre-warmed {provider}")
+        except Exception as e:
+            logger.error(f"Error pre-warming {provider}: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Publish metrics while running; release clients, connections and storage on shutdown"""
+    publisher = asyncio.create_task(_publish_metrics_periodically()) if WORKERS > 1 else None
+    compactor = asyncio.create_task(history_compactor.run())
+    # Readiness does not wait for pre-warming
+    prewarm = asyncio.create_task(prewarm_providers(prewarm_targets()))
+    yield
+    prewarm.cancel()
+    compactor.cancel()
+    if publisher is not None:
+        publisher.cancel()
+        publish_metrics()
+    await provider_clients.aclose()
+    await close_http_client()
+    await history_writer.close()
+    history_store.close()
+    await feedback_writer.close()
+    feedback_store.close()
+    shared_state.close()
+    response_cache.close()
+
 # Create FastAPI app
-app = FastAPI(title="Multi-Chatbot Interface")
+app = FastAPI(title="Multi-Chatbot Interface", lifespan=lifespan)
 logger.info("FastAPI application created")
 
 # Create directories if they don't exist
@@ -58,29 +265,61 @@ os.makedirs("data", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# Store conversation history
-history_file = "data/conversation_history.json"
+# Feedback persisted with running tallies (see FEEDBACK_DB); inserts from the
+# feedback endpoint are batched by a writer task like history appends
+feedback_store = FeedbackStore()
+feedback_writer = HistoryWriter(feedback_store)
+
+# Picks the model per request for providers set to "auto" (see ROUTER_* settings)
+model_router = ModelRouter(
+    MODEL_CONFIGS,
+    feedback=lambda provider, model: feedback_store.window(ROUTER_FEEDBACK_WINDOW, provider, model)
+)
+
+# Shared AI services instance used by the feedback and metrics endpoints
+ai_services = AIServices(metrics=provider_metrics, feedback_store=feedback_store)
+
+def get_ai_service() -> AIServices:
+    """Dependency returning the shared AIServices instance"""
+    return ai_services
+
+# Store conversation history (backend chosen by HISTORY_BACKEND / HISTORY_PATH)
+history_store = create_history_store()
+# All appends go through one writer task that batches them into single flushes
+history_writer = HistoryWriter(history_store)
+# Active users' conversations kept in memory (see HISTORY_CACHE_* settings)
+history_cache = HistoryCache(history_store, max_entries=HISTORY_CONTEXT_ENTRIES)
 
 def load_history(user_id: str) -> list:
-    """Load conversation history for a user"""
-    try:
-        with open(history_file, 'r') as f:
-            histories = json.load(f)
-            return histories.get(user_id, [])
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-def save_history(user_id: str, history: list):
-    """Save conversation history for a user"""
-    try:
-        with open(history_file, 'r') as f:
-            histories = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        histories = {}
-    
-    histories[user_id] = history
-    with open(history_file, 'w') as f:
-        json.dump(histories, f)
+    """Load the conversation providers see: the rolling summary of older turns, then the entries after it"""
+    return history_cache.load(user_id)
+
+async def append_history(user_id: str, entry: Dict):
+    """Append an entry to a user's conversation history, writing it through the cache to the store"""
+    with history_cache.writing(user_id):
+        entry_id = await history_writer.append(user_id, entry)
+        history_cache.append(user_id, entry, entry_id)
+    history_compactor.mark(user_id)
+
+async def summarize_history(previous: Optional[str], turns: List[Dict]) -> str:
+    """Fold turns into a rolling summary with COMPACTION_MODEL, or locally if it is unset or fails"""
+    if COMPACTION_MODEL:
+        provider, _, model = COMPACTION_MODEL.partition("/")
+        api_key = COMPACTION_API_KEY or DEFAULT_KEYS.get(provider)
+        if provider in PROVIDER_HANDLERS and api_key:
+            try:
+                async with asyncio.timeout(MODEL_CONFIGS[provider]["timeout"]):
+                    return await PROVIDER_HANDLERS[provider](
+                        summary_prompt(previous, turns), [], api_key, model or MODEL_CONFIGS[provider]["free"],
+                        use_cache=False, raise_errors=True
+                    )
+            except Exception as e:
+                logger.warning(f"Summarizing with {COMPACTION_MODEL} failed, using the local summarizer: {e}")
+    return extractive_summary(previous, turns)
+
+# Folds older turns of long histories into a rolling summary in the background
+# Compacted conversations are read again on their next turn
+history_compactor = HistoryCompactor(history_store, summarize_history, on_compact=lambda user_id: history_cache.invalidate(user_id))
 
 # Pydantic models
 class ServiceKeys(BaseModel):
@@ -94,6 +333,10 @@ class ChatMessage(BaseModel):
     message: str
     user_id: str
     service_keys: ServiceKeys
+    use_cache: bool = True  # Set to False to always query the providers
+    # "race" and "hedged" return only the first good answer (see /api/chat)
+    mode: Literal["all", "race", "hedged"] = "all"
+    candidates: Optional[List[str]] = None  # "provider/model" entries to race; defaults to the selected models
 
 class HistoryEntry(BaseModel):
     type: str
@@ -101,106 +344,393 @@ class HistoryEntry(BaseModel):
     source: Optional[str] = None
     user_id: str
 
-async def get_gemini_response(message: str, history: List[Dict], api_key: str, model: str) -> str:
+class BatchPrompt(BaseModel):
+    id: str
+    message: str
+    history: List[Dict] = []  # Earlier turns ({"type", "message"}) sent as context
+    providers: Optional[List[str]] = None  # Defaults to every configured service
+
+class BatchRequest(BaseModel):
+    service_keys: ServiceKeys
+    prompts: List[BatchPrompt]
+    use_cache: bool = False
+    concurrency: Optional[int] = None  # Per provider; defaults to BATCH_CONCURRENCY
+
+def _context_turns(provider: str, model: str, message: str, history: List[Dict], user_id: Optional[str] = None) -> List[Dict]:
+    """Most recent conversation turns that fit the model's token budget, kept between a user's turns"""
+    limits = MODEL_CONFIGS[provider]["limits"].get(model, DEFAULT_MODEL_LIMITS)
+    if user_id is None:
+        return build_context(history, message, limits)
+    return chat_sessions.context(user_id, provider, model, limits, history, message)
+
+def _route(service: str, model: str, api_key: Optional[str], message: str, history: List[Dict], user_id: Optional[str] = None) -> str:
+    """The model to call; AUTO_MODEL is resolved by the router from the signals at this moment"""
+    if model != AUTO_MODEL:
+        return model
+    api_key = api_key or DEFAULT_KEYS[service]
+    signals = {}
+    for candidate in model_router.candidates(service):
+        signals[candidate] = provider_metrics.recent(service, candidate)
+        signals[candidate]["headroom"] = rate_limiters.headroom(service, api_key, candidate)
+    return model_router.choose(service, signals, prompt_tokens(message, history), user_id)
+
+def _speaker(entry: Dict) -> str:
+    if entry["type"] == "summary":
+        return "Summary of the earlier conversation"
+    return "User" if entry["type"] == "user" else "Assistant"
+
+def _gemini_prompt(message: str, context: List[Dict]) -> str:
+    """Format conversation for context"""
+    lines = ["Previous conversation:"]
+    lines.extend(f"{_speaker(entry)}: {entry['message']}" for entry in context)
+    lines.extend(["", f"User: {message}", "Assistant:"])
+    return "\n".join(lines)
+
+def _openai_messages(message: str, context: List[Dict]) -> List[Dict]:
+    """Format conversation history for OpenAI"""
+    messages = [
+        {"role": "system", "content": f"Summary of the earlier conversation: {entry['message']}"}
+        if entry["type"] == "summary" else
+        {"role": "user" if entry["type"] == "user" else "assistant", "content": entry["message"]}
+        for entry in context
+    ]
+    messages.append({"role": "user", "content": message})
+    return messages
+
+def _grok_messages(message: str, context: List[Dict]) -> List[Dict]:
+    """Format conversation history for Grok"""
+    lines = [f"{_speaker(entry)}: {entry['message']}" for entry in context]
+    lines.append(f"User: {message}")
+    return [{"role": "user", "content": "\n".join(lines)}]
+
+async def _call_provider(
+    provider: str,
+    api_key: str,
+    model: str,
+    message: str,
+    context: List[Dict],
+    call: Callable[[], Awaitable[str]],
+    use_cache: bool
+) -> str:
+    """Make an upstream provider call behind the response cache, circuit breaker and rate limiter.
+
+    Requests for the same provider, model, prompt and context that arrive
+    while such a call is in flight join it instead of making their own;
+    if it fails, those using a different API key make their own after all.
+    Transient failures are retried with backoff; each attempt takes its own
+    rate limiter slot.
+    """
+    key = ResponseCache.make_key(provider, model, message, context)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            logger.debug(f"Response cache hit for {provider}/{model}")
+            provider_metrics.record_cache_hit(provider, model)
+            return cached
+
+    async def attempt() -> str:
+        async with rate_limiters.slot(provider, api_key, model):
+            return await call()
+
+    async def upstream() -> str:
+        with provider_metrics.track(provider, model, prompt_tokens(message, context)) as tracked:
+            async with circuit_breakers.guard(provider, api_key):
+                response = await retry_async(attempt)
+            tracked.add_output(response)
+        if use_cache:
+            response_cache.set(key, response)
+        return response
+
+    if key in provider_calls:
+        logger.debug(f"Joining the {provider}/{model} call already in flight")
+        provider_metrics.record_coalesced(provider, model)
+    # Callers with other keys share only a success, not this key's failures
+    return await provider_calls.do(key, upstream, owner=key_fingerprint(api_key))
+
+async def get_gemini_response(
+    message: str,
+    history: List[Dict],
+    api_key: str,
+    model: str,
+    use_cache: bool = True,
+    raise_errors: bool = False,
+    user_id: Optional[str] = None
+) -> str:
     try:
         # Use default key if none provided
         api_key = api_key or DEFAULT_KEYS["gemini"]
         if not api_key:
             return "Please configure a valid Gemini API key"
 
-        genai.configure(api_key=api_key)
-        model_instance = genai.GenerativeModel(model)
-        
-        # Format conversation for context
-        context = "Previous conversation:\n"
-        for entry in history[-5:]:
-            role = "User" if entry["type"] == "user" else "Assistant"
-            context += f"{role}: {entry['message']}\n"
-        
-        prompt = f"{context}\nUser: {message}\nAssistant:"
+        client = provider_clients.get("gemini", api_key, model, _make_gemini_client)
+        context = _context_turns("gemini", model, message, history, user_id)
         
         try:
-            response = await model_instance.generate_content_async(prompt)
-            return response.text
+            return await _call_provider(
+                "gemini", api_key, model, message, context,
+                partial(client.generate, _gemini_prompt(message, context)),
+                use_cache
+            )
+        except SHED_ERRORS:
+            raise
         except Exception as e:
             error_msg = str(e)
-            if "quota" in error_msg.lower():
+            if not raise_errors and ("quota" in error_msg.lower() or "429" in error_msg):
                 return "Free tier quota reached. Please try again later or use your own API key."
             raise e
             
+    except SHED_ERRORS:
+        # Shed before reaching the provider; reported with a retry hint by fan-out
+        raise
     except Exception as e:
+        if raise_errors:
+            # Racing callers need to tell failures from answers
+            raise
         logger.error(f"Error with Gemini: {e}")
         error_msg = str(e)
         if "quota" in error_msg.lower() or "billing" in error_msg.lower():
             return "Rate limit reached. Please try again later or use your own API key."
         return f"Error with Gemini: {error_msg}"
 
-async def get_openai_response(message: str, history: List[Dict], api_key: str, model: str) -> str:
+async def get_openai_response(
+    message: str,
+    history: List[Dict],
+    api_key: str,
+    model: str,
+    use_cache: bool = True,
+    raise_errors: bool = False,
+    user_id: Optional[str] = None
+) -> str:
     try:
         # Use default key if none provided
         api_key = api_key or DEFAULT_KEYS["openai"]
         if not api_key or api_key == "YOUR_TEST_OPENAI_KEY":
             return "Please configure a valid OpenAI API key"
 
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Format conversation history for OpenAI
-        messages = []
-        for entry in history[-5:]:
-            role = "user" if entry["type"] == "user" else "assistant"
-            messages.append({"role": role, "content": entry["message"]})
-        messages.append({"role": "user", "content": message})
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages
-        )
-        return response.choices[0].message.content
+        client = provider_clients.get("openai", api_key, model, _make_openai_client)
+        context = _context_turns("openai", model, message, history, user_id)
+
+        async def complete() -> str:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=_openai_messages(message, context)
+            )
+            return response.choices[0].message.content
+
+        return await _call_provider("openai", api_key, model, message, context, complete, use_cache)
+    except SHED_ERRORS:
+        # Shed before reaching the provider; reported with a retry hint by fan-out
+        raise
     except Exception as e:
+        if raise_errors:
+            # Racing callers need to tell failures from answers
+            raise
         logger.error(f"Error with OpenAI: {e}")
         error_msg = str(e)
         if "429" in str(e) or "quota" in error_msg.lower() or "rate" in error_msg.lower():
             return "Rate limit reached. Please try again later or use your own API key."
         return f"Error with OpenAI: {error_msg}"
 
-async def get_grok_response(message: str, history: List[Dict], api_key: str, model: str) -> str:
+async def get_grok_response(
+    message: str,
+    history: List[Dict],
+    api_key: str,
+    model: str,
+    use_cache: bool = True,
+    raise_errors: bool = False,
+    user_id: Optional[str] = None
+) -> str:
     try:
         # Use default key if none provided
         api_key = api_key or DEFAULT_KEYS["grok"]
         if not api_key or api_key == "YOUR_TEST_GROK_KEY":
             return "Please configure a valid Grok API key"
 
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Format conversation history
-        context = "\n".join([
-            f"{'User' if entry['type'] == 'user' else 'Assistant'}: {entry['message']}"
-            for entry in history[-5:]
-        ])
-        
-        data = {
-            "messages": [{"role": "user", "content": f"{context}\nUser: {message}"}],
-            "model": model
-        }
-        
-        # Replace with actual Grok API endpoint
-        response = requests.post(
-            "https://api.grok.x.com/v1/chat/completions",
-            headers=headers,
-            json=data
+        client = provider_clients.get("grok", api_key, model, _make_grok_client)
+        context = _context_turns("grok", model, message, history, user_id)
+        return await _call_provider(
+            "grok", api_key, model, message, context,
+            partial(client.complete, _grok_messages(message, context)),
+            use_cache
         )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+    except SHED_ERRORS:
+        # Shed before reaching the provider; reported with a retry hint by fan-out
+        raise
     except Exception as e:
+        if raise_errors:
+            # Racing callers need to tell failures from answers
+            raise
         logger.error(f"Error with Grok: {e}")
         error_msg = str(e)
         if "429" in str(e) or "quota" in error_msg.lower():
             return "Rate limit reached. Please try again later or use your own API key."
         return f"Error with Grok: {error_msg}"
 
+async def stream_gemini_response(
+    message: str,
+    history: List[Dict],
+    api_key: str,
+    model: str,
+    user_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Stream a Gemini response chunk by chunk"""
+    api_key = api_key or DEFAULT_KEYS["gemini"]
+    if not api_key:
+        yield "Please configure a valid Gemini API key"
+        return
+
+    client = provider_clients.get("gemini", api_key, model, _make_gemini_client)
+    context = _context_turns("gemini", model, message, history, user_id)
+    with provider_metrics.track("gemini", model, prompt_tokens(message, context)) as tracked:
+        async with circuit_breakers.guard("gemini", api_key), rate_limiters.slot("gemini", api_key, model):
+            async for text in client.stream(_gemini_prompt(message, context)):
+                tracked.add_output(text)
+                yield text
+
+async def stream_openai_response(
+    message: str,
+    history: List[Dict],
+    api_key: str,
+    model: str,
+    user_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Stream an OpenAI response chunk by chunk"""
+    api_key = api_key or DEFAULT_KEYS["openai"]
+    if not api_key or api_key == "YOUR_TEST_OPENAI_KEY":
+        yield "Please configure a valid OpenAI API key"
+        return
+
+    client = provider_clients.get("openai", api_key, model, _make_openai_client)
+    context = _context_turns("openai", model, message, history, user_id)
+    with provider_metrics.track("openai", model, prompt_tokens(message, context)) as tracked:
+        async with circuit_breakers.guard("openai", api_key), rate_limiters.slot("openai", api_key, model):
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=_openai_messages(message, context),
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    tracked.add_output(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+
+async def stream_grok_response(
+    message: str,
+    history: List[Dict],
+    api_key: str,
+    model: str,
+    user_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Stream a Grok response chunk by chunk"""
+    api_key = api_key or DEFAULT_KEYS["grok"]
+    if not api_key or api_key == "YOUR_TEST_GROK_KEY":
+        yield "Please configure a valid Grok API key"
+        return
+
+    client = provider_clients.get("grok", api_key, model, _make_grok_client)
+    context = _context_turns("grok", model, message, history, user_id)
+    with provider_metrics.track("grok", model, prompt_tokens(message, context)) as tracked:
+        async with circuit_breakers.guard("grok", api_key), rate_limiters.slot("grok", api_key, model):
+            async for text in client.stream(_grok_messages(message, context)):
+                tracked.add_output(text)
+                yield text
+
+PROVIDER_HANDLERS = {
+    "gemini": get_gemini_response,
+    "openai": get_openai_response,
+    "grok": get_grok_response
+}
+
+PROVIDER_STREAMS = {
+    "gemini": stream_gemini_response,
+    "openai": stream_openai_response,
+    "grok": stream_grok_response
+}
+
+def _provider_calls(message: ChatMessage, history: List[Dict], handlers: Dict[str, Callable], **options) -> Dict[str, Callable]:
+    """Bind the message (and any handler options) to a handler for every configured service"""
+    calls = {}
+    for service, handler in handlers.items():
+        api_key = getattr(message.service_keys, service)
+        if api_key or DEFAULT_KEYS[service]:
+            calls[service] = partial(
+                handler,
+                message.message,
+                history,
+                api_key,
+                _route(service, message.service_keys.models[service], api_key, message.message, history, message.user_id),
+                user_id=message.user_id,
+                **options
+            )
+    return calls
+
+def _race_calls(message: ChatMessage, history: List[Dict]) -> Dict[str, Callable]:
+    """Bind a handler call, raising on failure, for every candidate "provider/model" that has a key"""
+    candidates = message.candidates or [f"{service}/{model}" for service, model in message.service_keys.models.items()]
+    calls = {}
+    for candidate in candidates:
+        service, _, model = candidate.partition("/")
+        if service not in PROVIDER_HANDLERS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown provider: {service}")
+        model = model or message.service_keys.models.get(service) or MODEL_CONFIGS[service]["free"]
+        api_key = getattr(message.service_keys, service)
+        if api_key or DEFAULT_KEYS[service]:
+            model = _route(service, model, api_key, message.message, history, message.user_id)
+            calls[f"{service}/{model}"] = partial(
+                PROVIDER_HANDLERS[service],
+                message.message,
+                history,
+                api_key,
+                model,
+                use_cache=message.use_cache,
+                raise_errors=True,
+                user_id=message.user_id
+            )
+    return calls
+
+def _hedge_delay(candidate: str) -> float:
+    """How long a hedged request waits on a candidate before starting the next"""
+    provider, model = candidate.split("/", 1)
+    latency = provider_metrics.latency_percentile(provider, model, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    if latency is None:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, latency)
+
+async def _race_chat(message: ChatMessage, history: List[Dict]) -> Dict:
+    """Answer with the first candidate to succeed, racing them all or hedging one after another"""
+    calls = _race_calls(message, history)
+    timeouts = {name: MODEL_CONFIGS[name.split("/", 1)[0]]["timeout"] for name in calls}
+    if message.mode == "hedged":
+        delays = {name: _hedge_delay(name) for name in calls}
+        if not message.candidates:
+            # Try the models that usually answer fastest first
+            calls = dict(sorted(calls.items(), key=lambda item: delays[item[0]]))
+        outcome = await race(calls, timeouts, hedge_delays=delays, budget=hedge_budget)
+    else:
+        outcome = await race(calls, timeouts)
+
+    results = outcome["results"]
+    if results and all(result["status"] == STATUS_RATE_LIMITED for result in results.values()):
+        retry_after = min(result["retry_after"] for result in results.values())
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="All providers are over their rate limits. Please try again later.",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+    winner = outcome["winner"]
+    answer = {"mode": message.mode, "winner": winner, "hedged": outcome["hedged"], "attempts": results}
+    if winner is None:
+        answer.update({"status": "error", "response": "No provider returned an answer. Please try again later."})
+    else:
+        answer.update({
+            "provider": winner.split("/", 1)[0],
+            "status": STATUS_OK,
+            "response": results[winner]["response"],
+            "latency": results[winner]["latency"]
+        })
+    return answer
+
 @app.get("/")
 async def home(request: Request):
     """Serve the home page"""
@@ -208,78 +738,276 @@ async def home(request: Request):
 
 @app.post("/api/chat")
 async def chat(message: ChatMessage):
-    """Send message to all configured AI services"""
+    """Send message to all configured AI services, or race them for the first good answer"""
     # Load conversation history
     history = load_history(message.user_id)
-    history.append({
+    user_entry = {
         "type": "user",
         "message": message.message
-    })
-    
-    responses = {}
+    }
+
+    if message.mode != "all":
+        answer = await _race_chat(message, history)
+        await append_history(message.user_id, user_entry)
+        return answer
     
-    # Get responses from each configured service
-    if message.service_keys.gemini or DEFAULT_KEYS["gemini"]:
-        responses["gemini"] = await get_gemini_response(
-            message.message, 
-            history, 
-            message.service_keys.gemini,
-            message.service_keys.models["gemini"]
+    # Query every configured service concurrently, each under its own deadline
+    calls = _provider_calls(message, history, PROVIDER_HANDLERS, use_cache=message.use_cache)
+    responses = await fan_out(
+        calls,
+        timeouts={service: MODEL_CONFIGS[service]["timeout"] for service in calls}
+    )
+
+    # Every provider was shed by its limiter, so fail fast with a retry hint
+    if responses and all(result["status"] == STATUS_RATE_LIMITED for result in responses.values()):
+        retry_after = min(result["retry_after"] for result in responses.values())
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="All providers are over their rate limits. Please try again later.",
+            headers={"Retry-After": str(math.ceil(retry_after))}
         )
     
-    if message.service_keys.openai or DEFAULT_KEYS["openai"]:
-        responses["openai"] = await get_openai_response(
-            message.message, 
-            history, 
-            message.service_keys.openai,
-            message.service_keys.models["openai"]
+    await append_history(message.user_id, user_entry)
+    return responses
+
+@app.post("/api/chat/stream")
+async def chat_stream(message: ChatMessage):
+    """Stream responses from all configured AI services as Server-Sent Events"""
+    history = load_history(message.user_id)
+    user_entry = {
+        "type": "user",
+        "message": message.message
+    }
+    streams = _provider_calls(message, history, PROVIDER_STREAMS)
+    await append_history(message.user_id, user_entry)
+
+    async def events():
+        async for event in fan_out_stream(
+            streams,
+            timeouts={service: MODEL_CONFIGS[service]["timeout"] for service in streams}
+        ):
+            # Persist each provider's final text as soon as its stream completes
+            if event["event"] == "done" and event["status"] == STATUS_OK:
+                await append_history(message.user_id, {
+                    "type": "response",
+                    "message": event["response"],
+                    "source": event["provider"]
+                })
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/chat/batch")
+async def chat_batch(batch: BatchRequest):
+    """Run many prompts against the configured services, streaming one JSON line per prompt and provider.
+
+    Nothing is read from or written to any user's history.
+    """
+    keys = batch.service_keys
+    configured = [service for service in PROVIDER_HANDLERS if getattr(keys, service) or DEFAULT_KEYS[service]]
+    models = {service: keys.models.get(service) or MODEL_CONFIGS[service]["free"] for service in configured}
+    work = {service: [] for service in configured}
+    routed: Dict[tuple, str] = {}
+    skipped: List[tuple] = []
+
+    async def call(service: str, prompt: BatchPrompt) -> str:
+        # "auto" is routed as each prompt runs, from the signals at that moment
+        model = _route(service, models[service], getattr(keys, service), prompt.message, prompt.history)
+        routed[(prompt.id, service)] = model
+        return await PROVIDER_HANDLERS[service](
+            prompt.message,
+            prompt.history,
+            getattr(keys, service),
+            model,
+            use_cache=batch.use_cache,
+            raise_errors=True
         )
-    
-    if message.service_keys.grok or DEFAULT_KEYS["grok"]:
-        responses["grok"] = await get_grok_response(
-            message.message, 
-            history, 
-            message.service_keys.grok,
-            message.service_keys.models["grok"]
+
+    for prompt in batch.prompts:
+        for service in prompt.providers or configured:
+            if service not in PROVIDER_HANDLERS:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown provider: {service}")
+            if service in work:
+                work[service].append((prompt.id, partial(call, service, prompt)))
+            else:
+                skipped.append((prompt.id, service))
+
+    # Stay within what each model's rate limiter admits at once; routed
+    # providers are held to their free tier's limits
+    concurrency = {
+        service: min(
+            batch.concurrency or BATCH_CONCURRENCY,
+            math.ceil(MODEL_CONFIGS[service]["limits"].get(
+                MODEL_CONFIGS[service]["free"] if models[service] == AUTO_MODEL else models[service], {}
+            ).get("max_concurrency", DEFAULT_CONCURRENCY) / WORKERS)
         )
-    
-    save_history(message.user_id, history)
-    return responses
+        for service in configured
+    }
+
+    async def lines():
+        # Pairs that cannot run get a final result too, so a resumed run does
+        # not keep asking for them
+        for prompt_id, service in skipped:
+            yield json.dumps({
+                "id": prompt_id,
+                "provider": service,
+                "model": keys.models.get(service) or MODEL_CONFIGS[service]["free"],
+                "status": STATUS_SKIPPED,
+                "error": "no key",
+                "response": f"No {service.capitalize()} API key is configured.",
+                "latency": 0.0,
+                "attempts": 0
+            }) + "\n"
+        async for result in run_batch(
+            work,
+            concurrency,
+            timeouts={service: MODEL_CONFIGS[service]["timeout"] for service in configured}
+        ):
+            result["model"] = routed.get((result["id"], result["provider"]), models[result["provider"]])
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.post("/api/select_response")
 async def select_response(entry: HistoryEntry):
     """Save selected response to conversation history"""
-    history = load_history(entry.user_id)
-    history.append({
+    await append_history(entry.user_id, {
         "type": entry.type,
         "message": entry.message,
         "source": entry.source
     })
-    save_history(entry.user_id, history)
     return {"status": "success"}
 
 @app.get("/api/history")
-async def get_history(user_id: str):
-    """Get conversation history"""
-    return load_history(user_id)
+async def get_history(
+    request: Request,
+    user_id: str,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    since: Optional[int] = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE)
+):
+    """Get a page of conversation history, oldest first.
+
+    Without cursors this is the newest page; `before` pages back through
+    older entries and `after` (or `since`, for fetching only new messages)
+    pages forward. X-History-Has-More says whether the page was cut short.
+    The ETag changes whenever the user's history grows, so a matching
+    If-None-Match is answered with 304 before any entries are read.
+    """
+    after = since if since is not None else after
+    last_id = history_store.last_id(user_id)
+    etag = '"' + hashlib.sha256(f"{user_id}:{last_id}:{before}:{after}:{limit}".encode("utf-8")).hexdigest()[:16] + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    # Fetch one extra entry to learn whether another page follows
+    entries = history_store.page(user_id, before=before, after=after, limit=limit + 1)
+    has_more = len(entries) > limit
+    if has_more:
+        entries = entries[:limit] if after is not None else entries[1:]
+    return JSONResponse(entries, headers={
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-History-Has-More": "true" if has_more else "false",
+        "X-History-Last-Id": str(last_id)
+    })
+
+def _timestamp(moment: Optional[datetime.datetime]) -> Optional[float]:
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+@app.get("/api/history/search")
+async def search_history(
+    user_id: str,
+    q: str,
+    source: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0)
+):
+    """Search a user's conversation history, best matches first.
+
+    Every word of `q` must appear in an entry. `source` keeps only one
+    provider's responses and `start`/`end` bound when entries were written
+    (ISO 8601, UTC unless an offset is given). Each hit carries a snippet
+    with the matched words in brackets; X-History-Has-More says whether
+    another page follows at offset + limit.
+    """
+    if not search_terms(q):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The search query has no words")
+    try:
+        # Fetch one extra hit to learn whether another page follows
+        hits = history_store.search(
+            user_id, q, source=source, start=_timestamp(start), end=_timestamp(end), limit=limit + 1, offset=offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    has_more = len(hits) > limit
+    return JSONResponse(hits[:limit], headers={"X-History-Has-More": "true" if has_more else "false"})
 
 @app.post("/api/feedback")
 async def record_feedback(
     message_id: str,
     service: str,
     feedback: str,
-    ai_service: AIService = Depends(get_ai_service)
+    model: Optional[str] = None
 ):
     """Record user feedback for a response"""
-    ai_service.record_feedback(message_id, service, feedback)
+    await feedback_writer.append(message_id, {"service": service, "model": model, "feedback": feedback})
     return {"status": "success"}
 
+@app.get("/api/feedback/summary")
+async def get_feedback_summary(window: float = 3600, service: Optional[str] = None, model: Optional[str] = None):
+    """Get feedback counts and the negative rate over a recent window (seconds)"""
+    return feedback_store.window(window, service, model)
+
+@app.get("/api/router/decisions")
+async def get_router_decisions(provider: Optional[str] = None, limit: int = Query(50, ge=1, le=ROUTER_LOG_SIZE)):
+    """Get the most recent "auto" routing decisions of this worker, newest first.
+
+    Each decision names the model picked and why ("preferred", "fallback",
+    "all degraded" or "over cost ceiling"), with every candidate's cost,
+    rolling latency and error rate, remaining quota and feedback.
+    """
+    return model_router.recent(limit, provider)
+
 @app.get("/api/metrics")
-async def get_metrics(ai_service: AIService = Depends(get_ai_service)):
+async def get_metrics(ai_service: AIServices = Depends(get_ai_service)):
     """Get performance metrics for all services"""
-    return ai_service.get_performance_metrics()
+    registry = cluster_metrics()
+    metrics = ai_service.get_performance_metrics(registry)
+    metrics["providers"] = registry.snapshot()
+    metrics["feedback"] = feedback_store.tallies()
+    metrics["feedback_writes"] = feedback_writer.stats()
+    metrics["response_cache"] = response_cache.stats()
+    metrics["single_flight"] = provider_calls.stats()
+    metrics["history_writes"] = history_writer.stats()
+    metrics["history_cache"] = history_cache.stats()
+    metrics["chat_sessions"] = chat_sessions.stats()
+    metrics["history_compaction"] = history_compactor.stats()
+    metrics["rate_limits"] = rate_limiters.stats()
+    metrics["circuit_breakers"] = circuit_breakers.stats()
+    metrics["hedging"] = hedge_budget.stats()
+    metrics["routing"] = model_router.stats()
+    return metrics
+
+@app.get("/api/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Export provider metrics in the Prometheus text format"""
+    return PlainTextResponse(cluster_metrics().prometheus(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting server...")
-    uvicorn.run(app, host="127.0.0.1", port=8000) 
\ No newline at end of file
+    # Several workers need the app as an import string so each can load it
+    uvicorn.run("backend.main:app", host="127.0.0.1", port=8000, workers=WORKERS) 
\ No newline at end of file
@@ -0,0 +1,357 @@
+import logging
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from .context_builder import count_tokens
+from .provider_io import connection_errors, deadline_passed
+from .rate_limiter import RateLimitExceeded
+from .resilience import CircuitOpenError, error_status_code
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency and time-to-first-token buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60)
+
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+# Seconds of recent calls behind each model's rolling latency and error rate,
+# and the most calls kept for them
+ROLLING_WINDOW = float(os.getenv("METRICS_ROLLING_WINDOW", "300"))
+ROLLING_SAMPLES = int(os.getenv("METRICS_ROLLING_SAMPLES", "1000"))
+
+# Series that models missing from the model configs are counted under
+OTHER_MODEL = "other"
+
+def label_value(value: str) -> str:
+    """Escape a label value for the Prometheus text exposition format"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def error_class(error: BaseException) -> str:
+    """Coarse class of a failed provider call, used as a metrics label"""
+    if isinstance(error, RateLimitExceeded):
+        return "rate_limited"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    status = error_status_code(error)
+    if status == 429:
+        return "provider_rate_limited"
+    if status is not None:
+        return "server_error" if status >= 500 else "client_error"
+    if isinstance(error, connection_errors()):
+        return "connection"
+    return "other"
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are interpolated within a bucket.
+
+    Observing and reading are both independent of the number of samples.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        """(le, cumulative count) pairs in Prometheus bucket order"""
+        total = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            yield str(bound), total
+
+    def state(self) -> Dict:
+        return {"counts": self.counts, "sum": self.sum, "max": self.max}
+
+    def merge(self, state: Dict):
+        """Add another histogram's state (same buckets) into this one"""
+        for i, count in enumerate(state["counts"]):
+            self.counts[i] += count
+        self.count += sum(state["counts"])
+        self.sum += state["sum"]
+        self.max = max(self.max, state["max"])
+
+    def snapshot(self) -> Dict:
+        summary = {"count": self.count, "avg": round(self.sum / self.count, 4) if self.count else 0.0}
+        summary.update({name: round(self.percentile(q), 4) for name, q in PERCENTILES.items()})
+        return summary
+
+class RollingWindow:
+    """Outcomes of a model's most recent calls, for figures that follow current conditions.
+
+    Unlike the cumulative counters these forget calls older than `seconds`,
+    so a model that recovers (or degrades) shows it within one window.
+    """
+
+    def __init__(self, seconds: float = ROLLING_WINDOW, max_samples: int = ROLLING_SAMPLES):
+        self.seconds = seconds
+        # (monotonic time, latency), with None as the latency of a failed call
+        self.samples: Deque[Tuple[float, Optional[float]]] = deque(maxlen=max_samples)
+
+    def observe(self, latency: Optional[float]):
+        self.samples.append((time.monotonic(), latency))
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+
+    def summary(self) -> Dict:
+        """Calls, failures, error rate and p95 latency (None without successes) within the window"""
+        self._prune()
+        latencies = sorted(latency for _, latency in self.samples if latency is not None)
+        requests = len(self.samples)
+        errors = requests - len(latencies)
+        return {
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "p95": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 4) if latencies else None
+        }
+
+class ProviderMetrics:
+    """Running counters for one (provider, model)"""
+
+    COUNTERS = ("requests", "successes", "cache_hits", "coalesced", "input_tokens", "output_tokens", "cost")
+
+    def __init__(self):
+        self.requests = 0
+        self.successes = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.latency = Histogram()
+        self.ttft = Histogram()
+        # Kept per process; not merged across workers
+        self.recent = RollingWindow()
+
+    def state(self) -> Dict:
+        """Raw counters, for merging the metrics of several worker processes"""
+        state = {name: getattr(self, name) for name in self.COUNTERS}
+        state["errors"] = dict(self.errors)
+        state["latency"] = self.latency.state()
+        state["ttft"] = self.ttft.state()
+        return state
+
+    def merge(self, state: Dict):
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + state.get(name, 0))
+        for cls, count in state["errors"].items():
+            self.errors[cls] += count
+        self.latency.merge(state["latency"])
+        self.ttft.merge(state["ttft"])
+
+    def snapshot(self) -> Dict:
+        failed = sum(self.errors.values())
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "errors": dict(self.errors),
+            "error_rate": round(failed / self.requests, 4) if self.requests else 0.0,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": round(self.cost, 6),
+            "latency": self.latency.snapshot(),
+            "time_to_first_token": self.ttft.snapshot()
+        }
+
+class CallTracker:
+    """Timing and token counts for one provider call in flight"""
+
+    def __init__(self, input_tokens: int):
+        self.started = time.perf_counter()
+        self.input_tokens = input_tokens
+        self.output_tokens = 0
+        self.first_token: Optional[float] = None
+
+    def add_output(self, text: str):
+        """Count a chunk of the response; the first one sets time-to-first-token"""
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.started
+        self.output_tokens += count_tokens(text)
+
+class MetricsRegistry:
+    """Latency, token, error and cost metrics per (provider, model).
+
+    Every counter is updated as calls finish, so reading the metrics never
+    scans past requests. Prices come from each provider's "prices" table in
+    the model configs, in USD per 1K tokens.
+    """
+
+    def __init__(self, model_configs: Dict):
+        self.model_configs = model_configs
+        self._series: Dict[Tuple[str, str], ProviderMetrics] = {}
+        self.total_requests = 0
+        self.total_cost = 0.0
+
+    def known(self, provider: str, model: str) -> bool:
+        """Whether the model appears in the provider's configs"""
+        config = self.model_configs.get(provider, {})
+        return model in (config.get("free"), config.get("paid")) or model in config.get("limits", {}) or model in config.get("prices", {})
+
+    def get(self, provider: str, model: str) -> ProviderMetrics:
+        # Model names come from clients; unknown ones share one series so they
+        # cannot add series without limit
+        key = (provider, model if self.known(provider, model) else OTHER_MODEL)
+        series = self._series.get(key)
+        if series is None:
+            series = ProviderMetrics()
+            self._series[key] = series
+        return series
+
+    def latency_percentile(self, provider: str, model: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """Observed latency percentile of a model, or None until it has min_samples successes"""
+        series = self._series.get((provider, model))
+        if series is None or series.latency.count < min_samples:
+            return None
+        return series.latency.percentile(q)
+
+    def recent(self, provider: str, model: str) -> Dict:
+        """Rolling figures over the model's calls in the last ROLLING_WINDOW seconds"""
+        series = self._series.get((provider, model))
+        return (series.recent if series is not None else RollingWindow()).summary()
+
+    def price(self, provider: str, model: str, input_tokens: int, output_tokens: int) -> float:
+        """Cost in USD of a call from the model's price table (0 if unpriced)"""
+        prices = self.model_configs.get(provider, {}).get("prices", {}).get(model)
+        if not prices:
+            return 0.0
+        return (input_tokens * prices["input"] + output_tokens * prices["output"]) / 1000
+
+    @contextmanager
+    def track(self, provider: str, model: str, input_tokens: int):
+        """Record the outcome of the provider call made inside the block"""
+        series = self.get(provider, model)
+        call = CallTracker(input_tokens)
+        try:
+            yield call
+        except Exception as e:
+            self._count_request(series)
+            cls = error_class(e)
+            series.errors[cls] += 1
+            # Requests shed by our own limiter say nothing about the model
+            if cls != "rate_limited":
+                series.recent.observe(None)
+            raise
+        except BaseException:
+            # Cancelled at its deadline counts as a timeout; other cancellations
+            # (client gone, race lost) are not the provider's doing
+            if deadline_passed():
+                self._count_request(series)
+                series.errors["timeout"] += 1
+                series.recent.observe(None)
+            raise
+        else:
+            elapsed = time.perf_counter() - call.started
+            cost = self.price(provider, model, call.input_tokens, call.output_tokens)
+            self._count_request(series)
+            series.successes += 1
+            series.latency.observe(elapsed)
+            series.recent.observe(elapsed)
+            if call.first_token is not None:
+                series.ttft.observe(call.first_token)
+            series.input_tokens += call.input_tokens
+            series.output_tokens += call.output_tokens
+            series.cost += cost
+            self.total_cost += cost
+
+    def _count_request(self, series: ProviderMetrics):
+        series.requests += 1
+        self.total_requests += 1
+
+    def record_cache_hit(self, provider: str, model: str):
+        self.get(provider, model).cache_hits += 1
+
+    def record_coalesced(self, provider: str, model: str):
+        """Count a request answered by joining an identical call already in flight"""
+        self.get(provider, model).coalesced += 1
+
+    def state(self) -> Dict:
+        """Raw counters per provider/model, for merging across worker processes"""
+        return {f"{provider}/{model}": series.state() for (provider, model), series in self._series.items()}
+
+    @classmethod
+    def merged(cls, model_configs: Dict, states: List[Dict]) -> "MetricsRegistry":
+        """Build a registry holding the combined metrics of several workers"""
+        registry = cls(model_configs)
+        for state in states:
+            for name, series_state in state.items():
+                provider, model = name.split("/", 1)
+                registry.get(provider, model).merge(series_state)
+                registry.total_requests += series_state["requests"]
+                registry.total_cost += series_state["cost"]
+        return registry
+
+    def snapshot(self) -> Dict:
+        """Get metrics per provider/model"""
+        return {f"{provider}/{model}": series.snapshot() for (provider, model), series in self._series.items()}
+
+    def prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format"""
+        counters = [
+            ("requests_total", "Provider calls made", "requests"),
+            ("cache_hits_total", "Responses served from the response cache", "cache_hits"),
+            ("coalesced_total", "Requests that joined an identical call in flight", "coalesced"),
+            ("input_tokens_total", "Estimated prompt tokens sent", "input_tokens"),
+            ("output_tokens_total", "Estimated completion tokens received", "output_tokens"),
+            ("cost_usd_total", "Estimated spend in USD", "cost")
+        ]
+        lines: List[str] = []
+        for name, help_text, attr in counters:
+            lines.append(f"# HELP chatbot_provider_{name} {help_text}")
+            lines.append(f"# TYPE chatbot_provider_{name} counter")
+            for (provider, model), series in self._series.items():
+                lines.append(f'chatbot_provider_{name}{{provider="{label_value(provider)}",model="{label_value(model)}"}} {getattr(series, attr)}')
+
+        lines.append("# HELP chatbot_provider_errors_total Failed provider calls by error class")
+        lines.append("# TYPE chatbot_provider_errors_total counter")
+        for (provider, model), series in self._series.items():
+            for cls, count in series.errors.items():
+                lines.append(f'chatbot_provider_errors_total{{provider="{label_value(provider)}",model="{label_value(model)}",class="{cls}"}} {count}')
+
+        histograms = [
+            ("latency_seconds", "Provider call latency", "latency"),
+            ("ttft_seconds", "Time to the first response token", "ttft")
+        ]
+        for name, help_text, attr in histograms:
+            lines.append(f"# HELP chatbot_provider_{name} {help_text}")
+            lines.append(f"# TYPE chatbot_provider_{name} histogram")
+            for (provider, model), series in self._series.items():
+                histogram = getattr(series, attr)
+                labels = f'provider="{label_value(provider)}",model="{label_value(model)}"'
+                for le, count in histogram.cumulative():
+                    lines.append(f'chatbot_provider_{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"chatbot_provider_{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"chatbot_provider_{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,28 @@
+import argparse
+import logging
+
+from .history_store import HISTORY_BACKEND, HISTORY_BACKENDS, create_history_store, migrate_json_history
+
+logger = logging.getLogger(__name__)
+
+def main():
+    """Migrate data/conversation_history.json into the configured history store"""
+    parser = argparse.ArgumentParser(description="Migrate the legacy JSON conversation history")
+    parser.add_argument("--source", default="data/conversation_history.json",
+                        help="Legacy JSON history file")
+    parser.add_argument("--backend", default=HISTORY_BACKEND, choices=sorted(HISTORY_BACKENDS),
+                        help="Target history backend")
+    parser.add_argument("--target", default=None,
+                        help="Target database file or directory (defaults to the backend's path)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store = create_history_store(args.backend, args.target)
+    try:
+        users, entries = migrate_json_history(args.source, store)
+    finally:
+        store.close()
+    print(f"Migrated {entries} entries for {users} users into the {args.backend} store")
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,88 @@
-from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
 import os
 from fastapi import HTTPException, status
+import asyncio
+import datetime
 import json
 from pathlib import Path
 import logging
+from typing import Dict, Optional
+from .provider_io import run_sync
+from .shared_state import SharedState, WriteBehind
 
 logger = logging.getLogger(__name__)
 
 # OAuth configuration
 GOOGLE_CLIENT_SECRETS_FILE = "client_secrets.json"
+TOKENS_NAMESPACE = "oauth_tokens"
+# Tokens this close to expiry (seconds) are refreshed in the background
+REFRESH_MARGIN = float(os.getenv("OAUTH_REFRESH_MARGIN", "300"))
 GOOGLE_SCOPES = [
     'https://www.googleapis.com/auth/generative-language.runtime',
     'https://www.googleapis.com/auth/userinfo.email'
 ]
 
+def _credentials_from(token_data: dict) -> Credentials:
+    expiry = token_data.get('expiry')
+    return Credentials(
+        token=token_data['token'],
+        refresh_token=token_data['refresh_token'],
+        token_uri=token_data['token_uri'],
+        client_id=token_data['client_id'],
+        client_secret=token_data['client_secret'],
+        scopes=token_data['scopes'],
+        # google-auth compares expiry as naive UTC
+        expiry=datetime.datetime.fromisoformat(expiry) if expiry else None
+    )
+
+def _flow():
+    # google_auth_oauthlib and requests are only needed while logging in or
+    # refreshing, so they are imported then rather than at start-up
+    from google_auth_oauthlib.flow import Flow
+    return Flow.from_client_secrets_file(
+        GOOGLE_CLIENT_SECRETS_FILE,
+        scopes=GOOGLE_SCOPES,
+        redirect_uri="http://localhost:8000/api/oauth/google/callback"
+    )
+
+def _token_data(credentials: Credentials) -> dict:
+    return {
+        'token': credentials.token,
+        'refresh_token': credentials.refresh_token,
+        'token_uri': credentials.token_uri,
+        'client_id': credentials.client_id,
+        'client_secret': credentials.client_secret,
+        'scopes': credentials.scopes,
+        'expiry': credentials.expiry.isoformat() if credentials.expiry else None
+    }
+
 class OAuthManager:
-    def __init__(self):
-        self.tokens_file = "data/oauth_tokens.json"
-        self.tokens = self._load_tokens()
+    """Google OAuth logins with credentials cached in memory.
 
-    def _load_tokens(self):
-        """Load OAuth tokens from file"""
-        if os.path.exists(self.tokens_file):
-            with open(self.tokens_file, 'r') as f:
-                return json.load(f)
-        return {}
+    Tokens close to expiry are refreshed in the background while the current
+    one is still served; an expired token makes callers wait, but concurrent
+    callers share a single refresh. Refreshed tokens are written behind.
+    """
 
-    def _save_tokens(self):
-        """Save OAuth tokens to file"""
-        os.makedirs(os.path.dirname(self.tokens_file), exist_ok=True)
-        with open(self.tokens_file, 'w') as f:
-            json.dump(self.tokens, f)
+    def __init__(self, state: Optional[SharedState] = None):
+        # Tokens are kept in the shared state database so every worker process
+        # sees the same logins; the legacy JSON file is imported once
+        self.tokens_file = "data/oauth_tokens.json"
+        self.state = state or SharedState()
+        self.state.import_json(TOKENS_NAMESPACE, self.tokens_file)
+        self._writes = WriteBehind(self.state, TOKENS_NAMESPACE)
+        self._credentials: Dict[str, Credentials] = {}
+        self._refreshes: Dict[str, asyncio.Task] = {}
+        self.refreshes = 0
+
+    def _save_token(self, email: str, token_data: dict):
+        """Save one user's OAuth tokens"""
+        self._writes.set(email, token_data)
 
     def get_google_auth_url(self, email: str) -> str:
         """Get Google OAuth authorization URL"""
         try:
-            flow = Flow.from_client_secrets_file(
-                GOOGLE_CLIENT_SECRETS_FILE,
-                scopes=GOOGLE_SCOPES,
-                redirect_uri="http://localhost:8000/api/oauth/google/callback"
-            )
+            flow = _flow()
             auth_url, _ = flow.authorization_url(
                 access_type='offline',
                 include_granted_scopes='true',
@@ -58,25 +99,14 @@ class OAuthManager:
     async def handle_google_callback(self, code: str, email: str):
         """Handle Google OAuth callback"""
         try:
-            flow = Flow.from_client_secrets_file(
-                GOOGLE_CLIENT_SECRETS_FILE,
-                scopes=GOOGLE_SCOPES,
-                redirect_uri="http://localhost:8000/api/oauth/google/callback"
-            )
+            flow = _flow()
             
             flow.fetch_token(code=code)
             credentials = flow.credentials
 
             # Save tokens
-            self.tokens[email] = {
-                'token': credentials.token,
-                'refresh_token': credentials.refresh_token,
-                'token_uri': credentials.token_uri,
-                'client_id': credentials.client_id,
-                'client_secret': credentials.client_secret,
-                'scopes': credentials.scopes
-            }
-            self._save_tokens()
+            self._credentials[email] = credentials
+            self._save_token(email, _token_data(credentials))
             
             return {"message": "Successfully authenticated with Google"}
         except Exception as e:
@@ -86,28 +116,64 @@ class OAuthManager:
                 detail="Failed to complete authentication"
             )
 
-    def get_google_credentials(self, email: str) -> Credentials:
-        """Get Google credentials for a user"""
-        if email not in self.tokens:
+    async def get_google_credentials(self, email: str) -> Credentials:
+        """Get Google credentials for a user without blocking on storage or token refresh"""
+        credentials = self._credentials.get(email)
+        if credentials is None or credentials.expired:
+            # Another worker may already have refreshed it
+            credentials = await self._load(email)
+        if credentials.expired:
+            credentials = await asyncio.shield(self._refresh(email, credentials))
+        elif self._expires_within(credentials, REFRESH_MARGIN):
+            self._refresh(email, credentials)
+        return credentials
+
+    async def _load(self, email: str) -> Credentials:
+        token_data = self._writes.pending().get(email)
+        if token_data is None:
+            token_data = await asyncio.to_thread(self.state.get, TOKENS_NAMESPACE, email)
+        if token_data is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not authenticated with Google"
             )
+        credentials = _credentials_from(token_data)
+        self._credentials[email] = credentials
+        return credentials
 
-        token_data = self.tokens[email]
-        credentials = Credentials(
-            token=token_data['token'],
-            refresh_token=token_data['refresh_token'],
-            token_uri=token_data['token_uri'],
-            client_id=token_data['client_id'],
-            client_secret=token_data['client_secret'],
-            scopes=token_data['scopes']
-        )
+    @staticmethod
+    def _expires_within(credentials: Credentials, seconds: float) -> bool:
+        if credentials.expiry is None:
+            return False
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - now < datetime.timedelta(seconds=seconds)
 
-        if credentials.expired:
-            credentials.refresh(Request())
-            # Update stored token
-            token_data['token'] = credentials.token
-            self._save_tokens()
+    def _refresh(self, email: str, credentials: Credentials) -> asyncio.Task:
+        """Start refreshing a user's token, or join the refresh already running"""
+        task = self._refreshes.get(email)
+        if task is None or task.done():
+            task = asyncio.create_task(self._run_refresh(email, credentials))
+            task.add_done_callback(self._log_refresh_failure)
+            self._refreshes[email] = task
+        return task
+
+    async def _run_refresh(self, email: str, credentials: Credentials) -> Credentials:
+        # Refresh a copy so requests holding the current token are not disturbed
+        from google.auth.transport.requests import Request
+        fresh = _credentials_from(_token_data(credentials))
+        # google-auth only refreshes synchronously; bounded like other blocking SDK calls
+        await run_sync(fresh.refresh, Request())
+        self._credentials[email] = fresh
+        self._save_token(email, _token_data(fresh))
+        self.refreshes += 1
+        logger.debug(f"Refreshed Google token for {email}")
+        return fresh
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error refreshing Google token: {task.exception()}")
 
-        return credentials 
\ No newline at end of file
+    async def close(self):
+        """Write any buffered token updates"""
+        await self._writes.close()
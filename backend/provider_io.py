@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool limits for the shared provider HTTP client
+MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("PROVIDER_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", "120"))
+HTTP_TIMEOUT = httpx.Timeout(float(os.getenv("PROVIDER_HTTP_TIMEOUT", "60")), connect=10.0)
+
+# Upper bound on threads used for SDKs that only offer blocking calls
+SYNC_WORKERS = int(os.getenv("PROVIDER_SYNC_WORKERS", "8"))
+
+# One pooled client per event loop; httpx connections cannot cross loops
+_http_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_sync_executor: Optional[ThreadPoolExecutor] = None
+
+# Transport failures that never reached the provider
+_CONNECTION_ERRORS: Tuple[type, ...] = (httpx.TransportError, ConnectionError)
+
+# Loop time at which the current provider call's deadline expires, if any
+call_deadline: ContextVar[Optional[float]] = ContextVar("call_deadline", default=None)
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared async HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        logger.debug("Creating shared provider HTTP client")
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            )
+        )
+        # Drop clients whose loops have gone away (e.g. between test runs)
+        for stale_loop in [l for l in _http_clients if l.is_closed()]:
+            del _http_clients[stale_loop]
+        _http_clients[loop] = client
+    return client
+
+async def close_http_client():
+    """Close the shared HTTP client for the running event loop"""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _sync_executor
+    if _sync_executor is None:
+        _sync_executor = ThreadPoolExecutor(
+            max_workers=SYNC_WORKERS,
+            thread_name_prefix="provider-sync"
+        )
+    return _sync_executor
+
+async def run_sync(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking SDK call on the bounded provider thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(func, *args, **kwargs))
+
+def deadline_passed() -> bool:
+    """Whether the current provider call has run past its deadline"""
+    deadline = call_deadline.get()
+    return deadline is not None and asyncio.get_running_loop().time() >= deadline
+
+def connection_errors() -> Tuple[type, ...]:
+    """Connection error types of every transport in use.
+
+    Provider SDKs are imported on first use, so one that is not loaded yet
+    cannot have raised anything and is not imported just to check.
+    """
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return _CONNECTION_ERRORS
+    return _CONNECTION_ERRORS + (openai.APIConnectionError,)
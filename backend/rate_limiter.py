@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Defaults for models without their own "rpm" / "max_concurrency" limits
+DEFAULT_RPM = int(os.getenv("RATE_LIMIT_DEFAULT_RPM", "60"))
+DEFAULT_CONCURRENCY = int(os.getenv("RATE_LIMIT_DEFAULT_CONCURRENCY", "8"))
+# How many requests may wait per limiter, and for how long, before shedding
+MAX_QUEUE = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "50"))
+MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is shed instead of queued"""
+
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        super().__init__(f"{provider} is over its rate limit ({reason}); retry after {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+        self.reason = reason
+
+def key_fingerprint(api_key: str) -> str:
+    """Short, non-reversible label for an API key, safe to show in metrics"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+class ProviderLimiter:
+    """Token bucket plus concurrency cap for one (provider, api_key, model).
+
+    Requests that would exceed the rate wait their turn in a bounded queue.
+    When the queue is full, or the expected wait is longer than max_wait, the
+    request is shed immediately with a retry hint rather than sent upstream
+    to fail against the provider's quota.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        rpm: float = DEFAULT_RPM,
+        max_concurrency: int = DEFAULT_CONCURRENCY,
+        max_queue: int = MAX_QUEUE,
+        max_wait: float = MAX_WAIT
+    ):
+        self.provider = provider
+        self.rate = rpm / 60.0
+        self.burst = max(1.0, min(float(rpm), float(max_concurrency)))
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long to wait until it is actually available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def headroom(self) -> float:
+        """Share of the burst that would be admitted right now without waiting; 0 while requests queue"""
+        if self.waiting:
+            return 0.0
+        tokens = min(self.burst, self.tokens + (time.monotonic() - self.updated) * self.rate)
+        return max(0.0, tokens / self.burst)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for permission to call the provider, or raise RateLimitExceeded"""
+        if self.waiting >= self.max_queue:
+            self.shed += 1
+            raise RateLimitExceeded(self.provider, max(1.0, self.waiting / self.rate), "queue full")
+
+        wait = self._reserve()
+        if wait > self.max_wait:
+            self.tokens += 1  # Give the reservation back
+            self.shed += 1
+            raise RateLimitExceeded(self.provider, wait, "quota")
+
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            remaining = self.max_wait - (time.monotonic() - start)
+            await asyncio.wait_for(self.semaphore.acquire(), max(remaining, 0.001))
+        except asyncio.TimeoutError:
+            # No call is made, so later callers need not wait for its token
+            self.tokens += 1
+            self.shed += 1
+            raise RateLimitExceeded(self.provider, 1.0, "concurrency")
+        except asyncio.CancelledError:
+            self.tokens += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_observed_wait = max(self.max_observed_wait, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_wait": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait": round(self.max_observed_wait, 4)
+        }
+
+class RateLimiterRegistry:
+    """Limiters keyed by (provider, api_key, model), configured per model.
+
+    With several worker processes each one enforces its share of every
+    model's limits, so together they stay under the provider's quota.
+    """
+
+    def __init__(self, model_configs: Dict, workers: int = 1):
+        self.model_configs = model_configs
+        self.workers = max(1, workers)
+        self._limiters: Dict[Tuple[str, str, str], ProviderLimiter] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self, provider: str, api_key: str, model: str) -> ProviderLimiter:
+        # Semaphores belong to the loop that first waits on them
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._limiters.clear()
+
+        key = (provider, api_key, model)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limits = self.model_configs.get(provider, {}).get("limits", {}).get(model, {})
+            limiter = ProviderLimiter(
+                provider,
+                rpm=limits.get("rpm", DEFAULT_RPM) / self.workers,
+                max_concurrency=math.ceil(limits.get("max_concurrency", DEFAULT_CONCURRENCY) / self.workers)
+            )
+            self._limiters[key] = limiter
+        return limiter
+
+    def headroom(self, provider: str, api_key: str, model: str) -> float:
+        """Remaining quota of a model's limiter as a share of its burst; 1 if it has not been used"""
+        limiter = self._limiters.get((provider, api_key, model))
+        return limiter.headroom() if limiter is not None else 1.0
+
+    def slot(self, provider: str, api_key: str, model: str):
+        """Shortcut for get(...).slot()"""
+        return self.get(provider, api_key, model).slot()
+
+    def stats(self) -> Dict:
+        """Get queue depth and wait times per provider/model/key fingerprint"""
+        return {
+            f"{provider}/{model}/{key_fingerprint(api_key)}": limiter.stats()
+            for (provider, api_key, model), limiter in self._limiters.items()
+        }
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from .provider_io import connection_errors, deadline_passed
+from .rate_limiter import RateLimitExceeded, key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Retry policy for transient provider failures
+RETRY_ATTEMPTS = int(os.getenv("PROVIDER_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("PROVIDER_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("PROVIDER_RETRY_MAX_DELAY", "8"))
+
+# Circuit breaker policy per (provider, api_key)
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Hedged calls allowed per hedged request, and how many may be saved up
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "10"))
+
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} circuit is open; retry after {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+def error_status_code(error: Exception) -> Optional[int]:
+    """HTTP status carried by a provider error, if any"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed completion is worth retrying: 429, 5xx, timeouts and connection errors"""
+    if isinstance(error, (RateLimitExceeded, CircuitOpenError)):
+        return False
+    status = error_status_code(error)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    return isinstance(error, (asyncio.TimeoutError,) + connection_errors())
+
+def _retry_after_hint(error: Exception) -> float:
+    """Seconds requested by a Retry-After header on the failed response, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+async def retry_async(
+    call: Callable[[], Awaitable[T]],
+    attempts: int = RETRY_ATTEMPTS,
+    base_delay: float = RETRY_BASE_DELAY,
+    max_delay: float = RETRY_MAX_DELAY
+) -> T:
+    """Run call, retrying transient failures with capped exponential backoff and full jitter"""
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            backoff = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            delay = min(max_delay, max(backoff, _retry_after_hint(e)))
+            logger.warning(f"Transient error ({e}); retry {attempt + 1}/{attempts - 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+class HedgeBudget:
+    """Bounds the extra provider calls made by hedging.
+
+    Each hedged request deposits `ratio` tokens (saved up to `burst`) and each
+    hedge spends a whole one, so hedges stay under roughly ratio x requests
+    however slow the providers get.
+    """
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.hedges = 0
+        self.denied = 0
+
+    def deposit(self):
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take a token for one hedged call, if the budget has one"""
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.hedges += 1
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "ratio": self.ratio,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "denied": self.denied,
+            "available": round(self.tokens, 2)
+        }
+
+class CircuitBreaker:
+    """Stops calling a provider after repeated transient failures or missed deadlines.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast with CircuitOpenError. Once reset_timeout has passed, a single
+    trial call is let through (half-open); its outcome closes or re-opens
+    the circuit.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may proceed"""
+        if self.state == CLOSED:
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == OPEN and elapsed >= self.reset_timeout:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.provider, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"{self.provider} circuit closed")
+        self.state = CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                logger.warning(f"{self.provider} circuit opened after {self.failures} failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give back a half-open trial whose outcome says nothing about provider health"""
+        self.trial_in_flight = False
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+class CircuitBreakerRegistry:
+    """Circuit breakers keyed by (provider, api_key)"""
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, provider: str, api_key: str) -> CircuitBreaker:
+        key = (provider, api_key)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(provider, self.failure_threshold, self.reset_timeout)
+            self._breakers[key] = breaker
+        return breaker
+
+    @asynccontextmanager
+    async def guard(self, provider: str, api_key: str):
+        """Fail fast while the circuit is open and record the outcome of the guarded call"""
+        breaker = self.get(provider, api_key)
+        breaker.before_call()
+        try:
+            yield
+        except Exception as e:
+            if is_transient(e):
+                breaker.record_failure()
+            elif isinstance(e, RateLimitExceeded):
+                # Shed locally; the provider was never asked
+                breaker.release_trial()
+            else:
+                # The provider answered, it just rejected this request
+                breaker.record_success()
+            raise
+        except BaseException:
+            # A provider that keeps missing its deadline is as good as down;
+            # other cancellations (client gone, race lost) say nothing
+            if deadline_passed():
+                breaker.record_failure()
+            else:
+                breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+
+    def stats(self) -> Dict:
+        """Get breaker state per provider/key fingerprint"""
+        return {
+            f"{provider}/{key_fingerprint(api_key)}": breaker.stats()
+            for (provider, api_key), breaker in self._breakers.items()
+        }
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from .shared_state import connect
+
+logger = logging.getLogger(__name__)
+
+# Cache bounds; RESPONSE_CACHE_DB enables the on-disk tier when set
+CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+CACHE_DB = os.getenv("RESPONSE_CACHE_DB") or None
+DISK_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_DISK_SIZE", "100000"))
+
+@lru_cache(maxsize=int(os.getenv("RESPONSE_CACHE_NORMALIZE_CACHE_SIZE", "65536")))
+def _normalize(text: str) -> str:
+    """Collapse case and whitespace so trivially different prompts share an entry.
+
+    Memoized, so history messages are only normalized once across turns.
+    """
+    return " ".join(text.lower().split())
+
+class _DiskTier:
+    """SQLite-backed second tier that survives restarts"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_expiry ON responses (expires_at);
+    """
+
+    def __init__(self, path: str, max_size: int):
+        self.max_size = max_size
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(self.SCHEMA)
+
+    def get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+        return row
+
+    def set(self, key: str, response: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, expires_at)
+            )
+            self._writes += 1
+            # Prune periodically rather than on every write
+            if self._writes % 100 == 0:
+                self._prune()
+
+    def _prune(self):
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_size
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY expires_at LIMIT ?)",
+                (excess,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ResponseCache:
+    """Bounded LRU cache of provider responses with a TTL.
+
+    Keys combine provider, model and a hash of the normalized prompt plus the
+    context window sent with it. Lookups check memory first and fall back to
+    the optional on-disk tier, promoting disk hits back into memory.
+    """
+
+    def __init__(
+        self,
+        max_size: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        disk_path: Optional[str] = CACHE_DB,
+        disk_size: int = DISK_CACHE_SIZE
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._disk = _DiskTier(disk_path, disk_size) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, context: List[Dict]) -> str:
+        """Build the cache key for a prompt and the context window sent with it"""
+        window = [[entry["type"], _normalize(entry["message"])] for entry in context]
+        digest = hashlib.sha256(
+            json.dumps([_normalize(prompt), window], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        return f"{provider}:{model}:{digest}"
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, or None on a miss"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[0]
+            del self._entries[key]
+
+        if self._disk is not None:
+            row = self._disk.get(key, now)
+            if row is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store(key, row[0], row[1])
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, response: str):
+        """Cache a response in memory and, when enabled, on disk"""
+        expires_at = time.time() + self.ttl
+        self._store(key, response, expires_at)
+        if self._disk is not None:
+            self._disk.set(key, response, expires_at)
+
+    def _store(self, key: str, response: str, expires_at: float):
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Get cache size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
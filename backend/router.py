@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .context_builder import DEFAULT_MODEL_LIMITS
+
+logger = logging.getLogger(__name__)
+
+# Model name that asks the router to pick a provider's model per request
+AUTO_MODEL = "auto"
+# Most a routed request may be expected to cost, in USD
+ROUTER_MAX_COST = float(os.getenv("ROUTER_MAX_COST", "0.05"))
+# Completion tokens assumed when estimating what a request will cost
+ROUTER_OUTPUT_TOKENS = int(os.getenv("ROUTER_OUTPUT_TOKENS", "500"))
+# A model is degraded when, over its recent calls (at least ROUTER_MIN_SAMPLES),
+# the error rate or p95 latency (seconds) passes these limits
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "10"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.25"))
+ROUTER_MAX_P95 = float(os.getenv("ROUTER_MAX_P95", "10"))
+# ...or when less than this share of its rate limit is left
+ROUTER_MIN_HEADROOM = float(os.getenv("ROUTER_MIN_HEADROOM", "0.1"))
+# ...or when this share of its feedback in the last ROUTER_FEEDBACK_WINDOW
+# seconds was negative, once it has ROUTER_MIN_FEEDBACK votes
+ROUTER_MAX_NEGATIVE_RATE = float(os.getenv("ROUTER_MAX_NEGATIVE_RATE", "0.5"))
+ROUTER_MIN_FEEDBACK = int(os.getenv("ROUTER_MIN_FEEDBACK", "5"))
+ROUTER_FEEDBACK_WINDOW = float(os.getenv("ROUTER_FEEDBACK_WINDOW", "3600"))
+# Seconds a model's feedback figures are reused before being read again
+ROUTER_FEEDBACK_TTL = float(os.getenv("ROUTER_FEEDBACK_TTL", "30"))
+# Figures used for a model until its feedback has been read
+NO_FEEDBACK = {"total": 0, "negative_rate": 0.0}
+# Most recent routing decisions kept for auditing
+ROUTER_LOG_SIZE = int(os.getenv("ROUTER_LOG_SIZE", "500"))
+
+class ModelRouter:
+    """Picks the model for providers set to "auto", one request at a time.
+
+    A provider's models are tried in tier order, the paid model first and
+    then the cheaper free tier. The first one that is within the cost
+    ceiling and not degraded is used. A model is degraded when its recent
+    error rate or p95 latency is too high, its rate limit is nearly used
+    up, or its recorded feedback is mostly negative. When every affordable
+    model is degraded, the least degraded one is used, cheapest first.
+    Every decision is logged with the signals behind it and kept for audit.
+    """
+
+    def __init__(
+        self,
+        model_configs: Dict,
+        feedback: Optional[Callable[[str, str], Dict]] = None,
+        max_cost: float = ROUTER_MAX_COST,
+        log_size: int = ROUTER_LOG_SIZE
+    ):
+        self.model_configs = model_configs
+        self.feedback = feedback
+        self.max_cost = max_cost
+        self._feedback_cache: Dict[Tuple[str, str], Tuple[float, Dict]] = {}
+        self._feedback_reads: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._log: Deque[Dict] = deque(maxlen=log_size)
+        self.decisions = 0
+        self.fallbacks = 0
+        self.choices: Dict[str, int] = defaultdict(int)
+
+    def candidates(self, provider: str) -> List[str]:
+        """The provider's models in the order they are preferred"""
+        config = self.model_configs[provider]
+        ordered = [config.get("paid"), config.get("free")] + list(config.get("limits", {}))
+        return list(dict.fromkeys(model for model in ordered if model))
+
+    def cost(self, provider: str, model: str, input_tokens: int) -> float:
+        """Expected cost in USD of a request with this many prompt tokens"""
+        config = self.model_configs[provider]
+        limits = config.get("limits", {}).get(model, DEFAULT_MODEL_LIMITS)
+        # Longer histories are trimmed to the model's context budget
+        input_tokens = min(input_tokens, limits["context_window"] - limits["reserved_output"])
+        prices = config.get("prices", {}).get(model)
+        if not prices:
+            return 0.0
+        return (input_tokens * prices["input"] + ROUTER_OUTPUT_TOKENS * prices["output"]) / 1000
+
+    def _feedback(self, provider: str, model: str) -> Dict:
+        """A model's cached feedback figures, read again in the background once stale"""
+        if self.feedback is None:
+            return NO_FEEDBACK
+        key = (provider, model)
+        cached = self._feedback_cache.get(key)
+        if cached is None or time.monotonic() - cached[0] > ROUTER_FEEDBACK_TTL:
+            self._refresh_feedback(key)
+            cached = self._feedback_cache.get(key, cached)
+        return cached[1] if cached is not None else NO_FEEDBACK
+
+    def _refresh_feedback(self, key: Tuple[str, str]):
+        """Start reading a model's feedback, or leave the read already running"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside an event loop nothing else is held up by the query
+            self._feedback_cache[key] = (time.monotonic(), self.feedback(*key))
+            return
+        task = self._feedback_reads.get(key)
+        if task is None or task.done():
+            # Routing runs on the event loop, so the store is queried off it;
+            # stale figures (or none) are used until the read finishes
+            self._feedback_reads[key] = loop.create_task(self._read_feedback(key))
+
+    async def _read_feedback(self, key: Tuple[str, str]):
+        try:
+            figures = await asyncio.to_thread(self.feedback, *key)
+        except Exception as e:
+            logger.warning(f"Could not read feedback for {key[0]}/{key[1]}: {e}")
+            return
+        self._feedback_cache[key] = (time.monotonic(), figures)
+
+    @staticmethod
+    def degraded(signals: Dict) -> List[str]:
+        """Why a model's signals mark it as degraded; empty if they do not"""
+        reasons = []
+        if signals["requests"] >= ROUTER_MIN_SAMPLES:
+            if signals["error_rate"] > ROUTER_MAX_ERROR_RATE:
+                reasons.append("error_rate")
+            if signals["p95"] is not None and signals["p95"] > ROUTER_MAX_P95:
+                reasons.append("latency")
+        if signals["headroom"] < ROUTER_MIN_HEADROOM:
+            reasons.append("quota")
+        if signals["feedback"] >= ROUTER_MIN_FEEDBACK and signals["negative_rate"] > ROUTER_MAX_NEGATIVE_RATE:
+            reasons.append("feedback")
+        return reasons
+
+    def choose(self, provider: str, signals: Dict[str, Dict], input_tokens: int, user_id: Optional[str] = None) -> str:
+        """Pick a model for one request.
+
+        signals maps each model to its rolling "requests", "error_rate" and
+        "p95" and its rate limiter "headroom"; feedback is looked up here.
+        """
+        order = self.candidates(provider)
+        considered = {}
+        for model in order:
+            feedback = self._feedback(provider, model)
+            figures = {"requests": 0, "error_rate": 0.0, "p95": None, "headroom": 1.0}
+            figures.update(signals.get(model, {}))
+            figures.update({"feedback": feedback["total"], "negative_rate": feedback["negative_rate"]})
+            cost = self.cost(provider, model, input_tokens)
+            figures.update({"cost": round(cost, 6), "affordable": cost <= self.max_cost, "degraded": self.degraded(figures)})
+            considered[model] = figures
+
+        healthy = [model for model in order if considered[model]["affordable"] and not considered[model]["degraded"]]
+        if healthy:
+            model = healthy[0]
+            reason = "preferred" if model == order[0] else "fallback"
+        else:
+            affordable = [model for model in order if considered[model]["affordable"]]
+            pool = affordable or order
+            model = min(pool, key=lambda m: (len(considered[m]["degraded"]), considered[m]["cost"]))
+            reason = "all degraded" if affordable else "over cost ceiling"
+
+        self.decisions += 1
+        self.choices[f"{provider}/{model}"] += 1
+        if reason != "preferred":
+            self.fallbacks += 1
+        self._log.append({
+            "time": time.time(),
+            "provider": provider,
+            "model": model,
+            "reason": reason,
+            "user_id": user_id,
+            "input_tokens": input_tokens,
+            "candidates": considered
+        })
+        skipped = {m: considered[m]["degraded"] or ["cost"] for m in order[:order.index(model)]}
+        logger.info(f"Routed {provider} to {model} ({reason}){f', skipped {skipped}' if skipped else ''}")
+        return model
+
+    def recent(self, limit: int = 50, provider: Optional[str] = None) -> List[Dict]:
+        """The most recent routing decisions, newest first"""
+        decisions = []
+        for decision in reversed(self._log):
+            if provider is None or decision["provider"] == provider:
+                decisions.append(decision)
+                if len(decisions) >= limit:
+                    break
+        return decisions
+
+    def stats(self) -> Dict:
+        """Get decision and fallback counts and how often each model was picked"""
+        return {"decisions": self.decisions, "fallbacks": self.fallbacks, "choices": dict(self.choices)}
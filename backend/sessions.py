@@ -0,0 +1,153 @@
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .context_builder import MESSAGE_OVERHEAD, context_budget, count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Most chat sessions kept per worker, and seconds a session may sit idle
+CHAT_SESSIONS_MAX = int(os.getenv("CHAT_SESSIONS_MAX", "10000"))
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+
+SessionKey = Tuple[str, str, str]
+
+class ChatSession:
+    """The context one model is sent for one user, kept between turns.
+
+    Holds the longest run of recent turns that fits the model's token
+    budget, with each turn's cost, plus the rolling summary. New history
+    entries are appended as they arrive and the oldest turns fall off the
+    front, so a turn only pays for what changed since the last one.
+    """
+
+    __slots__ = ("limits", "summary", "turns", "tokens", "last_id", "last_used")
+
+    def __init__(self, limits: Dict):
+        self.limits = limits
+        self.summary: Optional[Tuple[Dict, int]] = None
+        self.turns: Deque[Tuple[Dict, int]] = deque()
+        self.tokens = 0
+        self.last_id = 0
+        self.last_used = time.monotonic()
+
+    def sync(self, history: List[Dict]) -> Optional[int]:
+        """Append the entries newer than those seen; the number appended, or None if the session must be rebuilt"""
+        summary = history[0] if history and history[0]["type"] == "summary" else None
+        if (summary["message"] if summary else None) != (self.summary[0]["message"] if self.summary else None):
+            return None
+        new = []
+        for entry in reversed(history):
+            if entry is summary:
+                break
+            entry_id = entry.get("id")
+            if entry_id is None:
+                # Entries without ids cannot be told apart from those already seen
+                return None
+            if entry_id <= self.last_id:
+                break
+            new.append(entry)
+        for entry in reversed(new):
+            self.add(entry)
+        return len(new)
+
+    def add(self, entry: Dict):
+        if entry["type"] == "summary":
+            self.summary = (entry, count_tokens(entry["message"]) + MESSAGE_OVERHEAD)
+            return
+        self.last_id = entry.get("id") or self.last_id
+        # Logged provider responses are not conversation turns
+        if entry["type"] == "response":
+            return
+        cost = count_tokens(entry["message"]) + MESSAGE_OVERHEAD
+        self.turns.append((entry, cost))
+        self.tokens += cost
+        # Keep no more than the largest budget any message could leave
+        budget = context_budget("", self.limits)
+        while self.tokens > budget:
+            self.tokens -= self.turns.popleft()[1]
+
+    def context(self, message: str) -> List[Dict]:
+        """The turns to send with message: the same as build_context over the whole history"""
+        budget = context_budget(message, self.limits)
+        context = []
+        if self.summary is not None and self.summary[1] <= budget:
+            context.append(self.summary[0])
+            budget -= self.summary[1]
+        # Costs are positive, so dropping the oldest turns until the rest fit
+        # finds the longest recent run that fits
+        skip = 0
+        tokens = self.tokens
+        while tokens > budget:
+            tokens -= self.turns[skip][1]
+            skip += 1
+        context.extend(entry for entry, _ in list(self.turns)[skip:])
+        return context
+
+class ChatSessionManager:
+    """Chat sessions per (user, provider, model), evicted by LRU and idle TTL.
+
+    Each turn brings the session up to date with the user's history, which
+    costs only the entries added since the previous turn. A session that
+    cannot follow the history (a new summary, entries without ids) or that
+    was evicted or lost in a restart is rebuilt from the history.
+    """
+
+    def __init__(self, max_sessions: int = CHAT_SESSIONS_MAX, ttl: float = CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[SessionKey, ChatSession]" = OrderedDict()
+        self.hits = 0
+        self.rebuilds = 0
+        self.evictions = 0
+        self.entries_appended = 0
+
+    def context(self, user_id: str, provider: str, model: str, limits: Dict, history: List[Dict], message: str) -> List[Dict]:
+        """Context for the user's next message to a model, from their session"""
+        now = time.monotonic()
+        self._evict_idle(now)
+        key = (user_id, provider, model)
+        session = self._sessions.get(key)
+        appended = session.sync(history) if session is not None and session.limits is limits else None
+        if appended is None:
+            session = self._rebuild(key, limits, history)
+        else:
+            self.hits += 1
+            self.entries_appended += appended
+            self._sessions.move_to_end(key)
+        session.last_used = now
+        return session.context(message)
+
+    def _rebuild(self, key: SessionKey, limits: Dict, history: List[Dict]) -> ChatSession:
+        self.rebuilds += 1
+        session = ChatSession(limits)
+        for entry in history:
+            session.add(entry)
+        self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        return session
+
+    def _evict_idle(self, now: float):
+        """Drop sessions idle past the TTL; sessions are kept in last-used order"""
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.ttl:
+                break
+            del self._sessions[key]
+            self.evictions += 1
+            logger.debug(f"Evicted idle {key[1]}/{key[2]} chat session for user {key[0]}")
+
+    def stats(self) -> Dict:
+        """Get session count and reuse counters"""
+        return {
+            "sessions": len(self._sessions),
+            "hits": self.hits,
+            "rebuilds": self.rebuilds,
+            "evictions": self.evictions,
+            "entries_appended": self.entries_appended
+        }
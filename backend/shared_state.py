@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# SQLite database holding state that every worker process must see
+STATE_DB = os.getenv("STATE_DB", "data/shared_state.db")
+
+# Seconds a writer waits for another process to release the database
+BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "10"))
+
+# Seconds write-behind buffers hold changes before flushing them
+WRITE_BEHIND_DELAY = float(os.getenv("STATE_WRITE_BEHIND_DELAY", "0.5"))
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a SQLite database for concurrent use by several worker processes.
+
+    WAL mode lets readers proceed while one process writes, and the busy
+    timeout makes writers wait for each other instead of failing.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class SharedState:
+    """JSON values by (namespace, key) in SQLite, safe to share across processes.
+
+    Replaces the JSON files that every process used to rewrite wholesale;
+    each write touches a single row in its own transaction.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS state (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        );
+    """
+
+    def __init__(self, path: str = STATE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(self.SCHEMA)
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time())
+            )
+
+    def set_many(self, namespace: str, values: Dict[str, Any]):
+        """Write several keys of a namespace in one transaction"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    [(namespace, key, json.dumps(value), now) for key, value in values.items()]
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def version(self) -> int:
+        """Changes whenever another connection (or process) commits; cheap to poll"""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace: str, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Get every value in a namespace, optionally only those updated within max_age seconds"""
+        query = "SELECT key, value FROM state WHERE namespace = ?"
+        params: list = [namespace]
+        if max_age is not None:
+            query += " AND updated_at >= ?"
+            params.append(time.time() - max_age)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def import_json(self, namespace: str, json_path: str) -> int:
+        """Copy a legacy JSON file of {key: value} into an empty namespace; returns keys imported"""
+        if not os.path.exists(json_path) or self.items(namespace):
+            return 0
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        for key, value in data.items():
+            self.set(namespace, key, value)
+        logger.info(f"Imported {len(data)} {namespace} entries from {json_path}")
+        return len(data)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class WriteBehind:
+    """Buffers writes to one SharedState namespace and flushes them off the request path.
+
+    Changes are held for `delay` seconds and written in a single transaction,
+    keeping only the latest value per key. Outside an event loop writes go
+    straight through.
+    """
+
+    def __init__(self, state: SharedState, namespace: str, delay: float = WRITE_BEHIND_DELAY):
+        self.state = state
+        self.namespace = namespace
+        self.delay = delay
+        self._pending: Dict[str, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.flushes = 0
+
+    def set(self, key: str, value: Any):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.state.set(self.namespace, key, value)
+            self.writes += 1
+            return
+        self._pending[key] = value
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = loop.create_task(self._flush_later())
+
+    def pending(self) -> Dict[str, Any]:
+        """Changes not yet written"""
+        return dict(self._pending)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        await self.flush()
+
+    async def flush(self):
+        """Write every buffered change now"""
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self.state.set_many, self.namespace, batch)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} {self.namespace} entries: {e}")
+            # Keep them for the next flush unless newer values have replaced them
+            for key, value in batch.items():
+                self._pending.setdefault(key, value)
+        else:
+            self.writes += len(batch)
+            self.flushes += 1
+
+    async def close(self):
+        """Stop the pending timer and flush what is buffered"""
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            self._task.cancel()
+        self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {"writes": self.writes, "flushes": self.flushes, "pending": len(self._pending)}
@@ -0,0 +1,73 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+class _Flight:
+    """One upstream call, whose credentials it runs under, and the number of callers waiting on it"""
+
+    __slots__ = ("task", "owner", "waiters")
+
+    def __init__(self, task: asyncio.Task, owner: Optional[str]):
+        self.task = task
+        self.owner = owner
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesces identical concurrent calls into one.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight wait for the same result or exception. The call runs as its own
+    task, so one caller going away does not fail the others; it is cancelled
+    only once nobody is waiting. Nothing is kept after the call finishes,
+    which is the response cache's job.
+
+    A call runs under its first caller's owner (e.g. API key). Callers with
+    a different owner share only its success: when it fails they make their
+    own call, so one owner's revoked key, quota or open circuit is never
+    passed on to the others.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.saved = 0
+        self.reruns = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._flights
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]], owner: Optional[str] = None) -> T:
+        """Run call for key, or join the identical call already in flight"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(call()), owner)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.calls += 1
+        else:
+            self.saved += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except Exception:
+            if flight.owner == owner:
+                raise
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+        # Another owner's call failed; this caller's own may not
+        self.saved -= 1
+        self.calls += 1
+        self.reruns += 1
+        return await call()
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict:
+        """Get upstream calls made, calls saved by joining one in flight, reruns after another owner's call failed, and calls in flight"""
+        return {"calls": self.calls, "saved": self.saved, "reruns": self.reruns, "in_flight": len(self._flights)}
@@ -0,0 +1,173 @@
+"""Run the app against mock providers and drive its endpoints under load"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODELS = {"gemini": "gemini-pro", "openai": "gpt-3.5-turbo", "grok": "grok-1"}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_app(port: int, provider_urls: Dict[str, str], data_dir: str, workers: int = 1, env: Optional[Dict] = None) -> subprocess.Popen:
+    """Run the app under uvicorn with its providers and storage pointed at the given mocks and directory"""
+    app_env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        GEMINI_API_KEY="",
+        HISTORY_PATH=os.path.join(data_dir, "history.db"),
+        FEEDBACK_DB=os.path.join(data_dir, "feedback.db"),
+        STATE_DB=os.path.join(data_dir, "state.db"),
+        RESPONSE_CACHE_DB=os.path.join(data_dir, "cache.db")
+    )
+    for provider, url in provider_urls.items():
+        app_env[f"{provider.upper()}_BASE_URL"] = url
+    app_env.update(env or {})
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=app_env,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+async def wait_until_ready(base_url: str, timeout: float = 60, poll: float = 0.2):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/api/history", params={"user_id": "ready"})).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(poll)
+    raise RuntimeError(f"App at {base_url} did not start")
+
+def _children(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The process name may contain spaces; fields after it are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """Resident memory in bytes of a process and its children (Linux only)"""
+    if not os.path.isdir("/proc"):
+        return None
+    total = 0
+    for proc in [pid] + _children(pid):
+        try:
+            with open(f"/proc/{proc}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))], 4)
+
+async def run_load(
+    base_url: str,
+    request: Callable[[httpx.AsyncClient, int, int], Awaitable[bool]],
+    concurrency: int,
+    duration: float,
+    pid: Optional[int] = None
+) -> Dict:
+    """Run `concurrency` virtual users calling request(client, user, n) back to back for `duration` seconds.
+
+    request returns whether the call succeeded. When pid is given, the
+    memory of that process tree is sampled while the load runs.
+    """
+    latencies: List[float] = []
+    errors = 0
+    memory: List[int] = []
+    stop_at = time.monotonic() + duration
+
+    async def user(n: int):
+        nonlocal errors
+        i = 0
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                ok = await request(client, n, i)
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+            i += 1
+
+    async def sample_memory():
+        while time.monotonic() < stop_at:
+            rss = await asyncio.to_thread(process_tree_rss, pid)
+            if rss is not None:
+                memory.append(rss)
+            await asyncio.sleep(0.5)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        tasks = [user(n) for n in range(concurrency)]
+        if pid is not None:
+            tasks.append(sample_memory())
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "concurrency": concurrency,
+        "duration": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2),
+        "latency": {
+            "avg": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": round(latencies[-1], 4) if latencies else 0.0
+        }
+    }
+    if memory:
+        result["memory"] = {"rss_peak": max(memory), "rss_end": memory[-1]}
+    return result
+
+def chat_payload(user: int, keys_per_user: int, i: int, message: str = "Benchmark question") -> Dict:
+    """Chat request for a virtual user; keys rotate so per-key rate limits don't cap throughput"""
+    key = f"bench-{user}-{i % keys_per_user}"
+    return {
+        "message": message,
+        "user_id": f"bench-{user}",
+        "use_cache": False,
+        "service_keys": {
+            "user_id": f"bench-{user}",
+            "gemini": key,
+            "openai": key,
+            "grok": key,
+            "models": MODELS
+        }
+    }
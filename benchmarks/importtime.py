@@ -0,0 +1,160 @@
+"""Measure how long a worker takes to import the app and to become ready.
+
+    python -m benchmarks.importtime --runs 5 --output startup.json
+    python -m benchmarks.importtime --output new.json --baseline startup.json
+
+Imports backend.main in fresh interpreters under `python -X importtime`
+and reports the total and the slowest top-level packages by their own
+import time, then starts the app under uvicorn and times it to its first
+successful request. The fastest run of each is kept, as the others only
+add noise from the machine. With --baseline, slow-downs beyond --tolerance
+are reported and the exit code is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from .harness import ROOT, free_port, start_app, wait_until_ready
+from .run import git_revision
+
+MODULE = "backend.main"
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """(module, self, cumulative) microseconds from -X importtime output, in import order"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if not fields[0].isdigit():
+            # The header line
+            continue
+        imports.append((fields[2], int(fields[0]), int(fields[1])))
+    return imports
+
+def package_times(imports: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Own import time in microseconds summed per top-level package"""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in imports:
+        totals[name.split(".")[0]] += self_us
+    return dict(totals)
+
+def _env(data_dir: str) -> Dict[str, str]:
+    # Keep the import from touching the real data directory
+    return dict(
+        os.environ,
+        GEMINI_API_KEY="",
+        HISTORY_PATH=os.path.join(data_dir, "history.db"),
+        FEEDBACK_DB=os.path.join(data_dir, "feedback.db"),
+        STATE_DB=os.path.join(data_dir, "state.db"),
+        RESPONSE_CACHE_DB=os.path.join(data_dir, "cache.db")
+    )
+
+def measure_import(data_dir: str, module: str = MODULE) -> Dict:
+    """Import module once in a fresh interpreter and break down where the time went"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=_env(data_dir), capture_output=True, text=True, check=True
+    )
+    imports = parse_importtime(result.stderr)
+    total = next(cumulative for name, _, cumulative in imports if name == module)
+    return {
+        "seconds": round(total / 1e6, 4),
+        "modules": len(imports),
+        "packages": {name: round(us / 1e6, 4) for name, us in package_times(imports).items()}
+    }
+
+def measure_readiness(data_dir: str) -> float:
+    """Seconds from launching uvicorn to the app answering its first request"""
+    port = free_port()
+    start = time.perf_counter()
+    app = start_app(port, {}, data_dir)
+    try:
+        asyncio.run(wait_until_ready(f"http://127.0.0.1:{port}", poll=0.01))
+        return round(time.perf_counter() - start, 4)
+    finally:
+        app.terminate()
+        app.wait()
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe each start-up measure that got slower than the baseline by more than tolerance"""
+    regressions = []
+    for name in ("import", "readiness"):
+        previous = baseline.get(name, {}).get("seconds")
+        current = results[name]["seconds"]
+        if previous and current > previous * (1 + tolerance):
+            regressions.append(f"{name}: {previous} -> {current}s")
+    return regressions
+
+def run_benchmark(args) -> Dict:
+    imports = []
+    readiness = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as data_dir:
+            imports.append(measure_import(data_dir, args.module))
+        if not args.skip_readiness:
+            with tempfile.TemporaryDirectory() as data_dir:
+                readiness.append(measure_readiness(data_dir))
+
+    fastest = min(imports, key=lambda run: run["seconds"])
+    slowest_packages = sorted(fastest["packages"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "module": args.module
+        },
+        "import": {
+            "seconds": fastest["seconds"],
+            "runs": [run["seconds"] for run in imports],
+            "modules": fastest["modules"],
+            "packages": dict(slowest_packages)
+        }
+    }
+    if readiness:
+        results["readiness"] = {"seconds": min(readiness), "runs": readiness}
+    print(f"import {args.module}: {fastest['seconds']}s over {fastest['modules']} modules", file=sys.stderr)
+    for name, seconds in slowest_packages:
+        print(f"  {name}: {seconds}s", file=sys.stderr)
+    if readiness:
+        print(f"ready after {min(readiness)}s", file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app import time and worker readiness")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default=MODULE)
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to report")
+    parser.add_argument("--skip-readiness", action="store_true", help="Only measure the import")
+    parser.add_argument("--output", help="Write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Local mock Gemini, OpenAI and Grok servers for benchmarks.
+
+Each mock speaks its provider's wire format (Gemini generateContent and
+streamGenerateContent, OpenAI-compatible chat completions for OpenAI and
+Grok) with a configurable time to first token, token rate, reply length and
+error injection, so runs are reproducible without real keys.
+
+    python -m benchmarks.mock_providers --port 9000 --latency 0.3 --token-rate 40
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+PROVIDERS = ["gemini", "openai", "grok"]
+
+# Tokens sent per streamed chunk
+CHUNK_TOKENS = 4
+
+class MockProfile:
+    """How a mock provider behaves.
+
+    latency is the time to the first token, token_rate the tokens per second
+    generated after that (0 for instant), and error_rate the fraction of
+    requests answered with error_status instead of a completion.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        token_rate: float = 0.0,
+        reply_tokens: int = 40,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed = seed
+
+    def replace(self, **overrides) -> "MockProfile":
+        values = dict(vars(self))
+        values.update(overrides)
+        return MockProfile(**values)
+
+    def to_dict(self) -> Dict:
+        return dict(vars(self))
+
+class MockProviderServer(ThreadingHTTPServer):
+    """Threaded HTTP server for one mock provider, with request counters"""
+
+    daemon_threads = True
+    request_queue_size = 1024  # The default backlog of 5 stalls concurrent connects
+
+    def __init__(self, address, profile: MockProfile):
+        super().__init__(address, MockProviderHandler)
+        self.profile = profile
+        self.random = random.Random(profile.seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            fail = self.random.random() < self.profile.error_rate
+            if fail:
+                self.errors += 1
+        return fail
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+    def stats(self) -> Dict:
+        return {"requests": self.requests, "errors": self.errors}
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        profile = self.server.profile
+        time.sleep(profile.latency)
+        if self.server.should_fail():
+            return self._send_json(profile.error_status, {"error": {"message": "injected failure", "code": profile.error_status}})
+
+        tokens = [f"tok{n} " for n in range(profile.reply_tokens)]
+        gemini = "/models/" in self.path
+        model = self.path.split("/models/")[1].split(":")[0] if gemini else body.get("model", "mock")
+        streaming = ":streamGenerateContent" in self.path or body.get("stream")
+        if streaming:
+            self._stream(tokens, gemini, model)
+        else:
+            self._pace(len(tokens))
+            self._send_json(200, self._completion("".join(tokens), gemini, model, body))
+
+    def _pace(self, tokens: int):
+        rate = self.server.profile.token_rate
+        if rate > 0:
+            time.sleep(tokens / rate)
+
+    def _completion(self, text: str, gemini: bool, model: str, body: Dict) -> Dict:
+        if gemini:
+            return {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                "usageMetadata": {"candidatesTokenCount": self.server.profile.reply_tokens}
+            }
+        return {
+            "id": "mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+            "usage": {"completion_tokens": self.server.profile.reply_tokens}
+        }
+
+    def _chunk(self, text: str, gemini: bool, model: str) -> Dict:
+        if gemini:
+            return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+        return {
+            "id": "mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]
+        }
+
+    def _stream(self, tokens: List[str], gemini: bool, model: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i in range(0, len(tokens), CHUNK_TOKENS):
+            chunk = tokens[i:i + CHUNK_TOKENS]
+            if i:
+                self._pace(len(chunk))
+            self.wfile.write(f"data: {json.dumps(self._chunk(''.join(chunk), gemini, model))}\n\n".encode())
+            self.wfile.flush()
+        if not gemini:
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_mock_provider(profile: MockProfile, port: int = 0) -> MockProviderServer:
+    """Start a mock provider on a background thread"""
+    server = MockProviderServer(("127.0.0.1", port), profile)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_mock_providers(profiles: Dict[str, MockProfile]) -> Dict[str, MockProviderServer]:
+    """Start one mock server per provider"""
+    return {provider: start_mock_provider(profile) for provider, profile in profiles.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock LLM provider (Gemini and OpenAI-compatible)")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to the first token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Tokens per second after the first (0 = instant)")
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    profile = MockProfile(args.latency, args.token_rate, args.reply_tokens, args.error_rate, args.error_status)
+    server = MockProviderServer(("127.0.0.1", args.port), profile)
+    print(f"Mock provider at {server.base_url} ({profile.to_dict()})")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Benchmark the chat, select-response and history endpoints against mock providers.
+
+    python -m benchmarks.run --concurrency 16 --duration 10 --output results.json
+    python -m benchmarks.run --output new.json --baseline results.json
+
+Starts mock Gemini, OpenAI and Grok servers, runs the app under uvicorn
+with throwaway storage, and drives each scenario at a fixed concurrency.
+Results (throughput, latency percentiles, app memory, mock request and
+error counts) are written as JSON. With --baseline, throughput drops or
+p95 latency rises beyond --tolerance are reported and the exit code is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+from .harness import ROOT, chat_payload, free_port, run_load, start_app, wait_until_ready
+from .mock_providers import PROVIDERS, MockProfile, start_mock_providers
+
+SCENARIOS = ["chat", "select", "history"]
+
+def scenario_request(scenario: str, keys_per_user: int):
+    """The request a virtual user repeats in a scenario"""
+    if scenario == "chat":
+        async def request(client: httpx.AsyncClient, user: int, i: int) -> bool:
+            response = await client.post("/api/chat", json=chat_payload(user, keys_per_user, i))
+            return response.status_code == 200 and all(r["status"] == "ok" for r in response.json().values())
+    elif scenario == "select":
+        async def request(client: httpx.AsyncClient, user: int, i: int) -> bool:
+            response = await client.post("/api/select_response", json={
+                "type": "assistant",
+                "message": f"Selected answer {i}",
+                "source": PROVIDERS[i % len(PROVIDERS)],
+                "user_id": f"bench-{user}"
+            })
+            return response.status_code == 200
+    elif scenario == "history":
+        async def request(client: httpx.AsyncClient, user: int, i: int) -> bool:
+            response = await client.get("/api/history", params={"user_id": f"bench-{user}"})
+            return response.status_code == 200
+    else:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    return request
+
+def parse_overrides(specs: List[str]) -> Dict[str, Dict]:
+    """Parse --mock provider:key=value,... into per-provider profile overrides"""
+    overrides: Dict[str, Dict] = {}
+    for spec in specs:
+        provider, _, settings = spec.partition(":")
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider in --mock {spec}")
+        for setting in filter(None, settings.split(",")):
+            key, _, value = setting.partition("=")
+            key = key.replace("-", "_")
+            overrides.setdefault(provider, {})[key] = int(value) if key in ("reply_tokens", "error_status", "seed") else float(value)
+    return overrides
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every scenario that got slower than the baseline by more than tolerance"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput']} -> {current['throughput']} req/s")
+        if current["latency"]["p95"] > previous["latency"]["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['latency']['p95']} -> {current['latency']['p95']}s")
+    return regressions
+
+def run_benchmark(args) -> Dict:
+    base = MockProfile(args.latency, args.token_rate, args.reply_tokens, args.error_rate, args.error_status, args.seed)
+    overrides = parse_overrides(args.mock)
+    profiles = {provider: base.replace(**overrides.get(provider, {})) for provider in PROVIDERS}
+    mocks = start_mock_providers(profiles)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mocks": {provider: profile.to_dict() for provider, profile in profiles.items()}
+        },
+        "scenarios": {}
+    }
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            app = start_app(port, {p: m.base_url for p, m in mocks.items()}, data_dir, args.workers)
+            try:
+                asyncio.run(wait_until_ready(base_url))
+                for scenario in args.scenarios:
+                    before = {p: m.stats() for p, m in mocks.items()}
+                    result = asyncio.run(run_load(
+                        base_url, scenario_request(scenario, args.keys_per_user), args.concurrency, args.duration, app.pid
+                    ))
+                    result["providers"] = {
+                        p: {k: m.stats()[k] - before[p][k] for k in before[p]} for p, m in mocks.items()
+                    }
+                    results["scenarios"][scenario] = result
+                    print(f"{scenario}: {result['throughput']} req/s, p50 {result['latency']['p50']}s, "
+                          f"p95 {result['latency']['p95']}s, {result['errors']} errors", file=sys.stderr)
+            finally:
+                app.terminate()
+                app.wait()
+    finally:
+        for mock in mocks.values():
+            mock.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app against mock LLM providers")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--keys-per-user", type=int, default=4, help="API keys each virtual user rotates through")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock seconds to the first token")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Mock tokens per second (0 = instant)")
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mock", action="append", default=[], metavar="PROVIDER:KEY=VALUE,...",
+                        help="Per-provider overrides, e.g. gemini:latency=0.5,error_rate=0.1")
+    parser.add_argument("--output", help="Write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Type
+
+import pytest
+
+import backend.main as main
+from backend.history_cache import HistoryCache
+from backend.history_store import SQLiteHistoryStore
+from backend.history_writer import HistoryWriter
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # The default backlog of 5 stalls concurrent connects
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Gemini and OpenAI-compatible completion endpoints with a fixed latency.
+
+    The first `failures` requests are answered with `status` instead, and
+    requests made with `rejected_key` with 401.
+    """
+
+    latency = 0.5
+    failures = 0
+    status = 503
+    rejected_key = None
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            type(self).requests += 1
+            fail = type(self).requests <= self.failures
+        if fail:
+            self._reply(self.status, {"error": {"message": "unavailable"}})
+            return
+        time.sleep(self.latency)
+        key = self.headers.get("x-goog-api-key") or self.headers.get("Authorization", "").removeprefix("Bearer ")
+        if self.rejected_key is not None and key == self.rejected_key:
+            self._reply(401, {"error": {"message": "invalid api key"}})
+            return
+        if self.path.endswith(":generateContent"):
+            model = self.path.split("/models/")[1].split(":")[0]
+            self._reply(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": f"stub reply from {model}"}]}}]
+            })
+        else:
+            self._reply(200, {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": f"stub reply from {body['model']}"}
+                }]
+            })
+
+    def _reply(self, code: int, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server() -> Callable[..., StubServer]:
+    """Start stub provider servers, stopped when the test ends.
+
+    Call with a handler class (StubProviderHandler by default) and any class
+    attributes to override on it, e.g. stub_server(failures=1, latency=0.1).
+    """
+    servers: List[StubServer] = []
+
+    def start(handler: Optional[Type[BaseHTTPRequestHandler]] = None, **attrs) -> StubServer:
+        handler = type("Handler", (handler or StubProviderHandler,), {"requests": 0, **attrs})
+        server = StubServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+@pytest.fixture
+def temp_history(monkeypatch, tmp_path) -> SQLiteHistoryStore:
+    """Point the app's history store, writer and cache at a throwaway database"""
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    monkeypatch.setattr(main, "history_store", store)
+    monkeypatch.setattr(main, "history_writer", HistoryWriter(store))
+    monkeypatch.setattr(main, "history_cache", HistoryCache(store))
+    return store
+
+@pytest.fixture
+def chat_payload() -> Callable[[str], dict]:
+    """Build a chat request from a user with a key for every provider"""
+    def payload(user_id: str) -> dict:
+        return {
+            "message": "Hello there",
+            "user_id": user_id,
+            "service_keys": {
+                "user_id": user_id,
+                "gemini": "test-gemini-key",
+                "openai": "test-openai-key",
+                "grok": "test-grok-key",
+                "models": {"gemini": "gemini-pro", "openai": "gpt-3.5-turbo", "grok": "grok-1"}
+            }
+        }
+    return payload
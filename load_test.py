@@ -0,0 +1,65 @@
+"""Measure /api/chat throughput as the number of worker processes grows.
+
+Starts local mock providers, then for each worker count runs the app under
+uvicorn with that many workers (all sharing one set of SQLite files, as in
+a real multi-worker deployment) and drives it with concurrent chat requests
+for a fixed duration.
+
+    python load_test.py --workers 1 2 4 --concurrency 64 --duration 15
+
+Each virtual user rotates through its own API keys, so per-key rate limits
+do not cap the aggregate throughput being measured.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+import httpx
+
+from benchmarks.harness import chat_payload, free_port, run_load, start_app, wait_until_ready
+from benchmarks.mock_providers import PROVIDERS, MockProfile, start_mock_providers
+
+KEYS_PER_USER = 4
+
+async def chat(client: httpx.AsyncClient, user: int, i: int) -> bool:
+    response = await client.post("/api/chat", json=chat_payload(user, KEYS_PER_USER, i))
+    return response.status_code == 200 and all(r["status"] == "ok" for r in response.json().values())
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chat throughput against worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--provider-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    mocks = start_mock_providers({provider: MockProfile(latency=args.provider_latency) for provider in PROVIDERS})
+    results = []
+    for workers in args.workers:
+        port = free_port()
+        with tempfile.TemporaryDirectory() as data_dir:
+            app = start_app(port, {p: m.base_url for p, m in mocks.items()}, data_dir, workers)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                asyncio.run(wait_until_ready(base_url))
+                result = asyncio.run(run_load(base_url, chat, args.concurrency, args.duration, app.pid))
+            finally:
+                app.terminate()
+                app.wait()
+        result["workers"] = workers
+        results.append(result)
+        print(f"{workers} worker(s): {result['throughput']} req/s, p50 {result['latency']['p50']}s, "
+              f"p95 {result['latency']['p95']}s, {result['errors']} errors", file=sys.stderr)
+
+    for mock in mocks.values():
+        mock.shutdown()
+    baseline = results[0]["throughput"] or 1
+    for result in results:
+        result["speedup"] = round(result["throughput"] / baseline, 2)
+    print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
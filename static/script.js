@@ -162,7 +162,7 @@ async function updateMetrics() {
             </div>
             <div class="metric">
                 <span>Total Cost:</span>
-                <span>$${metrics.total_cost.toFixed(2)}</span>
+                <span>$${metrics.total_cost.toFixed(4)}</span>
             </div>
             <div class="metric">
                 <span>Positive Feedback:</span>
@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import httpx
+
+import backend.main as main
+from backend.batch_chat import completed, load_prompts, remaining, run
+from backend.fanout import STATUS_OK, run_batch
+from backend.rate_limiter import RateLimitExceeded
+from benchmarks.mock_providers import MockProfile, start_mock_provider, start_mock_providers
+
+def test_each_provider_keeps_to_its_own_concurrency():
+    in_flight = {"fast": 0, "slow": 0}
+    peak = {"fast": 0, "slow": 0}
+
+    def call(provider: str, delay: float):
+        async def run():
+            in_flight[provider] += 1
+            peak[provider] = max(peak[provider], in_flight[provider])
+            await asyncio.sleep(delay)
+            in_flight[provider] -= 1
+            return provider
+        return run
+
+    work = {
+        "fast": [(str(n), call("fast", 0.001)) for n in range(20)],
+        "slow": [(str(n), call("slow", 0.02)) for n in range(20)]
+    }
+
+    async def collect():
+        return [result async for result in run_batch(work, {"fast": 2, "slow": 5})]
+
+    results = asyncio.run(collect())
+
+    assert len(results) == 40
+    assert all(result["status"] == STATUS_OK for result in results)
+    assert peak == {"fast": 2, "slow": 5}
+    # The fast provider is not held back by the slow one
+    assert [r["provider"] for r in results[:20]].count("fast") > 10
+
+def test_shed_items_are_retried_after_the_hint():
+    attempts = []
+
+    async def shed_once():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimitExceeded("grok", 0.01, "quota")
+        return "answer"
+
+    async def collect():
+        return [result async for result in run_batch({"grok": [("1", shed_once)]}, {"grok": 1})]
+
+    [result] = asyncio.run(collect())
+    assert (result["status"], result["response"], result["attempts"]) == (STATUS_OK, "answer", 2)
+
+def test_batch_streams_results_without_touching_history(tmp_path, monkeypatch, temp_history):
+    mocks = start_mock_providers({"openai": MockProfile(latency=0.01, reply_tokens=2), "grok": MockProfile(latency=0.01, reply_tokens=2)})
+    for provider, mock in mocks.items():
+        monkeypatch.setitem(main.PROVIDER_ENDPOINTS, provider, mock.base_url)
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    store = temp_history
+    prompts_path = tmp_path / "prompts.jsonl"
+    prompts_path.write_text("".join(json.dumps({"message": f"Evaluate {n}", "history": []}) + "\n" for n in range(6)))
+    output_path = tmp_path / "results.jsonl"
+    keys = {"user_id": "batch", "openai": "eval-key", "grok": "eval-key", "models": {"openai": "gpt-3.5-turbo", "grok": "grok-1"}}
+
+    async def go(prompts):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run(client, prompts, str(output_path), keys, ["openai", "grok"], chunk_size=4)
+
+    try:
+        prompts = load_prompts(str(prompts_path))
+        # An interrupted run that only got through the first two prompts
+        first = asyncio.run(go(prompts[:2]))
+        resumed = asyncio.run(go(prompts))
+    finally:
+        for mock in mocks.values():
+            mock.shutdown()
+
+    assert first == {"prompts": 2, "pending": 2, "ok": 4, "skipped": 0, "failed": 0}
+    assert resumed == {"prompts": 6, "pending": 4, "ok": 8, "skipped": 0, "failed": 0}
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert sorted((r["id"], r["provider"]) for r in results) == sorted(
+        (str(n), provider) for n in range(1, 7) for provider in ["openai", "grok"]
+    )
+    assert {r["model"] for r in results} == {"gpt-3.5-turbo", "grok-1"}
+    assert mocks["openai"].stats()["requests"] == 6
+    assert not store.has_history("batch")
+
+def test_resume_skips_only_successful_answers(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(
+        json.dumps({"id": "1", "provider": "openai", "status": "ok"}) + "\n"
+        + json.dumps({"id": "1", "provider": "grok", "status": "timed_out"}) + "\n"
+        + '{"id": "2", "provi'
+    )
+    prompts = [{"id": "1", "message": "a"}, {"id": "2", "message": "b"}]
+
+    assert completed(str(output)) == {("1", "openai")}
+    assert remaining(prompts, ["openai", "grok"], completed(str(output))) == [
+        {"id": "1", "message": "a", "providers": ["grok"]},
+        {"id": "2", "message": "b", "providers": ["openai", "grok"]}
+    ]
+
+def test_providers_without_a_key_are_recorded_as_skipped_once(tmp_path, monkeypatch, temp_history):
+    mock = start_mock_provider(MockProfile(latency=0.01, reply_tokens=2))
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", mock.base_url)
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    output_path = tmp_path / "results.jsonl"
+    prompts = [{"id": "1", "message": "a", "providers": ["gemini", "grok"]}]
+    keys = {"user_id": "batch", "grok": "eval-key", "models": {"grok": "grok-1"}}
+
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await run(client, prompts, str(output_path), keys, ["gemini", "grok"])
+
+    try:
+        first = asyncio.run(go())
+        resumed = asyncio.run(go())
+    finally:
+        mock.shutdown()
+
+    assert first == {"prompts": 1, "pending": 1, "ok": 1, "skipped": 1, "failed": 0}
+    assert resumed == {"prompts": 1, "pending": 0, "ok": 0, "skipped": 0, "failed": 0}
+    skipped = [json.loads(line) for line in output_path.read_text().splitlines() if '"gemini"' in line]
+    assert [(r["id"], r["status"], r["error"]) for r in skipped] == [("1", "skipped", "no key")]
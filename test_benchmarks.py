@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from backend.clients import GeminiClient, GrokClient
+from benchmarks.mock_providers import MockProfile, start_mock_provider
+from benchmarks.run import compare, parse_overrides
+
+def test_mocks_speak_each_provider_format_at_the_configured_rate():
+    server = start_mock_provider(MockProfile(latency=0.1, token_rate=100, reply_tokens=20))
+    gemini = GeminiClient("key", "gemini-pro", server.base_url)
+    grok = GrokClient("key", "grok-1", server.base_url)
+
+    async def run():
+        start = time.perf_counter()
+        text = await gemini.generate("Hi")
+        elapsed = time.perf_counter() - start
+        chunks = [chunk async for chunk in grok.stream([{"role": "user", "content": "Hi"}])]
+        return text, elapsed, chunks
+
+    try:
+        text, elapsed, chunks = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert text.split() == [f"tok{n}" for n in range(20)]
+    assert 0.3 <= elapsed < 1  # 0.1s to the first token + 20 tokens at 100/s
+    assert len(chunks) == 5
+    assert server.stats() == {"requests": 2, "errors": 0}
+
+def test_mocks_inject_errors_at_the_configured_rate():
+    server = start_mock_provider(MockProfile(latency=0, error_rate=0.5, error_status=429, seed=7))
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [
+                (await client.post(f"{server.base_url}/chat/completions", json={"model": "gpt-4"})).status_code
+                for _ in range(200)
+            ]
+
+    try:
+        statuses = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert set(statuses) == {200, 429}
+    assert 60 < statuses.count(429) < 140
+    assert server.stats()["errors"] == statuses.count(429)
+
+def test_regressions_are_detected_against_a_baseline():
+    baseline = {"scenarios": {"chat": {"throughput": 100, "latency": {"p95": 0.5}}}}
+    steady = {"scenarios": {"chat": {"throughput": 95, "latency": {"p95": 0.55}}}}
+    slower = {"scenarios": {"chat": {"throughput": 70, "latency": {"p95": 0.9}}}}
+
+    assert compare(steady, baseline, tolerance=0.15) == []
+    assert len(compare(slower, baseline, tolerance=0.15)) == 2
+
+def test_per_provider_overrides_are_parsed():
+    assert parse_overrides(["gemini:latency=0.5,error_rate=0.1", "grok:reply_tokens=10"]) == {
+        "gemini": {"latency": 0.5, "error_rate": 0.1},
+        "grok": {"reply_tokens": 10}
+    }
+    overrides = parse_overrides(["grok:reply-tokens=10,error-status=500"])
+    assert overrides == {"grok": {"reply_tokens": 10, "error_status": 500}}
+    assert all(type(value) is int for value in overrides["grok"].values())
+    with pytest.raises(ValueError):
+        parse_overrides(["claude:latency=1"])
@@ -0,0 +1,69 @@
+import asyncio
+
+from backend.clients import ClientRegistry, GrokClient
+
+def make_factory(created: list):
+    def factory(api_key: str, model: str):
+        client = GrokClient(api_key, model, "http://localhost")
+        created.append(client)
+        return client
+    return factory
+
+def test_client_is_reused_per_key_and_model():
+    """Repeated lookups return the same client; different keys stay isolated"""
+    created = []
+
+    async def run():
+        registry = ClientRegistry()
+        factory = make_factory(created)
+        first = registry.get("grok", "key-a", "grok-1", factory)
+        again = registry.get("grok", "key-a", "grok-1", factory)
+        other_key = registry.get("grok", "key-b", "grok-1", factory)
+        other_model = registry.get("grok", "key-a", "grok-2", factory)
+        return registry, first, again, other_key, other_model
+
+    registry, first, again, other_key, other_model = asyncio.run(run())
+
+    assert first is again
+    assert len(created) == 3
+    assert other_key.headers["Authorization"] == "Bearer key-b"
+    assert first.headers["Authorization"] == "Bearer key-a"
+    assert other_model.model == "grok-2"
+    assert registry.stats() == {"size": 3, "hits": 1, "misses": 3, "evictions": 0}
+
+def test_least_recently_used_client_is_evicted():
+    created = []
+
+    async def run():
+        registry = ClientRegistry(max_size=2)
+        factory = make_factory(created)
+        registry.get("grok", "key-a", "grok-1", factory)
+        registry.get("grok", "key-b", "grok-1", factory)
+        registry.get("grok", "key-a", "grok-1", factory)  # key-a is now most recent
+        registry.get("grok", "key-c", "grok-1", factory)  # evicts key-b
+        registry.get("grok", "key-a", "grok-1", factory)
+        registry.get("grok", "key-b", "grok-1", factory)
+        return registry
+
+    registry = asyncio.run(run())
+
+    assert [client.headers["Authorization"] for client in created] == [
+        "Bearer key-a", "Bearer key-b", "Bearer key-c", "Bearer key-b"
+    ]
+    assert registry.stats()["size"] == 2
+
+def test_idle_clients_are_evicted():
+    created = []
+
+    async def run():
+        registry = ClientRegistry(idle_timeout=0.05)
+        factory = make_factory(created)
+        registry.get("grok", "key-a", "grok-1", factory)
+        await asyncio.sleep(0.1)
+        registry.get("grok", "key-a", "grok-1", factory)
+        return registry
+
+    registry = asyncio.run(run())
+
+    assert len(created) == 2
+    assert registry.stats()["evictions"] == 1
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+import backend.main as main
+from backend.compaction import HistoryCompactor, extractive_summary
+from backend.context_builder import build_context, count_tokens
+from backend.history_cache import HistoryCache
+from backend.history_store import JSONLHistoryStore, SQLiteHistoryStore
+
+LIMITS = {"context_window": 4096, "reserved_output": 1024}
+
+def fill(store, user_id: str, count: int):
+    store.append_many([
+        (user_id, {"type": "user" if n % 2 == 0 else "assistant", "message": f"Turn {n}. More detail follows."})
+        for n in range(count)
+    ])
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous, turns):
+        self.calls.append((previous, [turn["message"] for turn in turns]))
+        return f"summary through {turns[-1]['message']}"
+
+def test_extractive_summary_stays_within_its_token_budget():
+    turns = [{"type": "user", "message": f"Question number {n} about deployment. Some detail."} for n in range(100)]
+
+    summary = extractive_summary(None, turns, max_tokens=60)
+
+    assert count_tokens(summary) <= 60
+    # The oldest lines are dropped first, and only the opening sentence is kept
+    assert summary.splitlines()[-1] == "User: Question number 99 about deployment."
+    assert "Question number 0 " not in summary
+
+def test_older_turns_are_folded_into_the_summary(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    fill(store, "alice", 50)
+    summarizer = RecordingSummarizer()
+    compactor = HistoryCompactor(store, summarizer, threshold=40, keep_recent=20)
+
+    assert asyncio.run(compactor.compact("alice"))
+    summary = store.get_summary("alice")
+    entries = store.page("alice", limit=100)
+    assert summary == {"summary": "summary through Turn 29. More detail follows.", "through_id": entries[29]["id"]}
+    assert summarizer.calls[0][0] is None
+    assert len(summarizer.calls[0][1]) == 30
+
+    # Only 20 unsummarized entries remain, under the threshold
+    assert not asyncio.run(compactor.compact("alice"))
+    # Raw entries are kept for the history view
+    assert len(store.load("alice")) == 50
+
+def test_long_backlogs_are_compacted_over_several_passes(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    fill(store, "bob", 250)
+    summarizer = RecordingSummarizer()
+    compactor = HistoryCompactor(store, summarizer, threshold=40, keep_recent=20, batch=100)
+    compactor.mark("bob")
+
+    async def run():
+        for _ in range(4):
+            await compactor.run_pass()
+
+    asyncio.run(run())
+
+    assert [len(turns) for _, turns in summarizer.calls] == [100, 100, 30]
+    # Each pass builds on the summary before it
+    assert summarizer.calls[1][0] == "summary through Turn 99. More detail follows."
+    assert compactor.stats()["entries_compacted"] == 230
+    assert compactor.stats()["marked_users"] == 0
+
+def test_jsonl_summaries_never_move_backwards(tmp_path):
+    store = JSONLHistoryStore(str(tmp_path / "history"))
+    store.set_summary("carol", "newer", 30)
+    store.set_summary("carol", "older", 10)
+
+    assert store.get_summary("carol") == {"summary": "newer", "through_id": 30}
+    assert store.get_summary("dave") is None
+
+def test_providers_see_the_summary_then_recent_turns(tmp_path, monkeypatch):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    monkeypatch.setattr(main, "history_cache", HistoryCache(store))
+    fill(store, "erin", 50)
+    asyncio.run(HistoryCompactor(store, RecordingSummarizer(), threshold=40, keep_recent=20).compact("erin"))
+
+    history = main.load_history("erin")
+    context = build_context(history, "What next?", LIMITS)
+    messages = main._openai_messages("What next?", context)
+
+    assert history[0] == {"type": "summary", "message": "summary through Turn 29. More detail follows."}
+    assert len(history) == 21
+    assert messages[0] == {"role": "system", "content": "Summary of the earlier conversation: summary through Turn 29. More detail follows."}
+    assert messages[1]["content"] == "Turn 30. More detail follows."
+    assert messages[-1] == {"role": "user", "content": "What next?"}
+
+@pytest.mark.parametrize("model", ["", "openai/gpt-3.5-turbo"])
+def test_summaries_fall_back_to_the_local_summarizer(monkeypatch, model):
+    # Without a model, or with one that has no key, summaries are written locally
+    monkeypatch.setattr(main, "COMPACTION_MODEL", model)
+    turns = [{"type": "user", "message": "Plan the launch. Then the rest."}]
+
+    assert asyncio.run(main.summarize_history("User: Earlier.", turns)) == "User: Earlier.\nUser: Plan the launch."
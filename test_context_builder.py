@@ -0,0 +1,46 @@
+from backend.context_builder import MESSAGE_OVERHEAD, build_context, context_budget, count_tokens
+
+LIMITS = {"context_window": 4096, "reserved_output": 1024}
+
+def turn(type: str, message: str) -> dict:
+    return {"type": type, "message": message}
+
+def test_token_estimate_grows_with_text_and_is_memoized():
+    count_tokens.cache_clear()
+    short = count_tokens("Hello, world!")
+    long = count_tokens("Hello, world! " * 50)
+
+    assert 0 < short < long
+    count_tokens("Hello, world!")
+    assert count_tokens.cache_info().hits == 1
+
+def test_many_small_turns_all_fit():
+    history = [turn("user" if i % 2 == 0 else "assistant", f"msg {i}") for i in range(40)]
+
+    assert build_context(history, "next question", LIMITS) == history
+
+def test_long_turns_are_trimmed_from_the_oldest_end():
+    long_text = "word " * 1000  # ~1000 tokens each
+    history = [turn("user", f"{i} {long_text}") for i in range(5)]
+
+    context = build_context(history, "next question", LIMITS)
+
+    assert 0 < len(context) < 5
+    assert context == history[-len(context):]
+    used = sum(count_tokens(entry["message"]) + MESSAGE_OVERHEAD for entry in context)
+    assert used <= context_budget("next question", LIMITS)
+
+def test_logged_provider_responses_are_not_context():
+    history = [
+        turn("user", "Hi"),
+        {"type": "response", "message": "Hello from Gemini", "source": "gemini"},
+        {"type": "assistant", "message": "Hello!", "source": "gemini"}
+    ]
+
+    assert build_context(history, "next", LIMITS) == [history[0], history[2]]
+
+def test_budget_reserves_output_and_message():
+    tight = {"context_window": 100, "reserved_output": 90}
+
+    assert context_budget("hello", tight) == 0
+    assert build_context([turn("user", "Hi")], "hello", tight) == []
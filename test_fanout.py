@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from backend.fanout import fan_out, STATUS_OK, STATUS_TIMED_OUT, STATUS_ERROR
+
+def make_call(delay: float, text: str):
+    """Build a fake provider call that answers after a delay"""
+    async def call():
+        await asyncio.sleep(delay)
+        return text
+    return call
+
+def test_providers_run_concurrently():
+    """Total latency should track the slowest provider, not the sum"""
+    calls = {name: make_call(0.2, name) for name in ["gemini", "openai", "grok"]}
+    start = time.perf_counter()
+    results = asyncio.run(fan_out(calls))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.4
+    assert {name: result["response"] for name, result in results.items()} == {
+        "gemini": "gemini", "openai": "openai", "grok": "grok"
+    }
+    assert all(result["status"] == STATUS_OK for result in results.values())
+
+def test_slow_provider_times_out_without_blocking_others():
+    """A provider that misses its deadline returns a timed_out result"""
+    calls = {
+        "gemini": make_call(0.05, "fast"),
+        "grok": make_call(5, "slow")
+    }
+    start = time.perf_counter()
+    results = asyncio.run(fan_out(calls, timeouts={"grok": 0.2}))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 1
+    assert results["gemini"]["status"] == STATUS_OK
+    assert results["grok"]["status"] == STATUS_TIMED_OUT
+
+def test_failing_provider_is_isolated():
+    """An exception in one provider does not cancel the rest"""
+    async def broken():
+        raise RuntimeError("boom")
+
+    results = asyncio.run(fan_out({"openai": broken, "gemini": make_call(0.01, "ok")}))
+
+    assert results["openai"]["status"] == STATUS_ERROR
+    assert "boom" in results["openai"]["response"]
+    assert results["gemini"]["response"] == "ok"
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import httpx
+
+import backend.feedback_store as feedback_store_module
+import backend.main as main
+from backend.feedback_store import FeedbackStore
+from backend.history_writer import HistoryWriter
+
+def test_tallies_follow_changed_feedback(tmp_path):
+    store = FeedbackStore(str(tmp_path / "feedback.db"))
+    store.record("m1", "openai", "positive", "gpt-4")
+    store.record("m1", "grok", "negative", "grok-1")
+    store.record("m1", "openai", "negative", "gpt-4")  # Changed their mind
+
+    assert store.get("m1") == {"openai": "negative", "grok": "negative"}
+    assert store.summary() == {"positive": 0, "negative": 2}
+    assert store.tallies() == {"openai/gpt-4": {"negative": 1}, "grok/grok-1": {"negative": 1}}
+    store.close()
+
+    reopened = FeedbackStore(str(tmp_path / "feedback.db"))
+    assert reopened.summary()["negative"] == 2
+    reopened.close()
+
+def test_windowed_queries_only_count_recent_feedback(tmp_path, monkeypatch):
+    store = FeedbackStore(str(tmp_path / "feedback.db"))
+    now = time.time()
+    monkeypatch.setattr(feedback_store_module.time, "time", lambda: now - 7200)
+    store.record("old", "openai", "negative", "gpt-4")
+    monkeypatch.setattr(feedback_store_module.time, "time", lambda: now)
+    store.record("m1", "openai", "negative", "gpt-4")
+    store.record("m2", "openai", "positive", "gpt-4")
+    store.record("m3", "openai", "positive", "gpt-3.5-turbo")
+
+    hour = store.window(3600, model="gpt-4")
+
+    assert hour["counts"] == {"negative": 1, "positive": 1}
+    assert hour["negative_rate"] == 0.5
+    assert store.window(3 * 3600, service="openai")["total"] == 4
+    store.close()
+
+def test_concurrent_feedback_is_batched(tmp_path):
+    store = FeedbackStore(str(tmp_path / "feedback.db"))
+    writer = HistoryWriter(store)
+
+    async def run():
+        await asyncio.gather(*[
+            writer.append(f"m{n}", {"service": "gemini", "model": "gemini-pro", "feedback": "positive"})
+            for n in range(2000)
+        ])
+        await writer.close()
+
+    asyncio.run(run())
+
+    assert store.summary() == {"positive": 2000}
+    assert writer.stats()["flushes"] < 20
+    store.close()
+
+def test_feedback_endpoints(tmp_path, monkeypatch):
+    store = FeedbackStore(str(tmp_path / "feedback.db"))
+    monkeypatch.setattr(main, "feedback_store", store)
+    monkeypatch.setattr(main, "feedback_writer", HistoryWriter(store))
+    monkeypatch.setattr(main.ai_services, "feedback_store", store)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            params = {"message_id": "m1", "service": "openai", "feedback": "negative", "model": "gpt-4"}
+            await client.post("/api/feedback", params=params)
+            summary = (await client.get("/api/feedback/summary", params={"model": "gpt-4"})).json()
+            metrics = (await client.get("/api/metrics")).json()
+            return summary, metrics
+
+    summary, metrics = asyncio.run(run())
+
+    assert summary["negative_rate"] == 1.0
+    assert metrics["feedback_summary"] == {"positive": 0, "negative": 1}
+    assert metrics["feedback"] == {"openai/gpt-4": {"negative": 1}}
+    store.close()
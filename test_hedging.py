@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import httpx
+
+import backend.main as main
+from backend.fanout import STATUS_CANCELLED, STATUS_ERROR, STATUS_OK, race
+from backend.metrics import MetricsRegistry
+from backend.resilience import CircuitBreakerRegistry, HedgeBudget
+from benchmarks.mock_providers import MockProfile, start_mock_providers
+
+def answer_after(delay: float, text: str, started: list = None, cancelled: list = None):
+    async def call():
+        if started is not None:
+            started.append(text)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(text)
+            raise
+        return text
+    return call
+
+def fail_after(delay: float):
+    async def call():
+        await asyncio.sleep(delay)
+        raise RuntimeError("provider exploded")
+    return call
+
+def test_race_returns_the_first_answer_and_cancels_the_rest():
+    cancelled = []
+    calls = {"slow": answer_after(1, "slow", cancelled=cancelled), "fast": answer_after(0.01, "fast")}
+
+    start = time.perf_counter()
+    outcome = asyncio.run(race(calls))
+
+    assert time.perf_counter() - start < 0.5
+    assert outcome["winner"] == "fast"
+    assert outcome["results"]["fast"]["response"] == "fast"
+    assert outcome["results"]["slow"]["status"] == STATUS_CANCELLED
+    assert cancelled == ["slow"]
+
+def test_race_skips_failures():
+    outcome = asyncio.run(race({"broken": fail_after(0), "working": answer_after(0.05, "working")}))
+
+    assert outcome["winner"] == "working"
+    assert outcome["results"]["broken"]["status"] == STATUS_ERROR
+
+def test_hedge_starts_only_after_the_first_call_is_slow():
+    started = []
+    quick = {"first": answer_after(0.01, "first", started), "second": answer_after(0.01, "second", started)}
+    outcome = asyncio.run(race(quick, hedge_delays={"first": 0.2, "second": 0.2}))
+    assert outcome["winner"] == "first"
+    assert not outcome["hedged"]
+    assert started == ["first"]
+
+    started = []
+    slow_first = {"first": answer_after(1, "first", started), "second": answer_after(0.01, "second", started)}
+    outcome = asyncio.run(race(slow_first, hedge_delays={"first": 0.05, "second": 0.05}))
+    assert outcome["winner"] == "second"
+    assert outcome["hedged"]
+    assert outcome["results"]["first"]["status"] == STATUS_CANCELLED
+
+def test_failed_call_fails_over_without_waiting_for_the_hedge_delay():
+    calls = {"broken": fail_after(0), "backup": answer_after(0.01, "backup")}
+
+    start = time.perf_counter()
+    outcome = asyncio.run(race(calls, hedge_delays={"broken": 5, "backup": 5}, budget=HedgeBudget(ratio=0, burst=0)))
+
+    assert time.perf_counter() - start < 1
+    assert outcome["winner"] == "backup"
+    assert not outcome["hedged"]
+
+def test_exhausted_budget_stops_hedging():
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    calls = lambda: {"first": answer_after(0.1, "first"), "second": answer_after(0.01, "second")}
+    delays = {"first": 0.01, "second": 0.01}
+
+    async def run():
+        return [await race(calls(), hedge_delays=delays, budget=budget) for _ in range(3)]
+
+    outcomes = asyncio.run(run())
+
+    # The saved-up token pays for one hedge and two requests' deposits for another
+    assert [o["hedged"] for o in outcomes] == [True, False, True]
+    assert [o["winner"] for o in outcomes] == ["second", "first", "second"]
+    assert budget.stats() == {"ratio": 0.5, "requests": 3, "hedges": 2, "denied": 1, "available": 0.0}
+
+def test_race_mode_answers_from_the_fastest_provider(monkeypatch, temp_history):
+    mocks = start_mock_providers({"gemini": MockProfile(latency=1), "grok": MockProfile(latency=0.01, reply_tokens=3)})
+    for provider, mock in mocks.items():
+        monkeypatch.setitem(main.PROVIDER_ENDPOINTS, provider, mock.base_url)
+    monkeypatch.setattr(main, "provider_metrics", MetricsRegistry(main.MODEL_CONFIGS))
+    monkeypatch.setattr(main, "circuit_breakers", CircuitBreakerRegistry())
+    payload = {
+        "message": "Race me",
+        "user_id": "racer",
+        "use_cache": False,
+        "mode": "race",
+        "service_keys": {
+            "user_id": "racer",
+            "gemini": "race-key",
+            "grok": "race-key",
+            "models": {"gemini": "gemini-pro", "grok": "grok-1"}
+        }
+    }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            chat = (await client.post("/api/chat", json=payload)).json()
+            elapsed = time.perf_counter() - start
+            metrics = (await client.get("/api/metrics")).json()
+            return chat, elapsed, metrics
+
+    try:
+        chat, elapsed, metrics = asyncio.run(run())
+    finally:
+        for mock in mocks.values():
+            mock.shutdown()
+
+    assert elapsed < 1
+    assert chat["winner"] == "grok/grok-1"
+    assert chat["status"] == STATUS_OK
+    assert chat["response"] == "tok0 tok1 tok2 "
+    assert chat["attempts"]["gemini/gemini-pro"]["status"] == STATUS_CANCELLED
+    # Losing a race is not the provider's fault
+    assert metrics["providers"]["gemini/gemini-pro"]["requests"] == 0
+    assert all(b["consecutive_failures"] == 0 for b in metrics["circuit_breakers"].values())
@@ -0,0 +1,101 @@
+import asyncio
+
+import backend.main as main
+from backend.history_cache import CachedEntry, HistoryCache
+from backend.history_store import JSONLHistoryStore, SQLiteHistoryStore
+
+def fill(store, user_id: str, count: int):
+    store.append_many([(user_id, {"type": "user", "message": f"Message {n}"}) for n in range(count)])
+
+def test_turns_are_served_from_memory_and_written_through(temp_history):
+    store = temp_history
+    fill(store, "alice", 3)
+
+    async def turn():
+        history = main.load_history("alice")
+        await main.append_history("alice", {"type": "user", "message": "Next question"})
+        await main.append_history("alice", {"type": "response", "message": "An answer", "source": "grok"})
+        return history
+
+    first = asyncio.run(turn())
+    second = main.load_history("alice")
+
+    assert [entry["message"] for entry in first] == ["Message 0", "Message 1", "Message 2"]
+    # The cached conversation matches what the store now holds, ids included
+    assert second == store.page("alice")
+    assert second[-1] == {"type": "response", "message": "An answer", "source": "grok", "id": 5}
+    assert (main.history_cache.stats()["hits"], main.history_cache.stats()["misses"]) == (1, 1)
+
+def test_least_recently_used_conversations_are_evicted_to_fit_the_memory_budget(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    for user in ["a", "b", "c"]:
+        store.append_many([(user, {"type": "user", "message": "x" * 1000})])
+    cache = HistoryCache(store, max_bytes=2500)
+
+    cache.load("a")
+    cache.load("b")
+    cache.load("a")
+    cache.load("c")
+
+    stats = cache.stats()
+    assert stats["users"] == 2
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= 2500
+    # "b" was the least recently used
+    cache.load("b")
+    assert cache.stats()["misses"] == 4
+
+def test_entries_share_interned_roles_and_carry_no_dict():
+    role = "".join(["assis", "tant"])
+    first = CachedEntry(1, role, "Hi", "".join(["gr", "ok"]))
+    second = CachedEntry(2, "assistant", "Hello", "grok")
+
+    assert first.type is second.type
+    assert first.source is second.source
+    assert not hasattr(first, "__dict__")
+
+def test_writes_from_other_processes_are_picked_up(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = SQLiteHistoryStore(path)
+    other_worker = SQLiteHistoryStore(path)
+    fill(store, "bob", 2)
+    cache = HistoryCache(store)
+    cache.load("bob")
+
+    fill(other_worker, "bob", 1)
+    assert [entry["id"] for entry in cache.load("bob")] == [1, 2, 3]
+    assert cache.stats()["refreshes"] == 1
+
+    # A summary written elsewhere means the conversation is read again
+    other_worker.set_summary("bob", "Earlier talk", 2)
+    assert cache.load("bob") == [{"type": "summary", "message": "Earlier talk"}, {"type": "user", "message": "Message 0", "id": 3}]
+    assert cache.stats()["misses"] == 2
+
+def test_conversations_are_not_filled_while_an_append_is_in_flight(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    cache = HistoryCache(store)
+
+    with cache.writing("carol"):
+        # The append has reached the store but not yet the cache
+        [entry_id] = store.append_many([("carol", {"type": "user", "message": "Hi"})])
+        assert len(cache.load("carol")) == 1
+        cache.append("carol", {"type": "user", "message": "Hi"}, entry_id)
+
+    assert cache.stats()["users"] == 0
+    assert len(cache.load("carol")) == 1
+    cache.append("carol", {"type": "user", "message": "Hi"}, entry_id)
+    assert len(cache.load("carol")) == 1
+
+def test_jsonl_appends_keep_ids_the_cache_can_follow(tmp_path):
+    store = JSONLHistoryStore(str(tmp_path / "history"))
+    fill(store, "dana", 2)
+    cache = HistoryCache(store)
+    cache.load("dana")
+
+    ids = store.append_many([("dana", {"type": "user", "message": "Next"}), ("erin", {"type": "user", "message": "Hi"})])
+    cache.append("dana", {"type": "user", "message": "Next"}, ids[0])
+
+    assert ids == [3, 1]
+    assert cache.load("dana") == store.page("dana")
+    # Entries keep their ids, so later turns are not read back in full
+    assert cache._conversations["dana"].last_id == 3
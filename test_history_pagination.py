@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import backend.main as main
+from backend.history_store import JSONLHistoryStore, SQLiteHistoryStore
+
+@pytest.fixture(params=["sqlite", "jsonl"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    else:
+        store = JSONLHistoryStore(str(tmp_path / "history"))
+    store.append_many([("other", {"type": "user", "message": "noise"})])
+    store.append_many([("pager", {"type": "user", "message": str(n)}) for n in range(10)])
+    yield store
+    store.close()
+
+def messages(entries):
+    return [entry["message"] for entry in entries]
+
+def test_pages_walk_back_and_forward_by_id(store):
+    newest = store.page("pager", limit=4)
+    assert messages(newest) == ["6", "7", "8", "9"]
+
+    older = store.page("pager", before=newest[0]["id"], limit=4)
+    assert messages(older) == ["2", "3", "4", "5"]
+
+    newer = store.page("pager", after=older[1]["id"], limit=3)
+    assert messages(newer) == ["4", "5", "6"]
+
+    assert store.page("pager", after=newest[-1]["id"]) == []
+    assert store.last_id("pager") == newest[-1]["id"]
+    assert store.last_id("nobody") == 0
+
+def test_backends_agree_on_pages_bounded_both_ways(tmp_path):
+    stores = [SQLiteHistoryStore(str(tmp_path / "history.db")), JSONLHistoryStore(str(tmp_path / "history"))]
+    for store in stores:
+        store.append_many([("pager", {"type": "user", "message": str(n)}) for n in range(30)])
+
+    for before, after, limit in [(10, 5, 100), (10, 5, 2), (6, 5, 10), (30, 0, 5)]:
+        pages = [[entry["id"] for entry in store.page("pager", before=before, after=after, limit=limit)] for store in stores]
+        assert pages[0] == pages[1] == list(range(after + 1, min(before, after + limit + 1)))
+    for store in stores:
+        store.close()
+
+def get(client, **params):
+    headers = {"If-None-Match": params.pop("etag")} if "etag" in params else {}
+    return client.get("/api/history", params={"user_id": "pager", **params}, headers=headers)
+
+def test_history_endpoint_paginates_and_short_circuits(temp_history):
+    store = temp_history
+    store.append_many([("pager", {"type": "user", "message": str(n)}) for n in range(5)])
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            latest = await get(client, limit=3)
+            unchanged = await get(client, limit=3, etag=latest.headers["ETag"])
+            earlier = await get(client, limit=3, before=latest.json()[0]["id"])
+            await main.append_history("pager", {"type": "assistant", "message": "new", "source": "grok"})
+            changed = await get(client, limit=3, etag=latest.headers["ETag"])
+            delta = await get(client, since=latest.json()[-1]["id"])
+            too_big = await get(client, limit=100000)
+            return latest, unchanged, earlier, changed, delta, too_big
+
+    latest, unchanged, earlier, changed, delta, too_big = asyncio.run(run())
+
+    assert messages(latest.json()) == ["2", "3", "4"]
+    assert latest.headers["X-History-Has-More"] == "true"
+    assert unchanged.status_code == 304
+    assert messages(earlier.json()) == ["0", "1"]
+    assert earlier.headers["X-History-Has-More"] == "false"
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != latest.headers["ETag"]
+    assert delta.json() == [{"type": "assistant", "message": "new", "source": "grok", "id": delta.json()[0]["id"]}]
+    assert too_big.status_code == 422
+
+def test_jsonl_pages_are_read_through_the_line_index(tmp_path, monkeypatch):
+    store = JSONLHistoryStore(str(tmp_path / "history"))
+    store.append_many([("pager", {"type": "user", "message": str(n)}) for n in range(10)])
+    # Logs written before the index existed are indexed on first read
+    os.remove(store._index_path("pager"))
+    monkeypatch.setattr(store, "load", lambda user_id: pytest.fail("the whole log was loaded"))
+
+    assert store.last_id("pager") == 10
+    assert messages(store.page("pager", before=8, limit=3)) == ["4", "5", "6"]
+
+    # An append interrupted before its index entry is picked up on the next read
+    with open(store._path("pager"), "a") as f:
+        f.write('{"type": "user", "message": "10"}\n')
+    assert store.last_id("pager") == 11
+    store.append_many([("pager", {"type": "assistant", "message": "11"})])
+    assert [(entry["id"], entry["message"]) for entry in store.page("pager", after=9)] == [(10, "9"), (11, "10"), (12, "11")]
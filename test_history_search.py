@@ -0,0 +1,160 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import httpx
+
+import backend.main as main
+from backend.history_store import JSONLHistoryStore, SQLiteHistoryStore
+
+def search(params: dict) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/history/search", params=params)
+    return asyncio.run(run())
+
+def select(user_id: str, message: str, source: str):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/api/select_response", json={"type": "assistant", "message": message, "source": source, "user_id": user_id})
+    asyncio.run(run())
+
+def test_selected_answers_are_searchable_by_provider(temp_history):
+    select("alice", "Deploy with a blue-green rollout, then watch the error rate.", "gemini")
+    select("alice", "A rollout plan: canary first, then everyone.", "openai")
+    select("alice", "Rollout rollout rollout.", "gemini")
+    select("bob", "Rollout advice for someone else.", "gemini")
+
+    response = search({"user_id": "alice", "q": "rollout", "source": "gemini"})
+
+    assert response.status_code == 200
+    hits = response.json()
+    assert [hit["message"] for hit in hits] == ["Rollout rollout rollout.", "Deploy with a blue-green rollout, then watch the error rate."]
+    assert hits[1]["snippet"] == "Deploy with a blue-green [rollout], then watch the error rate."
+    assert all(hit["source"] == "gemini" for hit in hits)
+    assert response.headers["X-History-Has-More"] == "false"
+
+def test_results_are_paginated_and_filtered_by_time(temp_history):
+    store = temp_history
+    store.append_many([("carol", {"type": "user", "message": f"Question {n} about billing"}) for n in range(5)])
+    cutoff = time.time()
+    with sqlite3.connect(store.path) as conn:
+        conn.execute("UPDATE messages SET created_at = ? WHERE id <= 2", (cutoff - 7 * 86400,))
+
+    first = search({"user_id": "carol", "q": "billing question", "limit": 2})
+    second = search({"user_id": "carol", "q": "billing question", "limit": 2, "offset": 2})
+    recent = search({"user_id": "carol", "q": "billing", "start": "2000-01-01T00:00:00", "end": "2100-01-01T00:00:00"})
+    last_week = search({"user_id": "carol", "q": "billing", "end": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(cutoff - 86400))})
+
+    assert first.headers["X-History-Has-More"] == "true"
+    assert second.headers["X-History-Has-More"] == "true"
+    assert len({hit["id"] for hit in first.json() + second.json()}) == 4
+    assert len(recent.json()) == 5
+    assert sorted(hit["id"] for hit in last_week.json()) == [1, 2]
+
+def test_queries_are_not_read_as_search_syntax(temp_history):
+    store = temp_history
+    store.append_many([("dave", {"type": "user", "message": "What does NEAR(a b) mean?"})])
+
+    assert [hit["id"] for hit in search({"user_id": "dave", "q": 'NEAR( "a'}).json()] == [1]
+    assert search({"user_id": "dave", "q": "?!"}).status_code == 400
+
+def test_existing_histories_are_indexed_when_opened(tmp_path):
+    path = str(tmp_path / "history.db")
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, type TEXT NOT NULL,
+                message TEXT NOT NULL, source TEXT, created_at REAL NOT NULL
+            );
+            INSERT INTO messages (user_id, type, message, created_at) VALUES ('erin', 'user', 'Old kubernetes question', 0);
+        """)
+
+    store = SQLiteHistoryStore(path)
+
+    assert [hit["message"] for hit in store.search("erin", "Kubernetes")] == ["Old kubernetes question"]
+
+def test_indexes_without_users_are_rebuilt_when_opened(tmp_path):
+    path = str(tmp_path / "history.db")
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, type TEXT NOT NULL,
+                message TEXT NOT NULL, source TEXT, created_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE messages_fts USING fts5(
+                message, content='messages', content_rowid='id', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, message) VALUES (new.id, new.message);
+            END;
+            INSERT INTO messages (user_id, type, message, created_at) VALUES ('gina', 'user', 'Terraform state', 0);
+            INSERT INTO messages (user_id, type, message, created_at) VALUES ('hal', 'user', 'Terraform modules', 0);
+        """)
+
+    store = SQLiteHistoryStore(path)
+    store.append("gina", {"type": "user", "message": "Terraform drift"})
+
+    assert [hit["id"] for hit in store.search("gina", "terraform")] == [3, 1]
+    assert [hit["id"] for hit in store.search("hal", "terraform")] == [2]
+
+def test_workers_opening_an_old_database_together_migrate_it_once(tmp_path):
+    path = str(tmp_path / "history.db")
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, type TEXT NOT NULL,
+                message TEXT NOT NULL, source TEXT, created_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE messages_fts USING fts5(
+                message, content='messages', content_rowid='id', tokenize='porter unicode61'
+            );
+            INSERT INTO messages (user_id, type, message, created_at) VALUES ('judy', 'user', 'Helm charts', 0);
+        """)
+    start = threading.Barrier(8)
+    stores, errors = [], []
+
+    def open_store():
+        start.wait()
+        try:
+            stores.append(SQLiteHistoryStore(path))
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=open_store) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    assert [hit["id"] for hit in stores[0].search("judy", "helm")] == [1]
+
+def test_small_histories_are_searched_quickly_in_a_large_store(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    # Every entry of the large store matches, so a search that scored all
+    # users' matches before filtering would read 200,000 of them
+    store.append_many([(f"user-{n % 1000}", {"type": "user", "message": f"python question {n}"}) for n in range(200_000)])
+    store.append("ivan", {"type": "user", "message": "Learning python"})
+
+    started = time.perf_counter()
+    for _ in range(10):
+        hits = store.search("ivan", "python")
+    elapsed = (time.perf_counter() - started) / 10
+
+    assert [hit["message"] for hit in hits] == ["Learning python"]
+    assert elapsed < 0.01
+
+def test_jsonl_histories_are_scanned(tmp_path):
+    store = JSONLHistoryStore(str(tmp_path / "history"))
+    store.append_many([
+        ("frank", {"type": "user", "message": "Cache the cache"}),
+        ("frank", {"type": "response", "message": "Use a cache", "source": "grok"})
+    ])
+
+    assert [hit["id"] for hit in store.search("frank", "cache")] == [1, 2]
+    assert [hit["id"] for hit in store.search("frank", "cache", source="grok")] == [2]
+    assert store.search("frank", "missing") == []
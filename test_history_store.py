@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from backend.history_store import JSONLHistoryStore, SQLiteHistoryStore, migrate_json_history
+
+@pytest.fixture(params=["sqlite", "jsonl"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    else:
+        store = JSONLHistoryStore(str(tmp_path / "history"))
+    yield store
+    store.close()
+
+def test_append_and_load_per_user(store):
+    store.append("alice", {"type": "user", "message": "Hi"})
+    store.append("bob", {"type": "user", "message": "Hello"})
+    store.append("alice", {"type": "assistant", "message": "Hey!", "source": "gemini"})
+
+    assert store.load("alice") == [
+        {"type": "user", "message": "Hi"},
+        {"type": "assistant", "message": "Hey!", "source": "gemini"}
+    ]
+    assert store.load("bob") == [{"type": "user", "message": "Hello"}]
+    assert store.load("carol") == []
+    assert store.has_history("alice") and not store.has_history("carol")
+
+def test_sqlite_reads_use_user_index(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    plan = store._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT type, message, source FROM messages WHERE user_id = ? ORDER BY id",
+        ("alice",)
+    ).fetchall()
+    store.close()
+
+    assert "idx_messages_user" in " ".join(str(row) for row in plan)
+
+def test_migrate_legacy_json_file(store, tmp_path):
+    legacy = tmp_path / "conversation_history.json"
+    legacy.write_text(json.dumps({
+        "alice": [{"type": "user", "message": "Hi"}, {"type": "assistant", "message": "Hey", "source": "grok"}],
+        "bob": [{"type": "user", "message": "Hello"}]
+    }))
+
+    assert migrate_json_history(str(legacy), store) == (2, 3)
+    assert store.load("alice")[1] == {"type": "assistant", "message": "Hey", "source": "grok"}
+    # Re-running skips users that were already migrated
+    assert migrate_json_history(str(legacy), store) == (0, 0)
+    assert len(store.load("alice")) == 2
@@ -0,0 +1,111 @@
+import asyncio
+
+import httpx
+import pytest
+
+import backend.main as main
+from backend.ai_services import AIServices
+from backend.metrics import Histogram, MetricsRegistry, label_value
+from backend.response_cache import ResponseCache
+
+PRICES = {"openai": {"prices": {"gpt-4": {"input": 0.03, "output": 0.06}}}}
+
+def test_histogram_percentiles_interpolate_within_buckets():
+    histogram = Histogram(buckets=(1, 2, 3, 4))
+    for value in [0.5] * 50 + [1.5] * 45 + [3.5] * 5:
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["count"] == 100
+    assert snapshot["p50"] == pytest.approx(1.0)
+    assert snapshot["p95"] == pytest.approx(2.0)
+    assert 3 < snapshot["p99"] <= 3.5
+    assert list(histogram.cumulative())[-1] == ("+Inf", 100)
+
+def test_successful_calls_record_tokens_cost_and_latency():
+    registry = MetricsRegistry(PRICES)
+
+    with registry.track("openai", "gpt-4", input_tokens=1000) as call:
+        call.add_output("word " * 8)
+
+    series = registry.snapshot()["openai/gpt-4"]
+    assert (series["requests"], series["successes"]) == (1, 1)
+    assert (series["input_tokens"], series["output_tokens"]) == (1000, 8)
+    assert series["cost"] == pytest.approx(0.03 + 8 * 0.06 / 1000)
+    assert series["latency"]["count"] == series["time_to_first_token"]["count"] == 1
+    assert registry.total_cost == pytest.approx(series["cost"])
+
+def test_failed_calls_are_counted_by_error_class():
+    registry = MetricsRegistry(main.MODEL_CONFIGS)
+    request = httpx.Request("POST", "http://provider.test")
+
+    for error in [TimeoutError(), httpx.ConnectError("refused"),
+                  httpx.HTTPStatusError("503", request=request, response=httpx.Response(503, request=request))]:
+        with pytest.raises(type(error)):
+            with registry.track("grok", "grok-1", input_tokens=10):
+                raise error
+
+    series = registry.snapshot()["grok/grok-1"]
+    assert series["errors"] == {"timeout": 1, "connection": 1, "server_error": 1}
+    assert series["error_rate"] == 1.0
+    assert series["cost"] == 0.0
+
+def test_unknown_models_share_one_escaped_series():
+    registry = MetricsRegistry(main.MODEL_CONFIGS)
+    for model in ['gpt-4"} 1\nchatbot_fake 1', "made-up", "gpt-4"]:
+        with registry.track("openai", model, input_tokens=10):
+            pass
+
+    assert set(registry.snapshot()) == {"openai/other", "openai/gpt-4"}
+    assert registry.snapshot()["openai/other"]["requests"] == 2
+    exported = registry.prometheus()
+    assert 'chatbot_provider_requests_total{provider="openai",model="other"} 2' in exported
+    assert "chatbot_fake" not in exported
+
+def test_label_values_are_escaped():
+    assert label_value('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+def test_feedback_summary_uses_running_tallies():
+    services = AIServices()
+    services.record_feedback("m1", "openai", "positive")
+    services.record_feedback("m1", "grok", "negative")
+    services.record_feedback("m1", "grok", "positive")  # Changed their mind
+
+    assert services.get_performance_metrics()["feedback_summary"] == {"positive": 2, "negative": 0}
+
+def test_chat_metrics_are_exported(monkeypatch, temp_history, stub_server):
+    server = stub_server()
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    registry = MetricsRegistry(main.MODEL_CONFIGS)
+    monkeypatch.setattr(main, "provider_metrics", registry)
+    monkeypatch.setattr(main, "ai_services", AIServices(metrics=registry))
+    monkeypatch.setattr(main, "response_cache", ResponseCache(disk_path=None))
+
+    def payload(user_id: str) -> dict:
+        return {
+            "message": "Hi",
+            "user_id": user_id,
+            "service_keys": {"user_id": user_id, "grok": "metered-key", "models": {"grok": "grok-2"}}
+        }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/api/chat", json=payload("metered-1"))
+            await client.post("/api/chat", json=payload("metered-2"))  # Served from the response cache
+            metrics = (await client.get("/api/metrics")).json()
+            exported = await client.get("/api/metrics/prometheus")
+            return metrics, exported
+
+    metrics, exported = asyncio.run(run())
+
+    series = metrics["providers"]["grok/grok-2"]
+    assert (series["requests"], series["cache_hits"]) == (1, 1)
+    assert series["latency"]["p50"] >= 0.25
+    assert metrics["total_calls"] == 1
+    assert metrics["total_cost"] > 0
+    assert exported.headers["content-type"].startswith("text/plain")
+    assert 'chatbot_provider_requests_total{provider="grok",model="grok-2"} 1' in exported.text
+    assert 'chatbot_provider_latency_seconds_bucket{provider="grok",model="grok-2",le="+Inf"} 1' in exported.text
@@ -0,0 +1,117 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.auth import Auth
+from backend.oauth import TOKENS_NAMESPACE, OAuthManager
+from backend.shared_state import SharedState
+
+TOKEN_ENDPOINT_LATENCY = 0.2
+
+class TokenHandler(BaseHTTPRequestHandler):
+    """OAuth token endpoint handing out numbered access tokens"""
+
+    lock = threading.Lock()
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            type(self).requests += 1
+            number = type(self).requests
+        time.sleep(TOKEN_ENDPOINT_LATENCY)
+        payload = json.dumps({"access_token": f"access-{number}", "expires_in": 3600}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_token_server() -> ThreadingHTTPServer:
+    handler = type("Handler", (TokenHandler,), {"requests": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stored_token(server: ThreadingHTTPServer, expires_in: float) -> dict:
+    expiry = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(seconds=expires_in)
+    return {
+        "token": "access-0",
+        "refresh_token": "refresh",
+        "token_uri": f"http://127.0.0.1:{server.server_port}/token",
+        "client_id": "client",
+        "client_secret": "secret",
+        "scopes": ["email"],
+        "expiry": expiry.isoformat()
+    }
+
+def test_concurrent_requests_share_one_refresh_of_an_expired_token(tmp_path):
+    server = start_token_server()
+    state = SharedState(str(tmp_path / "state.db"))
+    state.set(TOKENS_NAMESPACE, "user@example.com", stored_token(server, expires_in=-60))
+    manager = OAuthManager(state)
+
+    async def run():
+        credentials = await asyncio.gather(*[manager.get_google_credentials("user@example.com") for _ in range(10)])
+        await manager.close()
+        return credentials
+
+    try:
+        credentials = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert {c.token for c in credentials} == {"access-1"}
+    assert server.RequestHandlerClass.requests == 1
+    assert state.get(TOKENS_NAMESPACE, "user@example.com")["token"] == "access-1"
+
+def test_token_near_expiry_is_refreshed_in_the_background(tmp_path):
+    server = start_token_server()
+    state = SharedState(str(tmp_path / "state.db"))
+    state.set(TOKENS_NAMESPACE, "user@example.com", stored_token(server, expires_in=290))
+    manager = OAuthManager(state)
+
+    async def run():
+        start = time.perf_counter()
+        current = await manager.get_google_credentials("user@example.com")
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(TOKEN_ENDPOINT_LATENCY * 3)
+        refreshed = await manager.get_google_credentials("user@example.com")
+        return current, elapsed, refreshed
+
+    try:
+        current, elapsed, refreshed = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    # The caller got the still-valid token without waiting on the token endpoint
+    assert current.token == "access-0"
+    assert elapsed < TOKEN_ENDPOINT_LATENCY
+    assert refreshed.token == "access-1"
+    assert manager.refreshes == 1
+
+def test_credential_saves_are_cached_and_written_behind(tmp_path, monkeypatch):
+    monkeypatch.setattr("backend.auth.SERVICE_CREDENTIALS_FILE", str(tmp_path / "missing.json"))
+    state = SharedState(str(tmp_path / "state.db"))
+    auth = Auth(state)
+    other_worker = Auth(SharedState(str(tmp_path / "state.db")))
+
+    async def run():
+        auth.save_service_credentials("openai", "sk-new")
+        before_flush = other_worker.get_service_credentials("openai")
+        cached = auth.get_service_credentials("openai")
+        await auth.close()
+        return before_flush, cached
+
+    before_flush, cached = asyncio.run(run())
+
+    assert before_flush is None
+    assert cached["api_key"] == "sk-new"
+    assert other_worker.get_service_credentials("openai")["api_key"] == "sk-new"
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+import httpx
+
+import backend.main as main
+import backend.provider_io as provider_io
+from backend.rate_limiter import RateLimiterRegistry
+
+PROVIDER_LATENCY = 0.5
+CONCURRENT_CHATS = 10
+
+def test_concurrent_chats_finish_in_one_provider_latency(monkeypatch, temp_history, stub_server, chat_payload):
+    """N concurrent chats should take ~1x the provider latency, not Nx"""
+    server = stub_server(latency=PROVIDER_LATENCY)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    for provider in ["gemini", "openai", "grok"]:
+        monkeypatch.setitem(main.PROVIDER_ENDPOINTS, provider, base_url)
+    # Every chat shares one key per provider; keep the limiter out of the way
+    unlimited = {"rpm": 60000, "max_concurrency": CONCURRENT_CHATS}
+    monkeypatch.setattr(main, "rate_limiters", RateLimiterRegistry({
+        "gemini": {"limits": {"gemini-pro": unlimited}},
+        "openai": {"limits": {"gpt-3.5-turbo": unlimited}},
+        "grok": {"limits": {"grok-1": unlimited}}
+    }))
+
+    async def run_chats():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[
+                client.post("/api/chat", json=chat_payload(f"user-{i}"))
+                for i in range(CONCURRENT_CHATS)
+            ])
+            return time.perf_counter() - start, responses
+
+    elapsed, responses = asyncio.run(run_chats())
+
+    for response in responses:
+        assert response.status_code == 200
+        data = response.json()
+        assert data["gemini"]["response"] == "stub reply from gemini-pro"
+        assert data["openai"]["response"] == "stub reply from gpt-3.5-turbo"
+        assert data["grok"]["response"] == "stub reply from grok-1"
+
+    # Serial handling would take CONCURRENT_CHATS * 3 * PROVIDER_LATENCY
+    assert elapsed < 3 * PROVIDER_LATENCY
+
+def test_blocking_sdk_calls_share_a_bounded_pool(monkeypatch):
+    monkeypatch.setattr(provider_io, "SYNC_WORKERS", 2)
+    monkeypatch.setattr(provider_io, "_sync_executor", None)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def blocking_call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    async def run():
+        await asyncio.gather(*[provider_io.run_sync(blocking_call) for _ in range(6)])
+
+    asyncio.run(run())
+    provider_io._sync_executor.shutdown()
+    assert max(peak) == 2
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import backend.main as main
+from backend.rate_limiter import ProviderLimiter, RateLimiterRegistry, RateLimitExceeded
+
+async def use_slot(limiter: ProviderLimiter, hold: float = 0.0):
+    async with limiter.slot():
+        await asyncio.sleep(hold)
+
+def test_requests_over_the_rate_are_queued():
+    """With 600 rpm (10/s) and a burst of 1, three calls take ~0.2s"""
+    limiter = ProviderLimiter("grok", rpm=600, max_concurrency=1)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*[use_slot(limiter) for _ in range(3)])
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+
+    assert 0.15 < elapsed < 1
+    assert limiter.stats()["admitted"] == 3
+    assert limiter.stats()["max_wait"] > 0.1
+
+def test_requests_are_shed_when_the_wait_is_too_long():
+    limiter = ProviderLimiter("gemini", rpm=60, max_concurrency=1, max_wait=0.5)
+
+    async def run():
+        await use_slot(limiter)
+        with pytest.raises(RateLimitExceeded) as shed:
+            await use_slot(limiter)
+        return shed.value
+
+    error = asyncio.run(run())
+
+    assert error.retry_after == pytest.approx(1.0, abs=0.1)
+    assert limiter.stats()["shed"] == 1
+
+def test_cancelled_and_shed_waiters_give_their_token_back():
+    """At 60 rpm a queued call reserves the next second; giving it up frees that second"""
+    limiter = ProviderLimiter("grok", rpm=60, max_concurrency=1, max_wait=5)
+
+    async def run():
+        await use_slot(limiter)
+        queued = asyncio.create_task(use_slot(limiter))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        start = time.perf_counter()
+        await use_slot(limiter)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+
+    assert elapsed < 1.5
+    assert limiter.stats()["admitted"] == 2
+
+def test_concurrency_cap_bounds_in_flight_calls():
+    limiter = ProviderLimiter("openai", rpm=60000, max_concurrency=2)
+    peak = 0
+
+    async def tracked():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.05)
+
+    async def run():
+        await asyncio.gather(*[tracked() for _ in range(6)])
+
+    asyncio.run(run())
+
+    assert peak == 2
+
+def test_chat_returns_429_with_retry_after_when_all_providers_are_shed(monkeypatch, temp_history, stub_server):
+    server = stub_server()
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    monkeypatch.setattr(main, "rate_limiters", RateLimiterRegistry({
+        "grok": {"limits": {"grok-1": {"rpm": 1, "max_concurrency": 1}}}
+    }))
+    payload = {
+        "message": "Hi",
+        "user_id": "limited",
+        "use_cache": False,
+        "service_keys": {"user_id": "limited", "grok": "x-key", "models": {"grok": "grok-1"}}
+    }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.post("/api/chat", json=payload)
+            second = await client.post("/api/chat", json=payload)
+            metrics = (await client.get("/api/metrics")).json()
+            return first, second, metrics
+
+    first, second, metrics = asyncio.run(run())
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) >= 59
+    [stats] = metrics["rate_limits"].values()
+    assert (stats["admitted"], stats["shed"]) == (1, 1)
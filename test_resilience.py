@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import pytest
+
+import backend.main as main
+from backend.fanout import STATUS_CIRCUIT_OPEN, STATUS_OK, STATUS_TIMED_OUT, fan_out
+from backend.resilience import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError, retry_async
+
+def status_error(code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://provider.test")
+    return httpx.HTTPStatusError(f"{code}", request=request, response=httpx.Response(code, request=request))
+
+def test_transient_errors_are_retried():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise status_error(503)
+        return "ok"
+
+    assert asyncio.run(retry_async(call, attempts=3, base_delay=0.01)) == "ok"
+    assert len(attempts) == 3
+
+def test_client_errors_are_not_retried():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(retry_async(call, attempts=3, base_delay=0.01))
+    assert len(attempts) == 1
+
+def test_breaker_opens_then_recovers_through_a_half_open_trial():
+    breaker = CircuitBreaker("grok", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    asyncio.run(asyncio.sleep(0.06))
+    breaker.before_call()  # The half-open trial
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Only one trial at a time
+    breaker.record_success()
+
+    breaker.before_call()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "times_opened": 1, "rejected": 2}
+
+def test_missed_deadlines_open_the_circuit():
+    breakers = CircuitBreakerRegistry(failure_threshold=2, reset_timeout=60)
+
+    async def hang():
+        async with breakers.guard("gemini", "key"):
+            await asyncio.sleep(10)
+
+    async def run():
+        results = []
+        for _ in range(3):
+            results.append((await fan_out({"gemini": hang}, default_timeout=0.05))["gemini"])
+        return results
+
+    results = asyncio.run(run())
+
+    assert [r["status"] for r in results] == [STATUS_TIMED_OUT, STATUS_TIMED_OUT, STATUS_CIRCUIT_OPEN]
+    assert results[2]["latency"] < 0.05
+    assert results[2]["retry_after"] > 59
+
+def test_chat_retries_a_flaky_provider(monkeypatch, temp_history, stub_server):
+    server = stub_server(failures=1)
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    monkeypatch.setattr(main, "circuit_breakers", CircuitBreakerRegistry())
+    payload = {
+        "message": "Hi",
+        "user_id": "flaky",
+        "use_cache": False,
+        "service_keys": {"user_id": "flaky", "grok": "flaky-key", "models": {"grok": "grok-1"}}
+    }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            chat = (await client.post("/api/chat", json=payload)).json()
+            metrics = (await client.get("/api/metrics")).json()
+            return chat, metrics
+
+    chat, metrics = asyncio.run(run())
+
+    assert chat["grok"]["status"] == STATUS_OK
+    assert chat["grok"]["response"] == "stub reply from grok-1"
+    assert server.RequestHandlerClass.requests == 2
+    [breaker] = metrics["circuit_breakers"].values()
+    assert breaker["state"] == "closed"
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import httpx
+
+import backend.main as main
+from backend.response_cache import ResponseCache
+
+CONTEXT = [{"type": "user", "message": "Hello"}]
+
+def test_key_normalizes_prompt_and_depends_on_context():
+    key = ResponseCache.make_key("gemini", "gemini-pro", "Hello  there", CONTEXT)
+
+    assert key == ResponseCache.make_key("gemini", "gemini-pro", " hello there ", CONTEXT)
+    assert key != ResponseCache.make_key("gemini", "gemini-pro", "Hello there", [])
+    assert key != ResponseCache.make_key("openai", "gemini-pro", "Hello there", CONTEXT)
+    assert key != ResponseCache.make_key("gemini", "gemini-ultra", "Hello there", CONTEXT)
+
+def test_lru_eviction_and_counters():
+    cache = ResponseCache(max_size=2, ttl=60, disk_path=None)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"  # "b" is now least recently used
+    cache.set("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (2, 1, 1, 2)
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=0.05, disk_path=None)
+    cache.set("a", "A")
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(disk_path=path)
+    cache.set("a", "A")
+    cache.close()
+
+    restarted = ResponseCache(disk_path=path)
+    assert restarted.get("a") == "A"
+    assert restarted.stats()["disk_hits"] == 1
+    # Promoted into memory, so the next hit does not touch disk
+    assert restarted.get("a") == "A"
+    assert restarted.stats()["disk_hits"] == 1
+    restarted.close()
+
+def test_chat_serves_repeated_prompts_from_cache(monkeypatch, temp_history, stub_server, chat_payload):
+    server = stub_server()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    for provider in ["gemini", "openai", "grok"]:
+        monkeypatch.setitem(main.PROVIDER_ENDPOINTS, provider, base_url)
+    monkeypatch.setattr(main, "response_cache", ResponseCache(disk_path=None))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Fresh users share the same (empty) context window
+            await client.post("/api/chat", json=chat_payload("first"))
+            await client.post("/api/chat", json=chat_payload("second"))
+            await client.post("/api/chat", json={**chat_payload("third"), "use_cache": False})
+            return (await client.get("/api/metrics")).json()
+
+    metrics = asyncio.run(run())
+
+    assert metrics["response_cache"]["hits"] == 3
+    assert metrics["response_cache"]["misses"] == 3
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+import httpx
+
+import backend.main as main
+import backend.metrics as metrics
+from backend.metrics import MetricsRegistry, RollingWindow
+from backend.response_cache import ResponseCache
+from backend.router import ModelRouter
+
+HEALTHY = {"requests": 50, "error_rate": 0.0, "p95": 1.0, "headroom": 1.0}
+
+def test_paid_model_is_preferred_until_it_degrades():
+    router = ModelRouter(main.MODEL_CONFIGS)
+
+    assert router.choose("openai", {"gpt-4": HEALTHY, "gpt-3.5-turbo": HEALTHY}, 100) == "gpt-4"
+    for degraded in [{"error_rate": 0.5}, {"p95": 25.0}, {"headroom": 0.0}]:
+        assert router.choose("openai", {"gpt-4": {**HEALTHY, **degraded}, "gpt-3.5-turbo": HEALTHY}, 100) == "gpt-3.5-turbo"
+    # Too few recent calls to judge
+    assert router.choose("openai", {"gpt-4": {"requests": 2, "error_rate": 1.0, "p95": None, "headroom": 1.0}}, 100) == "gpt-4"
+
+    [latest] = router.recent(limit=1)
+    assert latest["reason"] == "preferred"
+    assert router.recent(limit=2)[1]["candidates"]["gpt-4"]["degraded"] == ["quota"]
+    assert router.stats() == {"decisions": 5, "fallbacks": 3, "choices": {"openai/gpt-4": 2, "openai/gpt-3.5-turbo": 3}}
+
+def test_cost_ceiling_and_feedback_steer_away_from_a_model():
+    votes = {"grok-2": {"total": 10, "negative_rate": 0.8}, "grok-1": {"total": 10, "negative_rate": 0.1}}
+    no_votes = {"total": 0, "negative_rate": 0.0}
+    router = ModelRouter(main.MODEL_CONFIGS, feedback=lambda provider, model: votes.get(model, no_votes), max_cost=0.05)
+
+    assert router.choose("grok", {}, 100) == "grok-1"
+    assert router.recent()[0]["candidates"]["grok-2"]["degraded"] == ["feedback"]
+    # GPT-4 with a long prompt costs more than the ceiling allows
+    assert router.choose("openai", {}, 5000) == "gpt-3.5-turbo"
+    assert not router.recent()[0]["candidates"]["gpt-4"]["affordable"]
+
+    # When everything affordable is degraded the least degraded model is used
+    votes["grok-1"] = {"total": 10, "negative_rate": 0.9}
+    router._feedback_cache.clear()
+    assert router.choose("grok", {"grok-2": {**HEALTHY, "error_rate": 0.9}}, 100) == "grok-1"
+    assert router.recent()[0]["reason"] == "all degraded"
+
+def test_feedback_is_read_off_the_event_loop():
+    threads = []
+
+    def feedback(provider, model):
+        threads.append(threading.current_thread())
+        return {"total": 10, "negative_rate": 0.9 if model == "grok-2" else 0.0}
+
+    router = ModelRouter(main.MODEL_CONFIGS, feedback=feedback)
+
+    async def run():
+        # Nothing has been read yet, so the first choice goes without feedback
+        first = router.choose("grok", {}, 100)
+        await asyncio.gather(*router._feedback_reads.values())
+        return first, router.choose("grok", {}, 100)
+
+    assert asyncio.run(run()) == ("grok-2", "grok-1")
+    assert len(threads) == 2 and threading.main_thread() not in threads
+
+def test_rolling_window_forgets_old_calls(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(metrics.time, "monotonic", lambda: clock[0])
+    window = RollingWindow(seconds=60)
+    for _ in range(5):
+        window.observe(None)
+    clock[0] += 61
+    for latency in [0.1, 0.2, 0.3, 4.0]:
+        window.observe(latency)
+
+    assert window.summary() == {"requests": 4, "errors": 0, "error_rate": 0.0, "p95": 4.0}
+
+def test_auto_model_is_routed_and_audited(monkeypatch, temp_history, stub_server):
+    server = stub_server()
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    registry = MetricsRegistry(main.MODEL_CONFIGS)
+    monkeypatch.setattr(main, "provider_metrics", registry)
+    monkeypatch.setattr(main, "model_router", ModelRouter(main.MODEL_CONFIGS))
+    monkeypatch.setattr(main, "response_cache", ResponseCache(disk_path=None))
+    payload = {
+        "message": "Hi",
+        "user_id": "routed",
+        "use_cache": False,
+        "service_keys": {"user_id": "routed", "grok": "key", "models": {"grok": "auto"}}
+    }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = (await client.post("/api/chat", json=payload)).json()
+            # grok-2 starts failing
+            for _ in range(20):
+                registry.get("grok", "grok-2").recent.observe(None)
+            second = (await client.post("/api/chat", json=payload)).json()
+            decisions = (await client.get("/api/router/decisions", params={"provider": "grok"})).json()
+            routing = (await client.get("/api/metrics")).json()["routing"]
+            return first, second, decisions, routing
+
+    first, second, decisions, routing = asyncio.run(run())
+
+    assert first["grok"]["response"] == "stub reply from grok-2"
+    assert second["grok"]["response"] == "stub reply from grok-1"
+    assert [(d["model"], d["reason"], d["user_id"]) for d in decisions] == [("grok-1", "fallback", "routed"), ("grok-2", "preferred", "routed")]
+    assert decisions[0]["candidates"]["grok-2"]["degraded"] == ["error_rate"]
+    assert routing["fallbacks"] == 1
@@ -0,0 +1,163 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import httpx
+
+import backend.main as main
+import backend.ai_services as ai_services
+import backend.sessions as sessions
+from backend.ai_services import AIServices, GeminiChats
+from backend.context_builder import build_context
+from backend.sessions import ChatSessionManager
+from benchmarks.mock_providers import MockProfile, start_mock_provider
+
+LIMITS = {"context_window": 400, "reserved_output": 100}
+
+def test_sessions_send_the_same_context_as_rebuilding_it():
+    rng = random.Random(3)
+    manager = ChatSessionManager()
+    history = []
+    for n in range(1, 300):
+        kind = rng.choice(["user", "assistant", "response"])
+        history.append({"type": kind, "message": " ".join(["word"] * rng.randint(1, 60)), "id": n})
+        if n % 97 == 0:
+            # Compaction replaced the older turns with a summary
+            history = [{"type": "summary", "message": f"summary {n}"}] + history[-5:]
+        message = "next " * rng.randint(0, 40)
+        assert manager.context("alice", "grok", "grok-1", LIMITS, history, message) == build_context(history, message, LIMITS)
+
+    stats = manager.stats()
+    assert stats["rebuilds"] == 4
+    assert stats["hits"] == 295
+    assert stats["entries_appended"] == 295
+
+def test_idle_and_least_recently_used_sessions_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(sessions.time, "monotonic", lambda: clock[0])
+    manager = ChatSessionManager(max_sessions=2, ttl=60)
+    history = [{"type": "user", "message": "Hi", "id": 1}]
+
+    for user in ["a", "b", "c"]:
+        manager.context(user, "grok", "grok-1", LIMITS, history, "Hello")
+    assert manager.stats()["evictions"] == 1
+
+    clock[0] += 61
+    manager.context("c", "grok", "grok-1", LIMITS, history, "Hello")
+    # "b" and "c" sat idle too long; "c" was rebuilt from the history
+    assert manager.stats() == {"sessions": 1, "hits": 0, "rebuilds": 4, "evictions": 3, "entries_appended": 0}
+
+def test_chat_turns_reuse_each_users_session(monkeypatch, temp_history):
+    mock = start_mock_provider(MockProfile(latency=0.01, reply_tokens=2))
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", mock.base_url)
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    monkeypatch.setattr(main, "chat_sessions", ChatSessionManager())
+
+    def payload(message: str) -> dict:
+        return {
+            "message": message,
+            "user_id": "session-user",
+            "use_cache": False,
+            "service_keys": {"user_id": "session-user", "grok": "key", "models": {"grok": "grok-1"}}
+        }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for n in range(3):
+                chat = await client.post("/api/chat", json=payload(f"Question {n}"))
+                assert chat.json()["grok"]["status"] == "ok"
+            return (await client.get("/api/metrics")).json()
+
+    try:
+        metrics = asyncio.run(run())
+    finally:
+        mock.shutdown()
+
+    assert metrics["chat_sessions"] == {"sessions": 1, "hits": 2, "rebuilds": 1, "evictions": 0, "entries_appended": 2}
+
+class FakeGeminiModel:
+    """Stands in for a GenerativeModel; its chats echo the message back"""
+
+    def __init__(self):
+        self.chats_started = 0
+        self.sending = 0
+        self.most_sending = 0
+
+    def start_chat(self, history):
+        self.chats_started += 1
+        chat = SimpleNamespace(history=[SimpleNamespace(parts=[SimpleNamespace(text=h["parts"][0])]) for h in history])
+
+        async def send_message_async(message):
+            self.sending += 1
+            self.most_sending = max(self.most_sending, self.sending)
+            await asyncio.sleep(0.01)
+            self.sending -= 1
+            chat.history.append(SimpleNamespace(parts=[SimpleNamespace(text=message)]))
+            chat.history.append(SimpleNamespace(parts=[SimpleNamespace(text=f"echo {message}")]))
+            return SimpleNamespace(text=f"echo {message}")
+
+        chat.send_message_async = send_message_async
+        return chat
+
+def test_gemini_chat_is_kept_per_user_while_the_history_follows_it():
+    services = AIServices()
+    services.gemini_model = FakeGeminiModel()
+    history = []
+
+    def log(type, message):
+        history.append({"type": type, "message": message, "id": len(history) + 1})
+
+    async def turn(message):
+        reply = await services.get_gemini_response(message, history, user_id="alice")
+        log("user", message)
+        log("assistant", reply)
+
+    async def run():
+        for message in ["one", "two"]:
+            await turn(message)
+        # Another user's conversation gets its own chat and leaves alice's alone
+        await services.get_gemini_response("elsewhere", [{"type": "user", "message": "other", "id": 1}], user_id="bob")
+        # Entries the chat did not send itself are added to it
+        log("user", "said elsewhere")
+        await turn("three")
+        assert services.gemini_model.chats_started == 2
+        assert [part.parts[0].text for part in services.gemini_chats.get("alice").chat.history][-3:] == ["said elsewhere", "three", "echo three"]
+        # A history whose entries are not the ones the chat followed
+        history[:] = [dict(entry, id=entry["id"] + 100) for entry in history]
+        await turn("four")
+        # Callers without a user get a chat of their own that is not kept
+        await services.get_gemini_response("anonymous")
+
+    asyncio.run(run())
+    assert services.gemini_model.chats_started == 4
+    assert len(services.gemini_chats) == 2
+
+def test_gemini_chat_sends_one_message_at_a_time():
+    services = AIServices()
+    services.gemini_model = FakeGeminiModel()
+
+    async def run():
+        return await asyncio.gather(*[services.get_gemini_response(f"message {n}", [], user_id="carol") for n in range(3)])
+
+    replies = asyncio.run(run())
+    assert replies == ["echo message 0", "echo message 1", "echo message 2"]
+    assert services.gemini_model.most_sending == 1
+    # Each later message came with a history the chat had moved past
+    assert services.gemini_model.chats_started == 3
+
+def test_idle_and_least_recently_used_gemini_chats_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(ai_services.time, "monotonic", lambda: clock[0])
+    chats = GeminiChats(max_chats=2, ttl=60)
+
+    first = chats.get("a")
+    chats.get("b")
+    assert chats.get("a") is first
+    chats.get("c")
+    # "b" was least recently used
+    assert len(chats) == 2 and chats.get("a") is first
+
+    clock[0] += 61
+    assert chats.get("a") is not first
+    assert len(chats) == 1
@@ -0,0 +1,71 @@
+import multiprocessing
+
+from backend.auth import Auth
+from backend.feedback_store import FeedbackStore
+from backend.history_store import SQLiteHistoryStore
+from backend.metrics import MetricsRegistry
+from backend.shared_state import SharedState
+
+PROCESSES = 4
+WRITES_PER_PROCESS = 200
+
+def write_from_process(directory: str, worker: int):
+    history = SQLiteHistoryStore(f"{directory}/history.db")
+    feedback = FeedbackStore(f"{directory}/feedback.db")
+    for n in range(WRITES_PER_PROCESS):
+        history.append_many([("shared-user", {"type": "user", "message": f"{worker}-{n}"})])
+        feedback.record(f"{worker}-{n}", "openai", "positive", "gpt-4")
+    history.close()
+    feedback.close()
+
+def test_concurrent_writes_from_several_processes(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=write_from_process, args=(str(tmp_path), worker)) for worker in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    history = SQLiteHistoryStore(str(tmp_path / "history.db"))
+    messages = [entry["message"] for entry in history.load("shared-user")]
+    assert len(messages) == PROCESSES * WRITES_PER_PROCESS
+    for worker in range(PROCESSES):
+        # Each process's writes stay in the order it made them
+        assert [m for m in messages if m.startswith(f"{worker}-")] == [f"{worker}-{n}" for n in range(WRITES_PER_PROCESS)]
+    assert FeedbackStore(str(tmp_path / "feedback.db")).summary() == {"positive": PROCESSES * WRITES_PER_PROCESS}
+
+def test_credentials_are_shared_and_imported_from_json(tmp_path, monkeypatch):
+    legacy = tmp_path / "service_credentials.json"
+    legacy.write_text('{"openai": {"api_key": "sk-old", "is_valid": true}}')
+    monkeypatch.setattr("backend.auth.SERVICE_CREDENTIALS_FILE", str(legacy))
+
+    first = Auth(SharedState(str(tmp_path / "state.db")))
+    second = Auth(SharedState(str(tmp_path / "state.db")))
+    first.save_service_credentials("grok", "xai-new")
+
+    assert second.get_service_credentials("openai") == {"api_key": "sk-old", "is_valid": True}
+    assert second.get_all_credentials()["grok"]["api_key"] == "xai-new"
+
+def test_metrics_from_every_worker_are_merged(tmp_path, monkeypatch):
+    import backend.main as main  # Imported here so spawned writer processes stay light
+
+    configs = {"openai": {"prices": {"gpt-4": {"input": 0.03, "output": 0.06}}}}
+    state = SharedState(str(tmp_path / "state.db"))
+    other_worker = MetricsRegistry(configs)
+    with other_worker.track("openai", "gpt-4", input_tokens=1000):
+        pass
+    state.set("metrics", "other-host:1", other_worker.state())
+
+    this_worker = MetricsRegistry(configs)
+    with this_worker.track("openai", "gpt-4", input_tokens=1000):
+        pass
+    monkeypatch.setattr(main, "WORKERS", 2)
+    monkeypatch.setattr(main, "shared_state", state)
+    monkeypatch.setattr(main, "provider_metrics", this_worker)
+
+    merged = main.cluster_metrics().snapshot()["openai/gpt-4"]
+
+    assert merged["requests"] == 2
+    assert merged["latency"]["count"] == 2
+    assert merged["cost"] == 0.06
@@ -0,0 +1,168 @@
+import asyncio
+
+import httpx
+import pytest
+
+import backend.main as main
+from backend.metrics import MetricsRegistry
+from backend.resilience import CircuitBreakerRegistry
+from backend.single_flight import SingleFlight
+from benchmarks.mock_providers import MockProfile, start_mock_provider
+
+CONCURRENT_CALLS = 10
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    flights = SingleFlight()
+    upstream = []
+
+    async def call():
+        upstream.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*[flights.do("key", call) for _ in range(CONCURRENT_CALLS)])
+
+    assert asyncio.run(run()) == ["answer"] * CONCURRENT_CALLS
+    assert len(upstream) == 1
+    assert flights.stats() == {"calls": 1, "saved": CONCURRENT_CALLS - 1, "reruns": 0, "in_flight": 0}
+
+def test_failures_are_shared_and_not_remembered():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failed")
+
+    async def succeed():
+        return "recovered"
+
+    async def run():
+        results = await asyncio.gather(flights.do("key", fail), flights.do("key", fail), return_exceptions=True)
+        return results, await flights.do("key", succeed)
+
+    failures, retried = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in failures)
+    assert retried == "recovered"
+
+def test_failures_are_shared_only_with_callers_of_the_same_owner():
+    flights = SingleFlight()
+    calls = []
+
+    def call(owner: str):
+        async def run():
+            calls.append(owner)
+            await asyncio.sleep(0.01)
+            if owner == "revoked":
+                raise RuntimeError("401")
+            return f"answer for {owner}"
+        return run
+
+    async def run():
+        return await asyncio.gather(
+            flights.do("key", call("revoked"), owner="revoked"),
+            flights.do("key", call("revoked"), owner="revoked"),
+            flights.do("key", call("valid"), owner="valid"),
+            return_exceptions=True
+        )
+
+    first, second, other = asyncio.run(run())
+    assert isinstance(first, RuntimeError) and isinstance(second, RuntimeError)
+    assert other == "answer for valid"
+    assert calls == ["revoked", "valid"]
+    assert flights.stats() == {"calls": 2, "saved": 1, "reruns": 1, "in_flight": 0}
+
+def test_the_call_is_cancelled_only_when_every_caller_has_gone():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def call():
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "answer"
+
+    async def run():
+        impatient = asyncio.create_task(flights.do("key", call))
+        patient = asyncio.create_task(flights.do("key", call))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        answer = await patient
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+
+        alone = asyncio.create_task(flights.do("other", call))
+        await asyncio.sleep(0.01)
+        alone.cancel()
+        await asyncio.gather(alone, return_exceptions=True)
+        await asyncio.sleep(0)
+        return answer
+
+    assert asyncio.run(run()) == "answer"
+    assert len(cancelled) == 1
+    assert flights.stats()["in_flight"] == 0
+
+def test_identical_chats_reach_the_provider_once(monkeypatch, temp_history):
+    mock = start_mock_provider(MockProfile(latency=0.3))
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", mock.base_url)
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    monkeypatch.setattr(main, "provider_metrics", MetricsRegistry(main.MODEL_CONFIGS))
+    monkeypatch.setattr(main, "provider_calls", SingleFlight())
+
+    def payload(user: int) -> dict:
+        return {
+            "message": "Summarise the release notes",
+            "user_id": f"template-user-{user}",
+            "use_cache": False,
+            "service_keys": {"user_id": f"template-user-{user}", "grok": f"key-{user}", "models": {"grok": "grok-1"}}
+        }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            chats = await asyncio.gather(*[client.post("/api/chat", json=payload(n)) for n in range(5)])
+            metrics = (await client.get("/api/metrics")).json()
+            return [chat.json() for chat in chats], metrics
+
+    try:
+        chats, metrics = asyncio.run(run())
+    finally:
+        mock.shutdown()
+
+    assert all(chat["grok"]["status"] == "ok" for chat in chats)
+    assert len({chat["grok"]["response"] for chat in chats}) == 1
+    assert mock.stats()["requests"] == 1
+    assert metrics["single_flight"]["saved"] == 4
+    assert metrics["providers"]["grok/grok-1"]["coalesced"] == 4
+    assert metrics["providers"]["grok/grok-1"]["requests"] == 1
+
+def test_a_revoked_key_does_not_fail_other_users_chats(monkeypatch, temp_history, stub_server):
+    server = stub_server(latency=0.2, rejected_key="revoked-key")
+    monkeypatch.setitem(main.PROVIDER_ENDPOINTS, "grok", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    monkeypatch.setattr(main, "provider_calls", SingleFlight())
+    monkeypatch.setattr(main, "circuit_breakers", CircuitBreakerRegistry())
+
+    def payload(user: str, key: str) -> dict:
+        return {
+            "message": "Summarise the release notes",
+            "user_id": user,
+            "use_cache": False,
+            "service_keys": {"user_id": user, "grok": key, "models": {"grok": "grok-1"}}
+        }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            revoked = asyncio.create_task(client.post("/api/chat", json=payload("revoked-user", "revoked-key")))
+            await asyncio.sleep(0.05)
+            valid = await client.post("/api/chat", json=payload("valid-user", "valid-key"))
+            return (await revoked).json(), valid.json()
+
+    revoked, valid = asyncio.run(run())
+
+    assert "401 Unauthorized" in revoked["grok"]["response"]
+    assert valid["grok"]["response"] == "stub reply from grok-1"
+    assert main.provider_calls.stats()["reruns"] == 1
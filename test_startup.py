@@ -0,0 +1,54 @@
+import asyncio
+import json
+import subprocess
+import sys
+
+import backend.main as main
+from backend.clients import ClientRegistry
+from benchmarks.harness import ROOT
+from benchmarks.importtime import _env, package_times, parse_importtime
+
+PROVIDER_SDKS = ["openai", "google.generativeai", "google_auth_oauthlib", "requests"]
+
+def test_importing_the_app_loads_no_provider_sdk(tmp_path):
+    script = f"import sys, backend.main, json; print(json.dumps([m for m in {PROVIDER_SDKS!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=_env(str(tmp_path)), capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+
+def test_prewarming_builds_default_clients_for_configured_providers(monkeypatch):
+    monkeypatch.setattr(main, "provider_clients", ClientRegistry())
+    monkeypatch.setitem(main.DEFAULT_KEYS, "gemini", None)
+    monkeypatch.setitem(main.DEFAULT_KEYS, "openai", "default-key")
+    monkeypatch.setattr(main, "PREWARM_PROVIDERS", "configured")
+
+    async def run():
+        await main.prewarm_providers(main.prewarm_targets())
+        return main.provider_clients.get("openai", "default-key", "gpt-3.5-turbo", main._make_openai_client)
+
+    client = asyncio.run(run())
+
+    assert main.prewarm_targets() == ["openai"]
+    assert "openai" in sys.modules
+    assert client.api_key == "default-key"
+    # The lookup above was served by the pre-warmed client
+    assert (main.provider_clients.hits, main.provider_clients.misses) == (1, 1)
+
+def test_prewarm_list_ignores_unknown_providers(monkeypatch):
+    monkeypatch.setattr(main, "PREWARM_PROVIDERS", "grok, mistral,")
+    assert main.prewarm_targets() == ["grok"]
+    monkeypatch.setattr(main, "PREWARM_PROVIDERS", "")
+    assert main.prewarm_targets() == []
+
+def test_importtime_output_is_summed_per_package():
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |     openai._types",
+        "import time:       300 |        420 |   openai",
+        "import time:        50 |        470 | backend.main"
+    ])
+
+    imports = parse_importtime(output)
+
+    assert imports == [("openai._types", 120, 120), ("openai", 300, 420), ("backend.main", 50, 470)]
+    assert package_times(imports) == {"openai": 420, "backend": 50}
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import httpx
+
+import backend.main as main
+from backend.fanout import STATUS_OK, STATUS_TIMED_OUT, fan_out_stream
+
+CHUNKS = ["Hello", ", ", "world"]
+
+class StubStreamingHandler(BaseHTTPRequestHandler):
+    """Streams a fixed reply in Gemini or OpenAI-compatible SSE format"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for text in CHUNKS:
+            if ":streamGenerateContent" in self.path:
+                data = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+            else:
+                data = {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]
+                }
+            self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(0.05)
+        if ":streamGenerateContent" not in self.path:
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+def parse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        data = [line[6:] for line in block.split("\n") if line.startswith("data: ")]
+        events.append(json.loads(data[0]))
+    return events
+
+def test_stream_endpoint_forwards_chunks_and_persists_results(monkeypatch, temp_history, stub_server):
+    server = stub_server(StubStreamingHandler)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    for provider in ["gemini", "openai", "grok"]:
+        monkeypatch.setitem(main.PROVIDER_ENDPOINTS, provider, base_url)
+    store = temp_history
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/chat/stream", json={
+                "message": "Hi",
+                "user_id": "streamer",
+                "service_keys": {
+                    "user_id": "streamer",
+                    "gemini": "g-key",
+                    "openai": "o-key",
+                    "grok": "x-key",
+                    "models": {"gemini": "gemini-pro", "openai": "gpt-3.5-turbo", "grok": "grok-1"}
+                }
+            })
+
+    response = asyncio.run(run())
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    for provider in ["gemini", "openai", "grok"]:
+        chunks = [e["text"] for e in events if e.get("provider") == provider and e["event"] == "chunk"]
+        done = [e for e in events if e.get("provider") == provider and e["event"] == "done"]
+        assert chunks == CHUNKS
+        assert done[0]["status"] == STATUS_OK
+        assert done[0]["response"] == "Hello, world"
+    assert events[-1] == {}
+
+    history = store.load("streamer")
+    assert history[0] == {"type": "user", "message": "Hi"}
+    assert sorted(entry["source"] for entry in history[1:]) == ["gemini", "grok", "openai"]
+    assert all(entry["type"] == "response" for entry in history[1:])
+
+def test_stream_deadline_keeps_partial_text():
+    async def slow_stream():
+        yield "partial "
+        yield "answer"
+        await asyncio.sleep(5)
+        yield "never sent"
+
+    async def collect():
+        return [event async for event in fan_out_stream({"grok": slow_stream}, timeouts={"grok": 0.2})]
+
+    events = asyncio.run(collect())
+
+    assert [e["text"] for e in events if e["event"] == "chunk"] == ["partial ", "answer"]
+    assert events[-1]["status"] == STATUS_TIMED_OUT
+    assert events[-1]["response"] == "partial answer"